@@ -6,7 +6,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[('label_generator.py', '.'), ('auto_updater.py', '.'), ('version.txt', '.')],
-    hiddenimports=['flask', 'flask_cors', 'qrcode', 'PIL', 'bleak'],
+    hiddenimports=['flask', 'flask_cors', 'qrcode', 'PIL', 'bleak', 'serial', 'numpy'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
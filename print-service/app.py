@@ -1,9 +1,14 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from label_generator import generate_label
-import os
-import sys
-import subprocess
+from deadline import Deadline, DeadlineExceeded
+from niimbot_protocol import PrinterError
+from print_engine import get_engine
+from print_progress import get_progress_hub
+from printer_pool import PrinterPool
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
 
 # Auto-update check
 try:
@@ -16,190 +21,248 @@ except ImportError:
 app = Flask(__name__)
 CORS(app) # Allow cross-origin requests from Next.js (localhost:3000)
 
-def print_with_niimblue(image_path):
-    """Print using niimblue-node CLI (USB -> BLE fallback)"""
-    
-    # Get the niimblue command
-    npm_path = os.path.expanduser(r'~\AppData\Roaming\npm\niimblue-cli.cmd')
-    if os.path.exists(npm_path):
-        niimblue_cmd = npm_path
-    else:
-        niimblue_cmd = 'niimblue-cli'
-        
-    print(f"🖨️  Using command: {niimblue_cmd}")
+# Prints in-process over a persistent connection; niimblue-cli is only a fallback
+engine = get_engine()
+# Registered printers get their own queues; without any, the engine picks one
+pool = PrinterPool(engine)
+# Live job progress for /jobs/<job_id>/events
+progress = get_progress_hub()
 
-    # Helper for cleaner error messages
-    def run_cmd(cmd_list, timeout_sec):
-        try:
-            return subprocess.run(cmd_list, capture_output=True, text=True, timeout=timeout_sec)
-        except FileNotFoundError:
-            return None # Command not found
-        except subprocess.TimeoutExpired:
-            raise
-
-    def detect_com_port():
-        """Auto-detect the Niimbot/Serial COM port using PowerShell"""
-        try:
-            # Look for devices with generic serial names
-            cmd = [
-                'powershell', '-Command',
-                'Get-WmiObject Win32_SerialPort | Select-Object -ExpandProperty DeviceID'
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            ports = result.stdout.strip().splitlines()
-            
-            # Prioritize ports that aren't COM1/COM2 (usually system)
-            # Typically USB-Serial is COM3, COM4, etc.
-            candidates = [p.strip() for p in ports if p.strip().startswith('COM') and p.strip() not in ['COM1', 'COM2']]
-            
-            if candidates:
-                print(f"🔎 Detected Candidate Ports: {candidates}")
-                return candidates[0] # Return first candidate (e.g., COM3)
-            
-            # Fallback check for common ports if WMI returns nothing (sometimes requires admin)
-            return 'COM3' 
-        except Exception as e:
-            print(f"⚠️  Port detection failed: {e}")
-            return 'COM3'
+@app.route('/health', methods=['GET'])
+def health():
+    # Answered from the background status cache: never touches the printer
+    return jsonify({
+        "status": "ok",
+        "service": "Mushroom Print Service",
+        "printer_ready": engine.status.ready,
+        "printers": engine.status.snapshot(),
+        "time": time.time()
+    })
 
-    # 1. Try USB / Serial (Auto-Detected)
-    detected_port = detect_com_port()
-    print(f"🔌 Attempting USB/Serial connection ({detected_port} detected)...")
-    
-    cmd_serial_auto = [
-        niimblue_cmd, 'print',
-        '-t', 'serial',
-        '-a', detected_port,
-        '-p', 'B1', 
-        image_path
-    ]
-    
-    # Try detected port first
-    try:
-        result = run_cmd(cmd_serial_auto, 40)
-        if result and result.returncode == 0:
-            print(f"✅ Serial {detected_port} Print successful: {result.stdout}")
-            return True, result.stdout
-        elif result:
-            print(f"⚠️  {detected_port} failed. trying others...")
-    except Exception:
-        pass
-
-    # Fallback to hardcoded COM4/COM3 if auto failed and detected was different
-    fallback_ports = ['COM4', 'COM3']
-    if detected_port in fallback_ports: fallback_ports.remove(detected_port)
-    
-    for port in fallback_ports:
-        print(f"🔌 Retrying on {port}...")
-        cmd_fallback = [
-             niimblue_cmd, 'print',
-            '-t', 'serial',
-            '-a', port,
-            '-p', 'B1', 
-            image_path
-        ]
-        try:
-            result = run_cmd(cmd_fallback, 40)
-            if result and result.returncode == 0:
-                print(f"✅ Serial {port} Print successful!")
-                return True, result.stdout
-        except:
-            continue
-    
-    # Backup: Try generic USB scanning
-    cmd_usb_auto = [
-        niimblue_cmd, 'print',
-        '-t', 'usb',
-        '-p', 'B1', 
-        image_path
-    ]
+@app.route('/printers', methods=['GET'])
+def printers_status():
+    return jsonify(pool.status())
 
+@app.route('/printers', methods=['POST'])
+def printers_add():
+    data = request.json or {}
+    address = data.get('address')
+    if not address:
+        return jsonify({"error": "Missing address"}), 400
+    transport = data.get('transport', 'ble')
+    if transport not in ('ble', 'serial'):
+        return jsonify({"error": f"Unknown transport: {transport}"}), 400
+    pool.add(transport, address, name=data.get('name'), label_size=data.get('label_size'))
+    return jsonify(pool.status())
 
-    # Execute USB Auto
-    try:
-        result = run_cmd(cmd_usb_auto, 40)
-        if result and result.returncode == 0:
-            print(f"✅ USB Auto Print successful: {result.stdout}")
-            return True, result.stdout
-    except Exception as e:
-        print(f"⚠️  USB Auto Error: {str(e)}")
-        
-    # 2. Try BLE (Fallback)
-    print("📡 Attempting Bluetooth connection...")
-    cmd_ble = [
-        niimblue_cmd, 'print',
-        '-t', 'ble',
-        '-a', '14:09:06:1c:f6:7d', 
-        '-p', 'B1',
-        image_path
-    ]
-    
-    try:
-        result = run_cmd(cmd_ble, 60)
-        if result is None:
-             return False, "Tool 'niimblue-cli' missing."
+@app.route('/printers/<path:address>', methods=['DELETE'])
+def printers_remove(address):
+    pool.remove(address)
+    return jsonify(pool.status())
 
-        if result.returncode == 0:
-            print(f"✅ BLE Print successful: {result.stdout}")
-            return True, result.stdout
-        else:
-             err_msg = result.stderr.strip()
-             print(f"❌ BLE failed: {err_msg}")
-             return False, f"USB & BLE failed. BLE Error: {err_msg}"
-             
-    except subprocess.TimeoutExpired:
-        error_msg = "Print timeout - printer not found or busy"
-        print(f"❌ {error_msg}")
-        return False, error_msg
-    except Exception as e:
-        error_msg = f"Print error: {str(e)}"
-        print(f"❌ {error_msg}")
-        return False, error_msg
+MAX_COPIES = 500
+# Whole-job budget per label (render + queue + connect + print), plus per extra copy;
+# a request may ask for its own with "timeout_s"
+LABEL_DEADLINE_S = 60.0
+COPY_DEADLINE_S = 5.0
 
-@app.route('/health', methods=['GET'])
-def health():
-    return jsonify({"status": "ok", "service": "Mushroom Print Service"})
+def _copies(data):
+    """`copies` (or `quantity`) from the request; raises ValueError if out of range."""
+    copies = int(data.get('copies', data.get('quantity', 1)))
+    if not 1 <= copies <= MAX_COPIES:
+        raise ValueError(f"copies must be between 1 and {MAX_COPIES}")
+    return copies
+
+def _deadline(data, copies):
+    """One deadline for the whole job: `timeout_s` from the request or the default budget."""
+    budget = sum(LABEL_DEADLINE_S + COPY_DEADLINE_S * (n - 1) for n in copies)
+    if data.get('timeout_s') is not None:
+        budget = float(data['timeout_s'])
+        if budget <= 0:
+            raise ValueError("timeout_s must be positive")
+    return Deadline(budget)
+
+def _timeout_response(e, **fields):
+    # The job ran out of its deadline: say in which stage, so the app can tell "printer off" from "queue full"
+    return jsonify({"error": str(e), "error_code": "timeout", "stage": e.stage, **fields}), 504
+
+def _generate(data):
+    batch_id = data.get('batch_id')
+    batch_type = data.get('batch_type', 'BATCH')
+    strain = data.get('strain', 'Unknown')
+    label_size = data.get('label_size', '40x30') # Default to 40x30
+    lc_batch = data.get('lc_batch', '')
+    date_str = data.get('date')
+    print(f"🏷️  Generating label for batch: {batch_id} (Size: {label_size}, LC: {lc_batch}, Date: {date_str})")
+    image_path = generate_label(batch_id, batch_type, strain, date_str=date_str, label_size=label_size, lc_batch=lc_batch)
+    print(f"✅ Label generated: {image_path}")
+    return image_path, label_size
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    tracker = progress.get(job_id)
+    if tracker is None:
+        return jsonify({"error": f"Unknown job: {job_id}"}), 404
+    return jsonify(tracker.snapshot())
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Server-Sent Events: `progress` while the job runs, then `done` or `error`."""
+    # A client may open the stream just before it submits the job; unknown ids are not created
+    if progress.wait_job(job_id) is None:
+        return jsonify({"error": f"Unknown job: {job_id}"}), 404
+    return Response(stream_with_context(progress.stream(job_id)), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.route('/print-label', methods=['POST'])
 def print_label_endpoint():
     data = request.json
     batch_id = data.get('batch_id')
     batch_type = data.get('batch_type', 'BATCH')
-    strain = data.get('strain', 'Unknown')
     
     if not batch_id:
         return jsonify({"error": "Missing batch_id"}), 400
+    try:
+        copies = _copies(data)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid copies: {e}"}), 400
+    try:
+        deadline = _deadline(data, [copies])
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid timeout_s: {e}"}), 400
+    
+    # The app may pick the job id (and open /jobs/<job_id>/events before posting)
+    tracker = progress.job(data.get('job_id'))
+    job_id = tracker.job_id
         
     try:
-        # 1. Generate Image
-        label_size = data.get('label_size', '40x30') # Default to 40x30
-        lc_batch = data.get('lc_batch', '')
-        date_str = data.get('date')
-        print(f"🏷️  Generating label for batch: {batch_id} (Size: {label_size}, LC: {lc_batch}, Date: {date_str})")
-        image_path = generate_label(batch_id, batch_type, strain, date_str=date_str, label_size=label_size, lc_batch=lc_batch)
-        print(f"✅ Label generated: {image_path}")
+        # 1. Generate Image (once, whatever the number of copies)
+        tracker.stage("render")
+        deadline.enter("render")
+        image_path, label_size = _generate(data)
         
-        # 2. Print using niimblue-node
-        success, output = print_with_niimblue(image_path)
+        # "wait": false answers right away; the outcome comes on /jobs/<job_id>/events
+        if data.get('wait', True) is False:
+            pool.submit(image_path, label_size, copies, tracker, deadline)
+            return jsonify({
+                "status": "queued",
+                "job_id": job_id,
+                "events": f"/jobs/{job_id}/events",
+                "file": image_path,
+                "batch_id": batch_id,
+                "copies": copies
+            }), 202
+        
+        # 2. Print on the least-loaded printer with this label size, all copies in one job
+        try:
+            success, output = pool.print_file(image_path, label_size, copies, tracker, deadline)
+        except DeadlineExceeded as e:
+            return _timeout_response(e, file=image_path, batch_id=batch_id, job_id=job_id)
+        except PrinterError as e:
+            # The printer rejected the job (cover open, no paper...): tell the app what to fix
+            return jsonify({
+                "error": f"Printer error: {e.message}",
+                "error_code": e.kind,
+                "printer_error": e.code,
+                "file": image_path,
+                "batch_id": batch_id,
+                "job_id": job_id
+            }), 409
         
         if success:
             return jsonify({
                 "status": "printed", 
                 "file": image_path,
                 "batch_id": batch_id,
+                "job_id": job_id,
+                "copies": copies,
                 "message": f"Label printed successfully for {batch_type} {batch_id}",
-                "print_output": output
+                "print_output": output,
+                "backend": engine.last_backend if not pool.printers else "pool"
             })
         else:
             return jsonify({
                 "error": f"Print failed: {output}",
                 "file": image_path,
-                "batch_id": batch_id
+                "batch_id": batch_id,
+                "job_id": job_id
             }), 500
         
+    except DeadlineExceeded as e:
+        # Ran out while rendering
+        tracker.finish(False, str(e), "timeout")
+        return _timeout_response(e, batch_id=batch_id, job_id=job_id)
     except Exception as e:
         error_msg = f"Error processing batch {batch_id}: {str(e)}"
         print(f"❌ {error_msg}")
+        tracker.finish(False, error_msg)
+        return jsonify({"error": error_msg, "job_id": job_id}), 500
+
+@app.route('/print-labels', methods=['POST'])
+def print_labels_endpoint():
+    """Bulk run: {"labels": [{batch_id, ...}, ...]}, striped across the pool."""
+    labels = (request.json or {}).get('labels') or []
+    if not labels or any(not l.get('batch_id') for l in labels):
+        return jsonify({"error": "Missing labels or batch_id"}), 400
+    try:
+        copies = [_copies(l) for l in labels]
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid copies: {e}"}), 400
+    try:
+        # One budget for the whole run (default: the per-label budgets added up)
+        deadline = _deadline(request.json, copies)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid timeout_s: {e}"}), 400
+    
+    trackers = [progress.job(l.get('job_id')) for l in labels]
+    
+    try:
+        for tracker in trackers:
+            tracker.stage("render")
+        deadline.enter("render")
+        images = [_generate(l) for l in labels]
+        # One run per label size, so each goes only to printers with that roll
+        futures = [None] * len(images)
+        for size in dict.fromkeys(s for _, s in images):
+            indexes = [i for i, (_, s) in enumerate(images) if s == size]
+            run = pool.submit_many([images[i][0] for i in indexes], size, [copies[i] for i in indexes],
+                                   [trackers[i] for i in indexes], deadline)
+            for i, fut in zip(indexes, run):
+                futures[i] = fut
+        
+        results = []
+        for label, (path, _), n, fut, tracker in zip(labels, images, copies, futures, trackers):
+            error_code = stage = None
+            try:
+                success, output = fut.result(deadline.cap(threading.TIMEOUT_MAX))
+            except DeadlineExceeded as e:
+                success, output, error_code, stage = False, str(e), "timeout", e.stage
+            except FutureTimeoutError:
+                e = deadline.exceeded()
+                success, output, error_code, stage = False, str(e), "timeout", e.stage
+            except PrinterError as e:
+                success, output, error_code = False, f"Printer error: {e.message}", e.kind
+            results.append({"batch_id": label['batch_id'], "job_id": tracker.job_id, "file": path, "copies": n,
+                            "printed": success, "message": output, "error_code": error_code, "stage": stage})
+        
+        printed = sum(r['printed'] for r in results)
+        return jsonify({
+            "status": "printed" if printed == len(results) else "partial",
+            "printed": printed,
+            "failed": len(results) - printed,
+            "results": results,
+            "printers": pool.status()["printers"]
+        }), 200 if printed else 500
+    
+    except DeadlineExceeded as e:
+        for tracker in trackers:
+            tracker.finish(False, str(e), "timeout")
+        return _timeout_response(e)
+    except Exception as e:
+        error_msg = f"Error processing bulk run: {str(e)}"
+        print(f"❌ {error_msg}")
+        for tracker in trackers:
+            tracker.finish(False, error_msg)
         return jsonify({"error": error_msg}), 500
 
 if __name__ == '__main__':
@@ -214,6 +277,9 @@ if __name__ == '__main__':
         except Exception as e:
             print(f"⚠️  Update check failed: {e}")
     
-    print(f"🚀 Starting server on port 5000...")
+    # Connect to the printer now so the first label doesn't pay for it
+    engine.start(prewarm=True)
+    
+    print("🚀 Starting server on port 5000...")
     app.run(host='0.0.0.0', port=5000)
 
@@ -0,0 +1,139 @@
+"""
+Benchmark GATT write coalescing (B1Session.write_many) on a modelled BLE link.
+
+The fake link carries one ATT PDU of at most MTU-3 bytes per slot, with
+`PDUS_PER_EVENT` slots per connection interval and a small controller buffer
+(writes block once it is full, like a real stack). The fake printer answers
+PrintStatus once everything sent before the query has crossed the link, so the
+real RowTransmitter credit window runs unchanged.
+
+Only link time is measured (rows + status round-trips per label, no handshake
+and no print-head time), reported as labels per minute with coalescing off/on.
+
+Usage: python bench_coalescing.py [conn_interval_ms]
+"""
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from ble_session import B1Session, SessionConfig
+from bench_halftone import make_test_image
+from flow_control import FlowConfig, RowTransmitter, STATUS_QUERY
+from halftone import image_to_rows
+from label_generator import LABEL_SIZES
+from niimbot_b1_ble_fixed import pack_bitmap_row, rle_rows
+from niimbot_protocol import FrameDecoder, make_packet
+from printer_registry import PrinterRegistry
+
+PDUS_PER_EVENT = 4
+CONTROLLER_BUFFER_PDUS = 8
+HOST_WRITE_OVERHEAD_S = 0.0003   # per write_gatt_char call (OS/driver)
+STATUS_REPLY = make_packet(0xB3, bytes([0, 1, 100, 100]))
+
+
+class _Char:
+    def __init__(self, max_write: int):
+        self.max_write_without_response_size = max_write
+
+
+class _Services:
+    def __init__(self, max_write: int):
+        self._char = _Char(max_write)
+
+    def get_characteristic(self, _uuid):
+        return self._char
+
+
+class FakeLinkClient:
+    """Just enough of BleakClient for B1Session, with a modelled MTU/interval."""
+
+    def __init__(self, mtu: int, interval_s: float):
+        self.mtu_size = mtu
+        self.services = _Services(mtu - 3)
+        self.is_connected = False
+        self._slot_s = interval_s / PDUS_PER_EVENT
+        self._free_at = 0.0
+        self._decoder = FrameDecoder()
+        self._notify = None
+
+    async def connect(self):
+        self.is_connected = True
+
+    async def disconnect(self):
+        self.is_connected = False
+
+    async def start_notify(self, _uuid, handler):
+        self._notify = handler
+
+    async def stop_notify(self, _uuid):
+        pass
+
+    async def write_gatt_char(self, _uuid, data, response=False):
+        if len(data) > self.mtu_size - 3:
+            raise ValueError(f"write of {len(data)} bytes exceeds MTU {self.mtu_size}")
+        await asyncio.sleep(HOST_WRITE_OVERHEAD_S)
+        now = time.monotonic()
+        self._free_at = max(self._free_at, now) + self._slot_s
+        backlog = self._free_at - now - CONTROLLER_BUFFER_PDUS * self._slot_s
+        if backlog > 0:
+            await asyncio.sleep(backlog)
+
+        for frame in self._decoder.feed(data):
+            if frame.command == STATUS_QUERY[2]:
+                # Reply once this PDU is on air, plus one event for the way back
+                delay = self._free_at - time.monotonic() + self._slot_s * PDUS_PER_EVENT
+                asyncio.get_running_loop().call_later(max(0.0, delay), self._notify, None, STATUS_REPLY)
+
+
+class FakeSession(B1Session):
+    def __init__(self, mtu: int, interval_s: float, coalesce: bool, registry: PrinterRegistry):
+        super().__init__(SessionConfig(address="FA:KE:00:00:00:01", coalesce_writes=coalesce, verbose=False),
+                         registry=registry)
+        self._mtu = mtu
+        self._interval_s = interval_s
+
+    def _new_client(self, target, timeout):
+        return FakeLinkClient(self._mtu, self._interval_s)
+
+
+def label_packets(w: int, h: int):
+    rows, _, _ = image_to_rows(make_test_image(w, h), "bayer4")
+    return [pack_bitmap_row(i, row, repeat=n) for i, row, n in rle_rows(rows)]
+
+
+async def time_label(packets, mtu: int, interval_s: float, coalesce: bool, registry: PrinterRegistry):
+    session = FakeSession(mtu, interval_s, coalesce, registry)
+    try:
+        async with session.job():
+            t0 = time.monotonic()
+            tx = RowTransmitter(session.write, session.rx, FlowConfig(),
+                                write_many=session.write_many)
+            await tx.send(packets)
+            return time.monotonic() - t0, session.link
+    finally:
+        await session.close()
+
+
+async def main():
+    interval_s = (float(sys.argv[1]) if len(sys.argv) > 1 else 15.0) / 1000
+    registry = PrinterRegistry(Path(tempfile.mkdtemp()) / "bench_printers.json")
+
+    print(f"GATT write coalescing benchmark (interval {interval_s * 1000:.1f} ms, "
+          f"{PDUS_PER_EVENT} PDUs/event, link time only)")
+    print("=" * 86)
+    print(f"{'size':<8}{'rows':>6}{'MTU':>6}{'labels/min off':>17}{'labels/min on':>16}"
+          f"{'frames/write':>15}{'speedup':>10}")
+
+    for size, cfg in LABEL_SIZES.items():
+        packets = label_packets(cfg["w"], cfg["h"])
+        for mtu in (65, 185, 247, 512):
+            off, _ = await time_label(packets, mtu, interval_s, False, registry)
+            on, link = await time_label(packets, mtu, interval_s, True, registry)
+            print(f"{size:<8}{len(packets):>6}{mtu:>6}{60 / off:>17.1f}{60 / on:>16.1f}"
+                  f"{link.frames_per_write:>15.1f}{off / on:>9.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,64 @@
+"""
+Benchmark halftone modes for every label size in label_generator.LABEL_SIZES.
+
+Each label is a synthetic "photo/logo" (gradient + shapes) so every mode has real
+gray levels to work on. Times are the median of several runs, including packing
+into 48-byte printer rows. PIL's convert('1') (used by label_generator today) is
+shown as the baseline.
+
+Usage: python bench_halftone.py [runs]
+"""
+import statistics
+import sys
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from halftone import MODES, TARGET_WIDTH_DOTS, image_to_rows, to_canvas
+from label_generator import LABEL_SIZES
+
+
+def make_test_image(w: int, h: int) -> Image.Image:
+    gradient = np.tile(np.linspace(0, 255, w, dtype=np.float32), (h, 1))
+    shade = np.linspace(0.6, 1.0, h, dtype=np.float32)[:, None]
+    img = Image.fromarray((gradient * shade).astype(np.uint8), "L")
+    draw = ImageDraw.Draw(img)
+    draw.ellipse([w // 8, h // 8, w // 2, h // 2], fill=40)
+    draw.rectangle([w // 2, h // 2, w - 10, h - 10], fill=170)
+    draw.text((10, 10), "LOGO", fill=0)
+    return img
+
+
+def time_it(fn, runs: int) -> float:
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples) * 1000
+
+
+def pil_baseline(img: Image.Image):
+    canvas = Image.fromarray(to_canvas(img, width=TARGET_WIDTH_DOTS))
+    return canvas.convert("1").tobytes()
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    columns = ["PIL convert('1')"] + list(MODES)
+
+    print(f"Halftone benchmark ({runs} runs, median ms per label, {TARGET_WIDTH_DOTS}-dot canvas)")
+    print("=" * (10 + 18 * len(columns)))
+    print(f"{'size':<10}" + "".join(f"{c:>18}" for c in columns))
+
+    for size, cfg in LABEL_SIZES.items():
+        img = make_test_image(cfg["w"], cfg["h"])
+        results = [time_it(lambda: pil_baseline(img), runs)]
+        for mode in MODES:
+            results.append(time_it(lambda: image_to_rows(img, mode), runs))
+        print(f"{size:<10}" + "".join(f"{r:>18.2f}" for r in results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark niimblue-node spawn-per-label vs. one long-lived worker.
+
+Uses a stub CLI (written to a temp dir) with modelled costs instead of real
+Node/printer time:
+- spawn-per-label: interpreter start + connect + read PNG from disk + print,
+  then exit (what `niimblue-cli print ... image.png` does)
+- worker: start + connect once, then only print time per job, PNG bytes
+  streamed inline over stdin (niimblue_worker.py framing)
+
+The worker is also run with a stub that crashes every few jobs to show the
+restart path. Costs are printed with the results.
+
+Usage: python bench_niimblue_worker.py [labels]
+"""
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from niimblue_worker import NiimblueWorker, WorkerConfig
+
+NODE_START_S = 0.35
+CONNECT_S = 0.60
+PRINT_S = 0.25
+
+STUB = r'''
+import json, struct, sys, time
+NODE_START_S, CONNECT_S, PRINT_S = {costs}
+
+def read_exact(n):
+    data = b""
+    while len(data) < n:
+        chunk = sys.stdin.buffer.read(n - len(data))
+        if not chunk:
+            sys.exit(0)
+        data += chunk
+    return data
+
+def send(header):
+    head = json.dumps(header).encode()
+    sys.stdout.buffer.write(struct.pack(">I", len(head)) + head + struct.pack(">I", 0))
+    sys.stdout.buffer.flush()
+
+time.sleep(NODE_START_S + CONNECT_S)
+if sys.argv[1] == "print":
+    open(sys.argv[-1], "rb").read()
+    time.sleep(PRINT_S)
+    print("Printed")
+    sys.exit(0)
+
+crash_every = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+send({{"type": "ready"}})
+jobs = 0
+while True:
+    (n,) = struct.unpack(">I", read_exact(4))
+    header = json.loads(read_exact(n))
+    (n,) = struct.unpack(">I", read_exact(4))
+    png = read_exact(n)
+    jobs += 1
+    if crash_every and jobs % crash_every == 0:
+        sys.exit(3)
+    time.sleep(PRINT_S)
+    send({{"type": "result", "id": header["id"], "ok": True}})
+'''
+
+
+def main():
+    labels = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    image = Path(__file__).parent / "test_black.png"
+    stub = Path(tempfile.mkdtemp()) / "niimblue_stub.py"
+    stub.write_text(STUB.format(costs=(NODE_START_S, CONNECT_S, PRINT_S)))
+
+    print(f"niimblue worker benchmark ({labels} labels; stub costs: start {NODE_START_S}s, "
+          f"connect {CONNECT_S}s, print {PRINT_S}s)")
+    print("=" * 72)
+
+    t0 = time.perf_counter()
+    for _ in range(labels):
+        result = subprocess.run([sys.executable, str(stub), "print", "-t", "serial", "-a", "COM3", "-p", "B1",
+                                 str(image)], capture_output=True, text=True, timeout=40)
+        assert result.returncode == 0, result.stderr
+    spawn = time.perf_counter() - t0
+    print(f"{'spawn per label':<28}{labels / spawn * 60:>10.1f} labels/min")
+
+    for name, crash_every in (("worker", 0), ("worker (crash every 4)", 4)):
+        worker = NiimblueWorker(WorkerConfig(address="COM3"),
+                                command=[sys.executable, str(stub), "worker", str(crash_every)])
+        t0 = time.perf_counter()
+        ok = sum(worker.print_file(str(image))[0] for _ in range(labels))
+        elapsed = time.perf_counter() - t0
+        worker.stop()
+        print(f"{name:<28}{labels / elapsed * 60:>10.1f} labels/min   "
+              f"({ok}/{labels} printed, {worker.restarts} restarts)")
+
+
+if __name__ == "__main__":
+    main()
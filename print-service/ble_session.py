@@ -0,0 +1,525 @@
+"""
+Long-lived BLE session for the NIIMBOT B1.
+
+Scanning (5 s) and connecting (up to 30 s) used to happen for every label. A
+B1Session connects once and keeps the link between jobs:
+
+- connects straight to the last known address (printer_registry), falling back
+  to a filtered scan that stops at the first matching printer
+
+- prewarm(): start connecting in the background (service startup)
+- job(): exclusive access for one print; connects on demand
+- heartbeat (0xDC) keepalive while idle, so the printer doesn't drop the link
+- transparent reconnect when the link drops while the session is warm; during
+  a job a drop raises LinkDropped instead, so the job can recover its own state
+  (niimbot_b1_ble_fixed resends from the current page)
+- disconnect after `idle_disconnect_s` without jobs to save printer battery;
+  the next job reconnects
+- release() / reclaim(): hand the printer to another program (the niimblue
+  fallback) with no keepalive or reconnect until it is done
+
+Two GATT channels carry the NIIMBOT protocol on the B1: the usual bef8d6c9
+characteristic (write + notify on one characteristic) and an ISSC
+"transparent UART" service (49535343-..., separate write and notify
+characteristics, see try_serial.py). On the first connect to a printer that
+has both, each one gets a short probe (a burst of heartbeats: how many come
+back, how fast) and the session uses the faster, more reliable one for the
+whole link; the choice is kept in the registry (`ble_channel`) so later
+connects skip the probe. A stored channel that can't be opened any more is
+forgotten and probed again next time; SessionConfig.channel forces one.
+
+Writes: write_many() packs consecutive frames into as few GATT writes as the
+negotiated MTU allows (a 61-byte 0x85 row is far below the usual 244-byte
+limit); `session.link` keeps MTU, write size, throughput and an estimate of
+the connection interval.
+
+All RX goes through one ResponseDispatcher (`session.rx`); jobs subscribe to it
+instead of installing their own notification handlers.
+"""
+
+import asyncio
+import statistics
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Callable, Iterable, List, Optional
+
+from bleak import BleakClient
+
+from niimbot_protocol import CMD_HEARTBEAT, Heartbeat, ResponseDispatcher, make_packet
+from printer_registry import PrinterRegistry, get_registry, scan_for_printer
+
+SERVICE_UUID = "e7810a71-73ae-499d-8c15-faa9aef0c3f2"
+CHAR_UUID = "bef8d6c9-9c21-4c9e-b632-bd58c1009f9f"
+
+# Serial-over-BLE (ISSC transparent UART) service, also on the B1
+SERIAL_SERVICE_UUID = "49535343-fe7d-4ae5-8fa9-9fafd205e455"
+SERIAL_WRITE_UUID = "49535343-8841-43f4-a8d4-ecbe34729bb3"
+SERIAL_NOTIFY_UUID = "49535343-1e4d-4bd9-ba61-23c647249616"
+
+
+@dataclass(frozen=True)
+class GattChannel:
+    name: str
+    service: str
+    write_char: str
+    notify_char: str
+
+
+CHANNELS = (
+    GattChannel("niimbot", SERVICE_UUID, CHAR_UUID, CHAR_UUID),
+    GattChannel("serial", SERIAL_SERVICE_UUID, SERIAL_WRITE_UUID, SERIAL_NOTIFY_UUID),
+)
+
+
+class LinkDropped(ConnectionError):
+    """The BLE link went down in the middle of a job."""
+
+
+@dataclass
+class SessionConfig:
+    address: Optional[str] = None      # pin one printer; None = last known, else scan
+    name_hint: str = "B1"
+    scan_timeout_s: float = 5.0
+    direct_connect_timeout_s: float = 4.0   # cached address; scan if it fails
+    connect_timeout_s: float = 15.0
+    keepalive_interval_s: float = 10.0
+    idle_disconnect_s: float = 300.0   # 0 = never disconnect on idle
+    coalesce_writes: bool = True       # pack several frames per GATT write (write_many)
+    channel: Optional[str] = None      # force a GATT channel ("niimbot" / "serial"); None = stored or probed
+    probe_frames: int = 16             # heartbeats per channel in the connect probe (0 = no probe)
+    probe_timeout_s: float = 1.0
+    verbose: bool = True
+
+
+@dataclass
+class ChannelProbe:
+    channel: str
+    sent: int
+    replies: int = 0
+    elapsed_s: float = 0.0             # burst written -> last reply (or timeout)
+
+    @property
+    def delivery(self) -> float:
+        return self.replies / self.sent if self.sent else 0.0
+
+    def describe(self) -> str:
+        return f"{self.channel}: {self.replies}/{self.sent} replies in {self.elapsed_s * 1000:.0f} ms"
+
+
+@dataclass
+class LinkStats:
+    channel: str = CHANNELS[0].name    # GATT channel in use
+    mtu: int = 23
+    max_write: int = 20                # bytes per write-without-response
+    writes: int = 0
+    frames: int = 0
+    bytes: int = 0
+    busy_s: float = 0.0                # time spent inside write_gatt_char
+    conn_interval_ms: Optional[float] = None  # estimated from back-pressured writes
+
+    @property
+    def frames_per_write(self) -> float:
+        return self.frames / self.writes if self.writes else 0.0
+
+    @property
+    def throughput_bps(self) -> float:
+        return self.bytes / self.busy_s if self.busy_s else 0.0
+
+
+class B1Session:
+    def __init__(self, config: Optional[SessionConfig] = None, *, registry: Optional[PrinterRegistry] = None):
+        self.config = config or SessionConfig()
+        self.registry = registry or get_registry()
+        self.rx = ResponseDispatcher()
+        self.address: Optional[str] = self.config.address
+        self.name: Optional[str] = None
+        self.rssi: Optional[int] = None
+        self.link = LinkStats()
+        self.channel = CHANNELS[0]
+        self.probes: List[ChannelProbe] = []   # last connect probe, for debugging
+
+        self._client: Optional[BleakClient] = None
+        self._job_lock = asyncio.Lock()
+        self._connect_lock = asyncio.Lock()
+        self._keepalive_task: Optional[asyncio.Task] = None
+        self._last_activity = time.monotonic()
+        self._closing = False
+        self._in_job = False
+        self._released = False          # handed to another program, see release()
+        self._char = None
+        self._write_response = False   # write char without write-without-response
+        self._write_times = deque(maxlen=64)
+
+        # Counters for /health and debugging
+        self.connects = 0
+        self.drops = 0
+        self.keepalives_sent = 0
+        self.recoveries = 0                # jobs resumed after a drop
+        self.rows_resent = 0               # rows sent again by those recoveries
+        self.last_recovery_s: Optional[float] = None   # drop -> reconnected
+
+    def _log(self, msg: str):
+        if self.config.verbose:
+            print(msg)
+
+    # -----------------------------
+    # Connection
+    # -----------------------------
+
+    @property
+    def connected(self) -> bool:
+        return self._client is not None and self._client.is_connected
+
+    @property
+    def client(self) -> Optional[BleakClient]:
+        return self._client
+
+    def _new_client(self, target, timeout: float) -> BleakClient:
+        return BleakClient(target, disconnected_callback=self._on_disconnect, timeout=timeout)
+
+    async def _open_client(self) -> BleakClient:
+        """Direct connect to the pinned/last known address; filtered scan if that fails."""
+        cfg = self.config
+        address = self.address
+        if not address:
+            known = self.registry.last("ble", cfg.name_hint)
+            if known:
+                address, self.name = known.address, known.name or None
+
+        if address:
+            client = self._new_client(address, cfg.direct_connect_timeout_s)
+            try:
+                await client.connect()
+                self.address = address
+                return client
+            except Exception as e:
+                if cfg.address:
+                    raise  # pinned printer: never fall back to "any B1"
+                self._log(f"⚠️  Cached address {address} failed ({e}), scanning...")
+
+        self._log(f"🔍 Scanning for '{cfg.name_hint}'...")
+        found = await scan_for_printer(cfg.name_hint, cfg.scan_timeout_s)
+        if not found:
+            raise ConnectionError(f"Printer '{cfg.name_hint}' not found (scan)")
+        device, self.rssi = found
+        self.address, self.name = device.address, device.name
+
+        client = self._new_client(device, cfg.connect_timeout_s)
+        await client.connect()
+        return client
+
+    def _on_disconnect(self, client: BleakClient):
+        if client is not self._client:
+            return
+        self._client = None
+        if not self._closing:
+            self.drops += 1
+            self._log("⚠️  BLE link dropped")
+
+    async def ensure_connected(self) -> BleakClient:
+        """Connect if needed (shared by concurrent callers) and return the client."""
+        async with self._connect_lock:
+            if self.connected:
+                return self._client
+            if self._released:
+                raise ConnectionError("BLE link is released to another program")
+
+            t0 = time.monotonic()
+            client = await self._open_client()
+            stored = False
+            try:
+                await self._read_mtu(client)
+                channel, stored = await self._select_channel(client)
+                self.rx.decoder.reset()
+                await client.start_notify(channel.notify_char, self.rx)
+            except BaseException as e:
+                # Cancellation too (the losing side of a transport race, a job's hard cap):
+                # the session only takes the client once notifications are on
+                if stored and isinstance(e, Exception):
+                    self.registry.set_ble_channel(self.address, None)  # probe again next time
+                await self._close_client(client)
+                raise
+            self._use_channel(client, channel)
+            self._client = client
+            self.connects += 1
+            self.registry.remember(self.address, name=self.name, rssi=self.rssi, transport="ble")
+            self._log(f"✅ Connected: {self.name or ''} ({self.address}) in {time.monotonic() - t0:.2f}s"
+                      f" ({self.channel.name} channel, MTU {self.link.mtu}, {self.link.max_write} B/write)")
+
+            self._closing = False
+            if self._keepalive_task is None or self._keepalive_task.done():
+                self._keepalive_task = asyncio.create_task(self._keepalive_loop())
+            return client
+
+    # -----------------------------
+    # GATT channel
+    # -----------------------------
+
+    @staticmethod
+    def _characteristic(client: BleakClient, uuid: str):
+        try:
+            return client.services.get_characteristic(uuid)
+        except Exception:
+            return None
+
+    def _available(self, client: BleakClient) -> List[GattChannel]:
+        channels = [c for c in CHANNELS
+                    if self._characteristic(client, c.write_char) and self._characteristic(client, c.notify_char)]
+        return channels or [CHANNELS[0]]
+
+    async def _select_channel(self, client: BleakClient):
+        """(channel to use, whether it came from the registry)."""
+        cfg = self.config
+        available = {c.name: c for c in self._available(client)}
+        if cfg.channel in available:
+            return available[cfg.channel], False
+        known = self.registry.get(self.address) if self.address else None
+        if known and known.ble_channel in available:
+            return available[known.ble_channel], True
+        if len(available) == 1 or not cfg.probe_frames:
+            return next(iter(available.values())), False
+
+        self.probes = [await self._probe(client, c) for c in available.values()]
+        best = max(self.probes, key=lambda p: (p.delivery, -p.elapsed_s))
+        self._log(f"📶 Channel probe: {'; '.join(p.describe() for p in self.probes)}")
+        if not best.replies:
+            return CHANNELS[0], False  # printer didn't answer at all: nothing learned
+        self.registry.set_ble_channel(self.address, best.channel)
+        return available[best.channel], False
+
+    async def _probe(self, client: BleakClient, channel: GattChannel) -> ChannelProbe:
+        """A burst of heartbeats on one channel, packed like write_many() packs rows."""
+        cfg = self.config
+        probe = ChannelProbe(channel.name, cfg.probe_frames)
+        all_back = asyncio.Event()
+
+        def on_heartbeat(resp: Heartbeat):
+            probe.replies += 1
+            if probe.replies >= probe.sent:
+                all_back.set()
+
+        packet = make_packet(CMD_HEARTBEAT, b"\x01")
+        char = self._characteristic(client, channel.write_char)
+        per_write = max(1, self._max_write(char) // len(packet))
+        response = self._needs_response(char)
+        self.rx.decoder.reset()
+        self.rx.subscribe(on_heartbeat, Heartbeat)
+        try:
+            await client.start_notify(channel.notify_char, self.rx)
+            t0 = time.monotonic()
+            try:
+                for first in range(0, probe.sent, per_write):
+                    count = min(per_write, probe.sent - first)
+                    await client.write_gatt_char(channel.write_char, packet * count, response=response)
+                await asyncio.wait_for(all_back.wait(), cfg.probe_timeout_s)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                probe.elapsed_s = time.monotonic() - t0
+                await client.stop_notify(channel.notify_char)
+        except Exception as e:
+            self._log(f"⚠️  {channel.name} channel probe failed: {e}")
+        finally:
+            self.rx.unsubscribe(on_heartbeat, Heartbeat)
+        return probe
+
+    @staticmethod
+    def _needs_response(char) -> bool:
+        properties = getattr(char, "properties", None) or []
+        return "write" in properties and "write-without-response" not in properties
+
+    async def _read_mtu(self, client: BleakClient):
+        backend = getattr(client, "_backend", None)
+        if hasattr(backend, "_acquire_mtu"):
+            try:
+                await backend._acquire_mtu()  # BlueZ reports 23 until asked
+            except Exception:
+                pass
+        try:
+            self.link.mtu = client.mtu_size
+        except Exception:
+            self.link.mtu = 23
+
+    def _use_channel(self, client: BleakClient, channel: GattChannel):
+        """Write characteristic and max write-without-response size for `channel`."""
+        self.channel = channel
+        self._char = self._characteristic(client, channel.write_char)
+        self._write_response = self._needs_response(self._char)
+        self.link.channel = self.channel.name
+        self.link.max_write = self._max_write()
+
+    def _max_write(self, char=None) -> int:
+        # Re-read every time: some stacks report 20 until the MTU exchange finishes
+        char = char or self._char
+        size = getattr(char, "max_write_without_response_size", 0) if char else 0
+        return max(20, size or self.link.mtu - 3)
+
+    async def disconnect(self):
+        client, self._client = self._client, None
+        if client is not None:
+            await self._close_client(client, self.channel)
+
+    async def _close_client(self, client: BleakClient, channel: Optional[GattChannel] = None):
+        try:
+            if channel and client.is_connected:
+                await client.stop_notify(channel.notify_char)
+            await client.disconnect()
+        except Exception as e:
+            self._log(f"⚠️  Disconnect error: {e}")
+
+    async def close(self):
+        """Stop keepalives and disconnect for good."""
+        self._closing = True
+        task, self._keepalive_task = self._keepalive_task, None
+        if task and task is not asyncio.current_task():
+            task.cancel()
+        await self.disconnect()
+
+    async def release(self):
+        """
+        Hand the printer over to another program (niimblue-node): stop the
+        keepalive, disconnect and hold the link, so no job, status poll or
+        keepalive reconnects and takes it back, until reclaim().
+        """
+        await self._job_lock.acquire()
+        self._released = True
+        task, self._keepalive_task = self._keepalive_task, None
+        if task and task is not asyncio.current_task():
+            task.cancel()
+        await self.disconnect()
+
+    async def reclaim(self):
+        """End release(); the next job reconnects (and restarts the keepalive)."""
+        if self._released:
+            self._released = False
+            self._job_lock.release()
+
+    def prewarm(self) -> asyncio.Task:
+        """Start connecting in the background; failures are logged, not raised."""
+        async def _warm():
+            try:
+                await self.ensure_connected()
+            except Exception as e:
+                self._log(f"⚠️  Prewarm failed (will retry on first job): {e}")
+        return asyncio.create_task(_warm())
+
+    # -----------------------------
+    # I/O
+    # -----------------------------
+
+    async def write(self, packet: bytes, *, response: bool = False):
+        await self._write(packet, 1, response)
+
+    async def write_many(self, packets: Iterable[bytes], *, abort: Optional[Callable[[], bool]] = None):
+        """
+        Send frames in order, packing consecutive ones into a single GATT write
+        up to the link's max write size. A frame is never split across writes.
+        `abort` is checked before every GATT write; once it returns True the
+        rest is dropped (the caller finds out why).
+        """
+        if not self.config.coalesce_writes:
+            for packet in packets:
+                if abort and abort():
+                    return
+                await self._write(packet, 1)
+            return
+
+        limit = self.link.max_write = self._max_write()
+        batch = bytearray()
+        frames = 0
+        for packet in packets:
+            if frames and len(batch) + len(packet) > limit:
+                if abort and abort():
+                    return
+                await self._write(bytes(batch), frames)
+                batch.clear()
+                frames = 0
+            batch += packet
+            frames += 1
+        if frames and not (abort and abort()):
+            await self._write(bytes(batch), frames)
+
+    async def _write(self, data: bytes, frames: int, response: bool = False):
+        if not self.connected and self._in_job:
+            # Don't silently reconnect under a job: the printer has lost it
+            raise LinkDropped("BLE link dropped during the job")
+        client = self._client if self.connected else await self.ensure_connected()
+        t0 = time.monotonic()
+        try:
+            await client.write_gatt_char(self.channel.write_char, data, response=response or self._write_response)
+        except Exception as e:
+            if self._in_job and not self.connected:
+                raise LinkDropped(f"BLE link dropped during the job ({e})") from e
+            raise
+        spent = time.monotonic() - t0
+
+        link = self.link
+        link.writes += 1
+        link.frames += frames
+        link.bytes += len(data)
+        link.busy_s += spent
+        if spent > 0.002:
+            # Writes that had to wait for buffer space complete once per connection event
+            self._write_times.append(spent)
+            if len(self._write_times) >= 8:
+                link.conn_interval_ms = round(statistics.median(self._write_times) * 1000, 1)
+
+    def touch(self):
+        self._last_activity = time.monotonic()
+
+    @property
+    def busy(self) -> bool:
+        """A print job (or status poll) holds the link."""
+        return self._job_lock.locked()
+
+    @asynccontextmanager
+    async def background(self):
+        """
+        Exclusive use of the link for housekeeping (status polls): doesn't
+        connect and doesn't count as activity for the idle disconnect.
+        """
+        async with self._job_lock:
+            yield self
+
+    @asynccontextmanager
+    async def job(self):
+        """
+        Exclusive use of the link for one print job. Writes raise LinkDropped
+        if the link goes down; ensure_connected() brings it back.
+        """
+        async with self._job_lock:
+            await self.ensure_connected()
+            self._in_job = True
+            try:
+                yield self
+            finally:
+                self._in_job = False
+                self.touch()
+
+    # -----------------------------
+    # Keepalive / idle
+    # -----------------------------
+
+    async def _keepalive_loop(self):
+        cfg = self.config
+        while not self._closing:
+            await asyncio.sleep(cfg.keepalive_interval_s)
+            if self._job_lock.locked():
+                continue  # a job is using the link; that's activity enough
+
+            async with self._job_lock:
+                idle = time.monotonic() - self._last_activity
+                if cfg.idle_disconnect_s and idle >= cfg.idle_disconnect_s:
+                    self._log(f"💤 Idle for {idle:.0f}s, disconnecting to save battery")
+                    await self.disconnect()
+                    return  # next job reconnects and restarts the loop
+
+                try:
+                    if not self.connected:
+                        self._log("🔄 Reconnecting...")
+                    await self.write(make_packet(CMD_HEARTBEAT, b"\x01"))
+                    self.keepalives_sent += 1
+                except Exception as e:
+                    self._log(f"⚠️  Keepalive failed: {e}")
@@ -0,0 +1,203 @@
+"""
+Awaited request/response for NIIMBOT commands.
+
+The handshake used to be fire-and-forget writes with a fixed sleep after each
+one (0.1 s for heartbeat / density / label type / PageStart / SetPageSize /
+SetQuantity, 0.2 s for PrintStart, 0.5 s for PrintEnd), and SetPageSize went
+out twice in case the first one was dropped. Here every command waits for the
+response that answers it (niimbot_protocol.is_reply):
+
+- the next step goes out as soon as the printer has answered, so the handshake
+  takes as long as the printer actually needs
+- each command has its own timeout (`CommandConfig.timeouts`); a command whose
+  reply doesn't come is sent again up to `retries` times, and only then fails
+  with CommandTimeout
+- a printer that has never answered anything on this link (old firmware, a
+  one-way adapter) is treated as silent: the commands go out with the old fixed
+  delays instead of failing, and `silent` tells the caller not to wait for
+  feedback later either
+- an error frame (0xDB: cover open, no paper, wrong label...) fails the command
+  that is waiting with PrinterError right away; used as a context manager the
+  link also keeps watching between commands, and the next request() (or
+  check()) raises it
+- with a job deadline (deadline.py) every wait is capped at what is left of
+  it, and no resend goes out once it has run out (DeadlineExceeded)
+
+CommandLink works with any async `write(packet)` + ResponseDispatcher (BLE
+session); SerialCommandLink is the blocking twin for a SerialSession.
+"""
+
+import asyncio
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Optional
+
+from deadline import Deadline
+from niimbot_protocol import (CMD_PAGE_END, CMD_PRINT_END, CMD_PRINT_START, Ack, Frame, PrinterError,
+                              PrinterErrorResponse, Response, ResponseDispatcher, is_reply, make_packet)
+
+Writer = Callable[[bytes], Awaitable[None]]
+
+
+class CommandTimeout(Exception):
+    """The printer didn't answer a command, even after resending it."""
+
+    def __init__(self, command: int, attempts: int):
+        super().__init__(f"No reply to command 0x{command:02x} after {attempts} attempt(s)")
+        self.command = command
+        self.attempts = attempts
+
+
+@dataclass
+class CommandConfig:
+    timeout_s: float = 0.5             # reply timeout per attempt
+    timeouts: Dict[int, float] = field(default_factory=lambda: {
+        CMD_PRINT_START: 1.0,          # the printer may still be waking up
+        CMD_PAGE_END: 1.0,
+        CMD_PRINT_END: 1.0,
+    })
+    retries: int = 2                   # resends after the first attempt
+    silent_delay_s: float = 0.1        # fixed wait per command once the printer is known silent
+    verbose: bool = False
+
+    def timeout_for(self, command: int) -> float:
+        return self.timeouts.get(command, self.timeout_s)
+
+
+class _LinkState:
+    def __init__(self, rx: ResponseDispatcher, config: Optional[CommandConfig],
+                 deadline: Optional[Deadline] = None):
+        self.rx = rx
+        self.config = config or CommandConfig()
+        self.deadline = deadline or Deadline(None)
+        self.silent = False
+        self.replies = 0       # commands answered so far
+        self.resends = 0       # lost commands sent again
+        self.error: Optional[PrinterError] = None
+
+    def __enter__(self):
+        self.rx.subscribe(self._on_error, PrinterErrorResponse)
+        return self
+
+    def __exit__(self, *exc):
+        self.rx.unsubscribe(self._on_error, PrinterErrorResponse)
+
+    def _on_error(self, resp: PrinterErrorResponse):
+        if self.error is None:
+            self.error = PrinterError.from_response(resp)
+
+    def check(self):
+        """Raise the printer error seen during the job, if any."""
+        if self.error is not None:
+            raise self.error
+
+    def _matches(self, command: int, data: bytes):
+        return lambda r: isinstance(r, PrinterErrorResponse) or is_reply(command, data, r)
+
+    def _log_tx(self, packet: bytes):
+        if self.config.verbose:
+            print(f"TX: {packet.hex()}")
+
+    def _check(self, command: int, resp: Response):
+        self.replies += 1
+        if isinstance(resp, PrinterErrorResponse):
+            self._on_error(resp)
+            self.check()
+        if isinstance(resp, Ack) and not resp.ok:
+            print(f"⚠️  Printer refused command 0x{command:02x}")
+        elif isinstance(resp, Frame):  # 0x00 "not supported"
+            print(f"⚠️  Command 0x{command:02x} not supported by this printer")
+
+    def _give_up(self, command: int, attempts: int):
+        if not self.replies:
+            # Nothing was ever answered on this link: keep the old timed behaviour
+            print(f"⚠️  No reply to 0x{command:02x}; printer looks silent, using fixed delays")
+            self.silent = True
+            return
+        raise CommandTimeout(command, attempts)
+
+    def _timed_out(self, command: int, attempt: int, attempts: int):
+        if self.deadline.expired:
+            raise self.deadline.exceeded() from None
+        if attempt + 1 < attempts:
+            self._retrying(command, attempt)
+
+    def _retrying(self, command: int, attempt: int):
+        self.resends += 1
+        print(f"⚠️  No reply to 0x{command:02x}, resending ({attempt + 1}/{self.config.retries})")
+
+
+class CommandLink(_LinkState):
+    def __init__(self, write: Writer, rx: ResponseDispatcher, config: Optional[CommandConfig] = None,
+                 deadline: Optional[Deadline] = None):
+        super().__init__(rx, config, deadline)
+        self.write = write
+
+    async def request(self, command: int, data: bytes = b"", *,
+                      timeout_s: Optional[float] = None) -> Optional[Response]:
+        """
+        Send `command` and return the response that answers it (None if the
+        printer is silent). Raises PrinterError on an error frame, and
+        CommandTimeout when a printer that has answered before stops answering.
+        """
+        self.check()
+        packet = make_packet(command, data)
+        if self.silent:
+            self._log_tx(packet)
+            await self.write(packet)
+            await asyncio.sleep(self.config.silent_delay_s)
+            return None
+
+        timeout_s = timeout_s or self.config.timeout_for(command)
+        attempts = self.config.retries + 1
+        for attempt in range(attempts):
+            reply = self.rx.expect(None, self._matches(command, data))
+            try:
+                self._log_tx(packet)
+                await self.write(packet)
+                resp = await asyncio.wait_for(reply, self.deadline.cap(timeout_s))
+            except asyncio.TimeoutError:
+                self._timed_out(command, attempt, attempts)
+                continue
+            finally:
+                reply.cancel()
+            self._check(command, resp)
+            return resp
+        self._give_up(command, attempts)
+        return None
+
+
+class SerialCommandLink(_LinkState):
+    def __init__(self, session, config: Optional[CommandConfig] = None, deadline: Optional[Deadline] = None):
+        super().__init__(session.rx, config, deadline)
+        self.session = session
+
+    def request(self, command: int, data: bytes = b"", *,
+                timeout_s: Optional[float] = None) -> Optional[Response]:
+        """Blocking request() over a serial_session.SerialSession."""
+        self.check()
+        packet = make_packet(command, data)
+        if self.silent:
+            self._log_tx(packet)
+            self.session.write(packet)
+            time.sleep(self.config.silent_delay_s)
+            return None
+
+        timeout_s = timeout_s or self.config.timeout_for(command)
+        attempts = self.config.retries + 1
+        for attempt in range(attempts):
+            reply = self.session.expect(None, self._matches(command, data))
+            try:
+                self._log_tx(packet)
+                self.session.write(packet)
+                resp = reply.result(self.deadline.cap(timeout_s))
+            except FutureTimeoutError:  # not the builtin TimeoutError before Python 3.11
+                self._timed_out(command, attempt, attempts)
+                continue
+            finally:
+                reply.cancel()
+            self._check(command, resp)
+            return resp
+        self._give_up(command, attempts)
+        return None
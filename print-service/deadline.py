@@ -0,0 +1,88 @@
+"""
+One deadline per print job, shared by every stage.
+
+Timeouts used to be per step and unrelated: 5 s scan, 15-30 s connect, 45 s
+native job (+5 s per copy), 40 s per niimblue-cli attempt, 120 s in the pool
+queue, on top of the browser's own fetch timeout. A label could stall for
+minutes before anything failed. A Deadline is created when the request comes in
+and goes with the job through queue -> discovery -> connect -> handshake ->
+transmit -> printing (and fallback):
+
+- each stage calls enter(stage): it fails at once if the budget is gone, and
+  the current stage is what a timeout is reported against
+- waits inside a stage use cap(timeout_s): their own timeout, but never
+  past the deadline
+- what runs on the I/O loop is also hard-capped at the remaining budget plus
+  a short grace (so the job's own checks normally fire first and close the
+  printer job cleanly), so a stuck connect can't outlive it
+
+Running out raises DeadlineExceeded (a TimeoutError) tagged with the stage;
+like PrinterError it carries `labels_done`, and it skips the niimblue-node
+fallback, which has no budget left to work with.
+
+Deadline(None) is unbounded: stages are still recorded, nothing times out.
+"""
+
+import time
+from typing import Iterable, Optional
+
+
+class DeadlineExceeded(TimeoutError):
+    def __init__(self, stage: str, budget_s: float, elapsed_s: float, labels_done: int = 0):
+        super().__init__(f"Print deadline of {budget_s:g}s exceeded during {stage} (after {elapsed_s:.1f}s)")
+        self.stage = stage
+        self.budget_s = budget_s
+        self.elapsed_s = elapsed_s
+        self.labels_done = labels_done   # labels that did print before it ran out
+
+    @property
+    def message(self) -> str:
+        return str(self)
+
+
+class Deadline:
+    def __init__(self, budget_s: Optional[float]):
+        self.budget_s = budget_s
+        self.started = time.monotonic()
+        self.at = None if budget_s is None else self.started + budget_s
+        self.stage = "queue"
+
+    @classmethod
+    def earliest(cls, deadlines: Iterable[Optional["Deadline"]]) -> Optional["Deadline"]:
+        """The tightest of several jobs' deadlines (a batch must meet all of them)."""
+        bounded = [d for d in deadlines if d is not None and d.at is not None]
+        return min(bounded, key=lambda d: d.at) if bounded else None
+
+    @property
+    def elapsed_s(self) -> float:
+        return time.monotonic() - self.started
+
+    def remaining(self) -> float:
+        if self.at is None:
+            return float("inf")
+        return max(0.0, self.at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.at is not None and time.monotonic() >= self.at
+
+    def exceeded(self, stage: Optional[str] = None, labels_done: int = 0) -> DeadlineExceeded:
+        return DeadlineExceeded(stage or self.stage, self.budget_s or 0.0, self.elapsed_s, labels_done)
+
+    def check(self, stage: Optional[str] = None):
+        if self.expired:
+            raise self.exceeded(stage)
+
+    def enter(self, stage: str) -> float:
+        """Start `stage`; raises DeadlineExceeded if there's no budget left. Returns what is left."""
+        self.stage = stage
+        self.check()
+        return self.remaining()
+
+    def timeout(self) -> Optional[float]:
+        """remaining() for APIs where None means no timeout (unbounded deadline)."""
+        return None if self.at is None else self.remaining()
+
+    def cap(self, timeout_s: float, grace_s: float = 0.0) -> float:
+        """`timeout_s`, cut down to the remaining budget (+ `grace_s`)."""
+        return min(timeout_s, self.remaining() + grace_s)
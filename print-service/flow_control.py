@@ -0,0 +1,670 @@
+"""
+Row pacing driven by printer feedback instead of fixed per-row sleeps.
+
+Every print path used to sleep after each 0x85 row (6-10 ms) and around every
+handshake step, so a 640-row 50x80 label spent >6 s just sleeping. Here the
+transmitter keeps a credit window of rows in flight:
+
+- send `window_rows` rows back-to-back
+- ask for PrintStatus (0xA3); the reply (0xB3) can only come after the printer
+  has consumed everything sent before the query, so it renews the credit
+- if the printer stays silent for `silent_after` windows, fall back to timed
+  pacing (`fallback_delay_s` per row) and keep probing so feedback can resume
+
+AdaptivePacer tunes the window (and, on bad links, a per-row gap) AIMD-style
+from those replies and persists the result per printer and transport.
+
+Windows are sized by printing cost rather than row count: RowCostModel predicts
+how long the printer takes for a row from its burned dots (the 0x85 header's
+segment counts), so blank margin goes out in long windows and dense QR blocks in
+short ones. The model is fitted to the measured status round-trips as it goes.
+
+wait_printed() / wait_pages() replace the fixed "wait for print head" sleep at
+page end by polling PrintStatus until the page (or all copies) is reported done.
+
+An error frame (0xDB) from the printer stops all of them with PrinterError as
+soon as it arrives: no more rows go out for a job the printer has rejected.
+Given a job deadline (deadline.py) they also stop with DeadlineExceeded when it
+runs out, and no wait in them runs past it.
+
+RowTransmitter works with any async `write(packet)` (BLE session, serial session);
+send_rows_serial() is the blocking twin for a serial_session.SerialSession.
+"""
+
+import asyncio
+import queue
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Deque, List, Optional, Tuple
+
+from deadline import Deadline
+from niimbot_protocol import (CMD_PRINT_STATUS, PrinterError, PrinterErrorResponse, PrintStatus, ResponseDispatcher,
+                              make_packet, row_packet_load)
+
+STATUS_QUERY = make_packet(CMD_PRINT_STATUS, b"\x01")
+
+Writer = Callable[[bytes], Awaitable[None]]
+BatchWriter = Callable[..., Awaitable[None]]   # (packets, *, abort) like B1Session.write_many
+ProgressCallback = Callable[[int, int], None]
+
+
+@dataclass
+class FlowConfig:
+    window_rows: int = 32            # rows in flight before waiting for the printer (0 = timed only)
+    status_timeout_s: float = 0.5    # max wait for a PrintStatus reply per window
+    silent_after: int = 2            # missed replies in a row before timed pacing
+    fallback_delay_s: float = 0.01   # per-row sleep while the printer is silent
+
+
+@dataclass
+class TransmitStats:
+    rows: int = 0
+    sent: int = 0
+    acked: int = 0           # rows the printer has confirmed taking (answered probe)
+    printed: int = 0         # highest page counter seen in the status replies
+    acks: int = 0            # windows confirmed by a PrintStatus reply
+    misses: int = 0          # windows where the printer stayed silent
+    late: int = 0            # status replies that arrived after their probe timed out
+    errors: int = 0          # printer error frames seen while sending
+    timed_rows: int = 0      # rows paced by sleeping
+    elapsed_s: float = 0.0
+
+    @property
+    def timed_mode(self) -> bool:
+        return self.timed_rows > 0
+
+
+class RowCostModel:
+    """
+    Printing time of a batch of rows: latency_s + row_s * rows + dot_s * dots.
+
+    Starts from a prior (head speed ~3 ms/row, dense rows roughly twice as slow)
+    and is refitted from every confirmed window with a decayed, ridge-regularised
+    least squares, so it follows the actual printer/battery/density without ever
+    swinging to nonsense on a few noisy samples.
+    """
+
+    REFERENCE_DOTS = 96     # "typical" row (25% coverage): weight 1.0
+    MIN_ROW_S = 0.0005
+    DECAY = 0.9             # weight of older samples per new one
+    PRIOR_WEIGHT = 4.0      # how many samples the prior is worth
+
+    def __init__(self, row_s: float = 0.003, dot_s: float = 0.00002, latency_s: float = 0.02):
+        self.row_s = row_s
+        self.dot_s = dot_s
+        self.latency_s = latency_s
+        self.samples = 0
+        self._prior = (latency_s, row_s, dot_s)
+        self._xtx = [[0.0] * 3 for _ in range(3)]
+        self._xty = [0.0] * 3
+
+    @classmethod
+    def from_tuning(cls, tuning: dict) -> "RowCostModel":
+        model = cls()
+        for key in ("row_s", "dot_s", "latency_s"):
+            if tuning.get(key) is not None:
+                setattr(model, key, float(tuning[key]))
+        model._prior = (model.latency_s, model.row_s, model.dot_s)
+        return model
+
+    def cost(self, rows: int, dots: int) -> float:
+        """Predicted print time of `rows` rows burning `dots` dots (no latency)."""
+        return self.row_s * rows + self.dot_s * dots
+
+    def predict(self, rows: int, dots: int) -> float:
+        """Expected status round-trip after sending a window of `rows` rows / `dots` dots."""
+        return self.latency_s + self.cost(rows, dots)
+
+    def weight(self, rows: int, dots: int) -> float:
+        """Cost relative to one reference row."""
+        return self.cost(rows, dots) / self.cost(1, self.REFERENCE_DOTS)
+
+    def observe(self, rows: int, dots: int, elapsed_s: float):
+        """Add one measured window (rows/dots sent before a status probe, its RTT)."""
+        x = (1.0, float(rows), float(dots))
+        for i in range(3):
+            self._xty[i] = self._xty[i] * self.DECAY + x[i] * elapsed_s
+            for j in range(3):
+                self._xtx[i][j] = self._xtx[i][j] * self.DECAY + x[i] * x[j]
+        self.samples += 1
+        self._refit()
+
+    def _refit(self):
+        # (XtX + lambda*D) theta = Xty + lambda*D*prior, D scaled per feature so
+        # the prior pulls equally hard on every coefficient
+        scale = [1.0, 32.0 ** 2, (32.0 * self.REFERENCE_DOTS) ** 2]
+        a = [row[:] for row in self._xtx]
+        b = self._xty[:]
+        for i in range(3):
+            a[i][i] += self.PRIOR_WEIGHT * scale[i]
+            b[i] += self.PRIOR_WEIGHT * scale[i] * self._prior[i]
+        theta = _solve3(a, b)
+        if theta is None:
+            return
+        latency_s, row_s, dot_s = theta
+        self.latency_s = max(0.0, latency_s)
+        self.row_s = max(self.MIN_ROW_S, row_s)
+        self.dot_s = max(0.0, dot_s)
+
+    def as_tuning(self) -> dict:
+        return {"row_s": round(self.row_s, 6), "dot_s": round(self.dot_s, 8), "latency_s": round(self.latency_s, 4)}
+
+
+def _solve3(a: List[List[float]], b: List[float]) -> Optional[Tuple[float, float, float]]:
+    """Cramer's rule for a 3x3 system (None if singular)."""
+    def det(m):
+        return (m[0][0] * (m[1][1] * m[2][2] - m[1][2] * m[2][1])
+                - m[0][1] * (m[1][0] * m[2][2] - m[1][2] * m[2][0])
+                + m[0][2] * (m[1][0] * m[2][1] - m[1][1] * m[2][0]))
+    d = det(a)
+    if abs(d) < 1e-12:
+        return None
+    out = []
+    for col in range(3):
+        m = [row[:] for row in a]
+        for i in range(3):
+            m[i][col] = b[i]
+        out.append(det(m) / d)
+    return out[0], out[1], out[2]
+
+
+def _loads(packets: List[bytes]) -> List[Tuple[int, int]]:
+    """(rows, dots) per packet; anything that isn't a row packet counts as one reference row."""
+    loads = [row_packet_load(p) for p in packets]
+    return [load if load[0] else (1, RowCostModel.REFERENCE_DOTS) for load in loads]
+
+
+def plan_windows(loads: List[Tuple[int, int]], start: int, window_rows: int, model: RowCostModel) -> int:
+    """
+    End index of the window starting at `start`: as many packets as fit in the
+    printing time of `window_rows` reference rows (at least one, at most
+    4x window_rows printed rows).
+    """
+    budget = window_rows * model.cost(1, model.REFERENCE_DOTS)
+    max_rows = window_rows * 4
+    spent = 0.0
+    rows = 0
+    end = start
+    while end < len(loads):
+        r, d = loads[end]
+        spent += model.cost(r, d)
+        rows += r
+        end += 1
+        if spent >= budget or rows >= max_rows:
+            break
+    return end
+
+
+def _timed_delay(model: RowCostModel, load: Tuple[int, int], base_s: float) -> float:
+    """Silent-printer pacing for one packet, scaled by its cost (0.5x .. 2x)."""
+    return base_s * min(2.0, max(0.5, model.weight(*load)))
+
+
+class AdaptivePacer:
+    """
+    AIMD tuning of the credit window for one printer + transport.
+
+    - every window confirmed in time: additive increase (first shrink any
+      intra-window row gap, then grow the window)
+    - missed or late (out-of-order) status reply, printer error, or an RTT far
+      above what the cost model predicts for the window: multiplicative
+      decrease (halve the window; at the minimum window, start/double a
+      per-row gap)
+
+    The window counts reference rows (see RowCostModel), not packets. The tuned
+    values and the fitted cost model are saved per printer address and transport in the printer
+    registry, so the next job starts from the last known-good rate.
+    """
+
+    MIN_WINDOW = 4
+    MAX_WINDOW = 160
+    WINDOW_STEP = 4
+    GAP_STEP_S = 0.0005
+    MAX_GAP_S = 0.02
+
+    def __init__(self, window_rows: int = 32, row_gap_s: float = 0.0, *, registry=None,
+                 address: Optional[str] = None, transport: str = "ble", model: Optional[RowCostModel] = None):
+        self.model = model or RowCostModel()
+        self.window_rows = max(self.MIN_WINDOW, min(self.MAX_WINDOW, window_rows))
+        self.row_gap_s = max(0.0, min(self.MAX_GAP_S, row_gap_s))
+        self.registry = registry
+        self.address = address
+        self.transport = transport
+        self.best_rtt_s: Optional[float] = None
+        self.increases = 0
+        self.decreases = 0
+
+    @classmethod
+    def for_printer(cls, registry, address: Optional[str], transport: str, *,
+                    default_window: int = 32) -> "AdaptivePacer":
+        tuning = registry.get_tuning(address, transport) if (registry and address) else {}
+        pacer = cls(tuning.get("window_rows", default_window), tuning.get("row_gap_s", 0.0),
+                    registry=registry, address=address, transport=transport,
+                    model=RowCostModel.from_tuning(tuning))
+        pacer.best_rtt_s = tuning.get("best_rtt_s")
+        return pacer
+
+    def on_ack(self, rtt_s: float, expected_s: Optional[float] = None):
+        """
+        A window was confirmed after `rtt_s`. The RTT grows with the window, so it
+        is judged against `expected_s`, the cost model's prediction for that
+        window (default: a full window of reference rows).
+        """
+        if self.best_rtt_s is None or rtt_s < self.best_rtt_s:
+            self.best_rtt_s = rtt_s
+        if expected_s is None:
+            expected_s = self.model.predict(self.window_rows, self.window_rows * self.model.REFERENCE_DOTS)
+        if rtt_s > max(3 * expected_s, 0.05):
+            self.on_loss()  # queueing in the printer/link: treat like a drop
+            return
+        self.increases += 1
+        if self.row_gap_s > 0:
+            self.row_gap_s = max(0.0, self.row_gap_s - self.GAP_STEP_S)
+        else:
+            self.window_rows = min(self.MAX_WINDOW, self.window_rows + self.WINDOW_STEP)
+
+    def on_loss(self):
+        self.decreases += 1
+        if self.window_rows > self.MIN_WINDOW:
+            self.window_rows = max(self.MIN_WINDOW, self.window_rows // 2)
+        else:
+            self.row_gap_s = min(self.MAX_GAP_S, max(self.GAP_STEP_S, self.row_gap_s * 2))
+
+    def save(self):
+        """Persist the tuned rate if it moved (call after a job that printed)."""
+        if not (self.registry and self.address):
+            return
+        if not (self.increases or self.decreases or self.model.samples):
+            return  # never measured anything (silent printer)
+        self.registry.set_tuning(self.address, self.transport, {
+            "window_rows": self.window_rows,
+            "row_gap_s": round(self.row_gap_s, 4),
+            "best_rtt_s": round(self.best_rtt_s, 4) if self.best_rtt_s else None,
+            **self.model.as_tuning(),
+        })
+
+
+class _Probe:
+    __slots__ = ("sent_at", "future", "abandoned", "timed")
+
+    def __init__(self, future: asyncio.Future, timed: bool = False):
+        self.sent_at = time.monotonic()
+        self.future = future
+        self.abandoned = False
+        self.timed = timed   # sent in timed mode: never waited for, so never late
+
+
+class RowTransmitter:
+    def __init__(self, write: Writer, rx: ResponseDispatcher, config: Optional[FlowConfig] = None,
+                 verbose: bool = False, pacer: Optional[AdaptivePacer] = None,
+                 write_many: Optional[BatchWriter] = None):
+        self.write = write
+        # Optional batch writer (B1Session.write_many): a whole window goes out
+        # in as few link writes as possible
+        self.write_many = write_many
+        self.rx = rx
+        self.config = config or FlowConfig()
+        self.verbose = verbose
+        self.pacer = pacer
+        self.model = pacer.model if pacer else RowCostModel()
+        self.stats = TransmitStats()
+        self.error: Optional[PrinterError] = None
+        # Status replies carry no sequence number; they answer probes in order
+        self._probes: Deque[_Probe] = deque()
+
+    def _log(self, msg: str):
+        if self.verbose:
+            print(msg)
+
+    def _on_status(self, status: PrintStatus):
+        self.stats.printed = max(self.stats.printed, status.page)
+        if not self._probes:
+            return
+        probe = self._probes.popleft()
+        if probe.abandoned:
+            # Reply to a probe we already gave up on: it arrived out of order
+            self.stats.late += 1
+            if self.pacer and not probe.timed:
+                self.pacer.on_loss()
+        elif not probe.future.done():
+            probe.future.set_result(time.monotonic() - probe.sent_at)
+
+    def _on_error(self, error: PrinterErrorResponse):
+        # The job is dead: wake up whatever is waiting for a status reply
+        self.stats.errors += 1
+        if self.pacer:
+            self.pacer.on_loss()
+        if self.error is None:
+            self.error = PrinterError.from_response(error)
+        for probe in self._probes:
+            if not probe.future.done():
+                probe.future.set_exception(self.error)
+
+    def _check(self):
+        if self.error is not None:
+            raise self.error
+
+    async def _probe(self, timed: bool = False) -> _Probe:
+        probe = _Probe(asyncio.get_running_loop().create_future(), timed)
+        self._probes.append(probe)
+        await self.write(STATUS_QUERY)
+        return probe
+
+    async def send(self, packets: List[bytes], progress: Optional[ProgressCallback] = None,
+                   deadline: Optional[Deadline] = None) -> TransmitStats:
+        cfg = self.config
+        pacer = self.pacer
+        deadline = deadline or Deadline(None)
+        stats = self.stats = TransmitStats(rows=len(packets))
+        self.error = None
+        t0 = time.monotonic()
+
+        fixed_window = cfg.window_rows or len(packets) or 1
+        timed = cfg.window_rows == 0
+        misses_in_row = 0
+        pending: Optional[_Probe] = None  # unanswered probe while in timed mode
+        self._probes.clear()
+        self.rx.subscribe(self._on_status, PrintStatus)
+        self.rx.subscribe(self._on_error, PrinterErrorResponse)
+
+        model = self.model
+        loads = _loads(packets)
+        try:
+            start = 0
+            while start < len(packets):
+                self._check()
+                deadline.check()
+                window = pacer.window_rows if (pacer and not timed) else fixed_window
+                end = plan_windows(loads, start, window, model)
+                gap = 0.0 if timed else (pacer.row_gap_s if pacer else 0.0)
+                if self.write_many is not None and not timed and not gap:
+                    # A window can be several GATT writes: an error frame stops it between them
+                    await self.write_many(packets[start:end],
+                                          abort=lambda: self.error is not None or deadline.expired)
+                    self._check()
+                    deadline.check()
+                else:
+                    for i in range(start, end):
+                        self._check()
+                        await self.write(packets[i])
+                        delay = _timed_delay(model, loads[i], cfg.fallback_delay_s) if timed else gap
+                        if delay:
+                            await asyncio.sleep(delay)
+                if timed:
+                    stats.timed_rows += end - start
+                window_rows = sum(r for r, _ in loads[start:end])
+                window_dots = sum(d for _, d in loads[start:end])
+                start = stats.sent = end
+                if progress:
+                    progress(stats.sent, stats.rows)
+
+                if cfg.window_rows == 0 or stats.sent >= stats.rows:
+                    continue  # nothing left to pace (page end has its own wait)
+                self._check()
+
+                if pending is not None:
+                    if pending.future.done():
+                        self._log("✅ Printer feedback is back, leaving timed pacing")
+                        timed, misses_in_row = False, 0
+                    else:
+                        pending.abandoned = True
+                    pending = None
+
+                probe = await self._probe(timed)
+                if timed:
+                    pending = probe  # checked (not awaited) at the next window
+                    continue
+                try:
+                    rtt = await asyncio.wait_for(asyncio.shield(probe.future), deadline.cap(cfg.status_timeout_s))
+                    stats.acks += 1
+                    stats.acked = end
+                    misses_in_row = 0
+                    expected = model.predict(window_rows, window_dots)  # before it learns from this one
+                    if window_rows:
+                        model.observe(window_rows, window_dots, rtt)
+                    if pacer:
+                        pacer.on_ack(rtt, expected)
+                except asyncio.TimeoutError:
+                    probe.abandoned = True
+                    deadline.check()  # out of time, not a lost reply
+                    stats.misses += 1
+                    misses_in_row += 1
+                    if pacer:
+                        pacer.on_loss()
+                    if misses_in_row >= cfg.silent_after:
+                        self._log(f"⚠️  No status from printer, timed pacing ({cfg.fallback_delay_s * 1000:.0f} ms/row)")
+                        timed = True
+        finally:
+            if pending is not None:
+                pending.abandoned = True
+            self.rx.unsubscribe(self._on_status, PrintStatus)
+            self.rx.unsubscribe(self._on_error, PrinterErrorResponse)
+            stats.elapsed_s = time.monotonic() - t0
+        return stats
+
+
+def _status_or_error(resp) -> bool:
+    return isinstance(resp, (PrintStatus, PrinterErrorResponse))
+
+
+def _pages_done(status: PrintStatus, pages: int) -> bool:
+    # With copies the page counter is what counts; progress hits 100 once per copy
+    return status.page >= pages or (pages == 1 and status.progress1 >= 100)
+
+
+def pages_printed(status: PrintStatus, pages: int) -> int:
+    """Page counter of a wait_pages() result; a single page done by its progress counts as printed."""
+    return max(status.page, pages) if _pages_done(status, pages) else status.page
+
+
+async def wait_pages(write: Writer, rx: ResponseDispatcher, *, pages: int = 1, timeout_s: float = 10.0,
+                     poll_s: float = 0.1, deadline: Optional[Deadline] = None) -> Optional[PrintStatus]:
+    """
+    Poll PrintStatus until `pages` pages (copies) are reported done. The timeout
+    restarts whenever another page completes, so long copy runs don't need a
+    huge fixed budget; `deadline` (the job's) bounds the whole wait. Returns
+    the last status (None if the printer never answered); raises PrinterError
+    on an error frame.
+    """
+    end = time.monotonic() + (deadline.remaining() if deadline else float("inf"))
+    until = min(time.monotonic() + timeout_s, end)
+    last: Optional[PrintStatus] = None
+    while time.monotonic() < until:
+        probe = rx.expect(None, _status_or_error)
+        await write(STATUS_QUERY)
+        try:
+            status = await asyncio.wait_for(probe, min(poll_s * 5, max(0.0, until - time.monotonic())))
+        except asyncio.TimeoutError:
+            if last is None:
+                if deadline:
+                    deadline.check()  # out of time, not a silent printer
+                return None
+            continue
+        if isinstance(status, PrinterErrorResponse):
+            raise PrinterError.from_response(status)
+        if last is not None and status.page > last.page:
+            until = min(time.monotonic() + timeout_s, end)
+        last = status
+        if _pages_done(status, pages):
+            return status
+        await asyncio.sleep(poll_s)
+    if last is None and deadline:
+        deadline.check()
+    return last
+
+
+async def wait_printed(write: Writer, rx: ResponseDispatcher, *, page: int = 1, timeout_s: float = 10.0,
+                       poll_s: float = 0.1) -> bool:
+    """
+    Poll PrintStatus until `page` pages are reported done (or print progress hits
+    100). Returns False if the printer never answered, so the caller can fall back
+    to a fixed delay.
+    """
+    return await wait_pages(write, rx, pages=page, timeout_s=timeout_s, poll_s=poll_s) is not None
+
+
+def wait_pages_serial(session, *, pages: int = 1, timeout_s: float = 10.0,
+                      poll_s: float = 0.1, deadline: Optional[Deadline] = None) -> Optional[PrintStatus]:
+    """Blocking wait_pages() for a SerialSession."""
+    end = time.monotonic() + (deadline.remaining() if deadline else float("inf"))
+    until = min(time.monotonic() + timeout_s, end)
+    last: Optional[PrintStatus] = None
+    while time.monotonic() < until:
+        probe = session.expect(None, _status_or_error)
+        session.write(STATUS_QUERY)
+        try:
+            status = probe.result(min(poll_s * 5, max(0.0, until - time.monotonic())))
+        except Exception:
+            probe.cancel()
+            if last is None:
+                if deadline:
+                    deadline.check()  # out of time, not a silent printer
+                return None
+            continue
+        if isinstance(status, PrinterErrorResponse):
+            raise PrinterError.from_response(status)
+        if last is not None and status.page > last.page:
+            until = min(time.monotonic() + timeout_s, end)
+        last = status
+        if _pages_done(status, pages):
+            return status
+        time.sleep(poll_s)
+    if last is None and deadline:
+        deadline.check()
+    return last
+
+
+def send_rows_serial(session, packets: List[bytes], config: Optional[FlowConfig] = None,
+                     progress: Optional[ProgressCallback] = None,
+                     pacer: Optional[AdaptivePacer] = None, deadline: Optional[Deadline] = None) -> TransmitStats:
+    """
+    Blocking version of RowTransmitter.send() for a SerialSession: same credit
+    window / silent fallback / adaptive pacing policy. Replies arrive through
+    the session's reader thread, so windows go out in one write each and the
+    sending thread only waits for the status probe.
+    """
+    cfg = config or FlowConfig()
+    deadline = deadline or Deadline(None)
+    stats = TransmitStats(rows=len(packets))
+    t0 = time.monotonic()
+    fixed_window = cfg.window_rows or len(packets) or 1
+    timed = cfg.window_rows == 0
+    misses_in_row = 0
+    unanswered = 0  # probes given up on or sent in timed mode; their replies may still arrive
+    model = pacer.model if pacer else RowCostModel()
+    loads = _loads(packets)
+    replies: "queue.Queue" = queue.Queue()
+    rx = session.rx
+    rx.subscribe(replies.put, PrintStatus)
+    errors: List[PrinterErrorResponse] = []
+
+    def on_error(error: PrinterErrorResponse):
+        stats.errors += 1
+        errors.append(error)
+        replies.put(error)  # wakes await_status()
+
+    rx.subscribe(on_error, PrinterErrorResponse)
+
+    def await_status(timeout_s: float) -> Optional[float]:
+        # Replies come back in probe order, so the first `unanswered` are late
+        nonlocal unanswered
+        sent_at = time.monotonic()
+        end = sent_at + timeout_s
+        while True:
+            try:
+                r = replies.get(timeout=max(0.0, end - time.monotonic()))
+            except queue.Empty:
+                return None
+            if isinstance(r, PrinterErrorResponse):
+                fail(r)
+            stats.printed = max(stats.printed, r.page)
+            if unanswered:
+                unanswered -= 1
+                stats.late += 1
+                if pacer:
+                    pacer.on_loss()
+            else:
+                return time.monotonic() - sent_at
+
+    def feedback_back() -> bool:
+        # Timed mode: did any status reply come in since the last window?
+        answered = False
+        while True:
+            try:
+                r = replies.get_nowait()
+            except queue.Empty:
+                return answered
+            if isinstance(r, PrinterErrorResponse):
+                fail(r)
+            stats.printed = max(stats.printed, r.page)
+            answered = True
+
+    def check_error():
+        # An error frame that came in while we were writing
+        if errors:
+            fail(errors[0])
+
+    def fail(error: PrinterErrorResponse):
+        # Back off on the sending thread, like every other pacer update here
+        if pacer:
+            pacer.on_loss()
+        raise PrinterError.from_response(error)
+
+    try:
+        start = 0
+        while start < len(packets):
+            check_error()
+            deadline.check()
+            window = pacer.window_rows if (pacer and not timed) else fixed_window
+            end = plan_windows(loads, start, window, model)
+            gap = pacer.row_gap_s if pacer else 0.0
+            if timed or gap:
+                for i in range(start, end):
+                    check_error()
+                    session.write(packets[i])
+                    time.sleep(_timed_delay(model, loads[i], cfg.fallback_delay_s) if timed else gap)
+            else:
+                session.write_many(packets[start:end])
+            if timed:
+                stats.timed_rows += end - start
+            window_rows = sum(r for r, _ in loads[start:end])
+            window_dots = sum(d for _, d in loads[start:end])
+            start = stats.sent = end
+            if progress:
+                progress(stats.sent, stats.rows)
+
+            if cfg.window_rows == 0 or stats.sent >= stats.rows:
+                continue
+            if timed and unanswered and feedback_back():
+                # The printer answers again. Probes it never answered can't be told
+                # apart from the ones it did, so start counting afresh.
+                timed, misses_in_row, unanswered = False, 0, 0
+
+            session.write(STATUS_QUERY)
+            if timed:
+                unanswered += 1
+                continue  # checked (not awaited) at the next window, never a loss
+            rtt = await_status(deadline.cap(cfg.status_timeout_s))
+            if rtt is not None:
+                stats.acks += 1
+                stats.acked = end
+                misses_in_row = 0
+                expected = model.predict(window_rows, window_dots)  # before it learns from this one
+                if window_rows and rtt:
+                    model.observe(window_rows, window_dots, rtt)
+                if pacer:
+                    pacer.on_ack(rtt, expected)
+            else:
+                unanswered += 1
+                deadline.check()  # out of time, not a lost reply
+                stats.misses += 1
+                misses_in_row += 1
+                if pacer:
+                    pacer.on_loss()
+                timed = misses_in_row >= cfg.silent_after
+    finally:
+        rx.unsubscribe(replies.put, PrintStatus)
+        rx.unsubscribe(on_error, PrinterErrorResponse)
+        stats.elapsed_s = time.monotonic() - t0
+    return stats
@@ -2,8 +2,9 @@
 Get detailed printer information to understand the firmware
 """
 import asyncio
-from bleak import BleakScanner, BleakClient
-import struct
+from bleak import BleakClient
+from printer_registry import find_printer
+from niimbot_protocol import Heartbeat, PrinterInfo, ResponseDispatcher
 
 SERVICE_UUID = "e7810a71-73ae-499d-8c15-faa9aef0c3f2"
 CHAR_UUID = "bef8d6c9-9c21-4c9e-b632-bd58c1009f9f"
@@ -18,8 +19,7 @@ def make_packet(command: int, data: bytes = b'') -> bytes:
 
 async def get_info():
     print("Scanning for B1...")
-    devices = await BleakScanner.discover(timeout=5.0)
-    target = next((d for d in devices if d.name and "B1" in d.name), None)
+    target = await find_printer("B1")
     if not target:
         print("❌ B1 Not Found")
         return
@@ -30,11 +30,11 @@ async def get_info():
         print("Connected!")
         
         responses = {}
+        rx = ResponseDispatcher()
+        # Keep the latest decoded response (frames may span notifications)
+        rx.subscribe(lambda resp: responses.__setitem__('last', resp))
         
-        def notification_handler(sender, data):
-            responses['last'] = data
-        
-        await client.start_notify(CHAR_UUID, notification_handler)
+        await client.start_notify(CHAR_UUID, rx)
         
         # Connect
         await client.write_gatt_char(CHAR_UUID, b'\x03' + make_packet(0xC1, b'\x01'), response=False)
@@ -62,23 +62,14 @@ async def get_info():
             await client.write_gatt_char(CHAR_UUID, make_packet(0x40, bytes([info_id])), response=False)
             await asyncio.sleep(0.3)
             
-            if responses['last']:
-                data = responses['last']
+            info = responses['last']
+            if isinstance(info, PrinterInfo) and info.key == info_id:
+                print(f"\n{info_name} (0x{info_id:02x}):")
+                print(f"   Raw: {info.raw.hex()}")
+                print(f"   Value: {info.value}")
+            elif info is not None:
                 print(f"\n{info_name} (0x{info_id:02x}):")
-                print(f"   Raw: {data.hex()}")
-                
-                # Try to parse
-                if len(data) > 4:
-                    payload = data[4:-2]  # Skip header and footer
-                    if info_id == 11:  # Serial
-                        print(f"   Value: {payload.hex()}")
-                    elif info_id in [9, 12]:  # Versions
-                        if len(payload) >= 2:
-                            val = struct.unpack('>H', payload[:2])[0]
-                            print(f"   Value: {val / 100}")
-                    else:
-                        if len(payload) >= 1:
-                            print(f"   Value: {payload[0]}")
+                print(f"   Unexpected: {info}")
         
         # Get RFID info
         print("\n\n📄 RFID/LABEL INFORMATION:")
@@ -88,7 +79,7 @@ async def get_info():
         await asyncio.sleep(0.5)
         
         if responses['last']:
-            print(f"Raw: {responses['last'].hex()}")
+            print(f"Response: {responses['last']}")
         
         # Heartbeat
         print("\n\n💓 HEARTBEAT:")
@@ -97,10 +88,11 @@ async def get_info():
         await client.write_gatt_char(CHAR_UUID, make_packet(0xDC, b'\x01'), response=False)
         await asyncio.sleep(0.3)
         
-        if responses['last']:
-            data = responses['last']
-            print(f"Raw: {data.hex()}")
-            print(f"Length: {len(data)} bytes")
+        if isinstance(responses['last'], Heartbeat):
+            hb = responses['last']
+            print(f"Cover: {hb.closing_state}  Battery: {hb.power_level}  Paper: {hb.paper_state}  RFID: {hb.rfid_read_state}")
+        elif responses['last']:
+            print(f"Response: {responses['last']}")
         
         await client.stop_notify(CHAR_UUID)
         print("\n" + "=" * 60)
@@ -0,0 +1,101 @@
+"""
+The asyncio loop that owns all printer I/O.
+
+BLE scripts used to call asyncio.run() per job: a new event loop and a new
+bleak backend every time, and nothing (connection, notifications, keepalive
+task) could outlive the job or be shared between Flask request threads. The
+service instead runs one long-lived loop on a background thread:
+
+- every B1Session, the transport race and the status monitor live on it, so
+  their asyncio locks, tasks and bleak clients all belong to the same loop
+- sync callers (Flask handlers, pool workers) hand it coroutines with submit()
+  and get a concurrent.futures.Future back, or run() to wait for the result
+- serial links stay on their own reader threads (serial_session.py); they are
+  blocking I/O and don't need the loop
+
+get_io_loop() is the process-wide instance (started on first use).
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Optional
+
+
+class IoLoop:
+    def __init__(self, name: str = "printer-io"):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return self.start()
+
+    def in_loop_thread(self) -> bool:
+        return threading.current_thread() is self._thread
+
+    def start(self) -> asyncio.AbstractEventLoop:
+        """Start the loop thread (idempotent) and return the loop."""
+        with self._lock:
+            if not self.running:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name=self.name, daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def submit(self, coro) -> Future:
+        """Schedule a coroutine on the loop from any thread; returns its Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.start())
+
+    def run(self, coro, timeout_s: Optional[float] = None):
+        """
+        submit() and wait for the result; on timeout the coroutine is cancelled
+        and TimeoutError (the builtin, on every Python version) is raised.
+        """
+        if self.in_loop_thread():
+            coro.close()
+            raise RuntimeError("IoLoop.run() called from the loop thread (would deadlock); await instead")
+        future = self.submit(coro)
+        try:
+            return future.result(timeout_s)
+        except FutureTimeoutError:
+            # Only an alias of the builtin TimeoutError from Python 3.11 on, where
+            # the coroutine's own TimeoutErrors (DeadlineExceeded) land here too
+            if future.done():
+                return future.result()
+            future.cancel()
+            raise TimeoutError(f"I/O loop call timed out after {timeout_s}s") from None
+
+    def call_soon(self, callback, *args):
+        """Run a plain callback on the loop thread (e.g. to start a task there)."""
+        self.start().call_soon_threadsafe(callback, *args)
+
+    def stop(self, timeout_s: float = 5.0):
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None:
+            return
+        loop.call_soon_threadsafe(loop.stop)
+        if thread is not threading.current_thread():
+            thread.join(timeout=timeout_s)
+
+
+_default_loop: Optional[IoLoop] = None
+_default_loop_lock = threading.Lock()
+
+
+def get_io_loop() -> IoLoop:
+    """Process-wide I/O loop shared by the print engine and everything on it."""
+    global _default_loop
+    with _default_loop_lock:  # Flask threads may ask for it at the same time
+        if _default_loop is None:
+            _default_loop = IoLoop()
+        return _default_loop
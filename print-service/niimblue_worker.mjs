@@ -0,0 +1,109 @@
+// Long-lived niimblue-node print worker, driven by niimblue_worker.py.
+//
+// One process per printer: connects once, then prints every job it receives on
+// stdin until stdin closes. Frames in both directions:
+//   u32 BE header length | JSON header | u32 BE body length | body
+// Requests: {"type": "print", "id": n, "density": 3, "quantity": 1, ...} + PNG bytes
+// Replies:  {"type": "ready"} once connected, {"type": "result", "id": n, "ok": bool, "error"?: str}
+// stdout carries frames only; logs go to stderr.
+//
+// Usage: node niimblue_worker.mjs --transport serial|ble --address COM3 [--model B1] [--module <path>]
+
+import { createRequire } from "node:module";
+import { writeFile } from "node:fs/promises";
+import { tmpdir } from "node:os";
+import { join } from "node:path";
+import { pathToFileURL } from "node:url";
+
+const args = {};
+for (let i = 2; i < process.argv.length; i += 2) {
+  args[process.argv[i].replace(/^--/, "")] = process.argv[i + 1];
+}
+
+const log = (...msg) => console.error("[niimblue-worker]", ...msg);
+
+function send(header, body = Buffer.alloc(0)) {
+  const json = Buffer.from(JSON.stringify(header), "utf8");
+  const head = Buffer.alloc(4);
+  head.writeUInt32BE(json.length);
+  const len = Buffer.alloc(4);
+  len.writeUInt32BE(body.length);
+  process.stdout.write(Buffer.concat([head, json, len, body]));
+}
+
+async function loadLibrary() {
+  if (!args.module) {
+    return import("@mmote/niimblue-node");
+  }
+  // Globally installed package: resolve its entry point from the directory
+  const entry = createRequire(import.meta.url).resolve(args.module);
+  return import(pathToFileURL(entry).href);
+}
+
+async function encodeImage(lib, png, header) {
+  const opts = { labelWidth: header.labelWidth, labelHeight: header.labelHeight };
+  if (lib.loadImageFromBuffer) {
+    return lib.loadImageFromBuffer(png, opts);
+  }
+  // Older niimblue-node only loads from a path
+  const file = join(tmpdir(), `niimblue-worker-${process.pid}.png`);
+  await writeFile(file, png);
+  return lib.loadImageFromFile(file, opts);
+}
+
+async function main() {
+  const lib = await loadLibrary();
+  const client = lib.initClient(args.transport, args.address, false);
+  await client.connect();
+  log(`connected (${args.transport} ${args.address})`);
+  send({ type: "ready", transport: args.transport, address: args.address });
+
+  // Jobs run strictly one after another
+  let chain = Promise.resolve();
+  const runJob = async (header, body) => {
+    try {
+      const image = await encodeImage(lib, body, header);
+      await lib.printImage(client, args.model || "B1", image, {
+        density: header.density ?? 3,
+        quantity: header.quantity ?? 1,
+        labelType: header.labelType ?? 1,
+      });
+      send({ type: "result", id: header.id, ok: true });
+    } catch (e) {
+      send({ type: "result", id: header.id, ok: false, error: String(e?.message ?? e) });
+    }
+  };
+
+  let buf = Buffer.alloc(0);
+  process.stdin.on("data", (chunk) => {
+    buf = Buffer.concat([buf, chunk]);
+    for (;;) {
+      if (buf.length < 4) return;
+      const headLen = buf.readUInt32BE(0);
+      if (buf.length < 8 + headLen) return;
+      const bodyLen = buf.readUInt32BE(4 + headLen);
+      const end = 8 + headLen + bodyLen;
+      if (buf.length < end) return;
+      const header = JSON.parse(buf.subarray(4, 4 + headLen).toString("utf8"));
+      const body = Buffer.from(buf.subarray(8 + headLen, end));
+      buf = buf.subarray(end);
+      if (header.type === "print") {
+        chain = chain.then(() => runJob(header, body));
+      }
+    }
+  });
+  process.stdin.on("end", async () => {
+    await chain;
+    try {
+      await client.disconnect();
+    } catch (e) {
+      log(`disconnect: ${e}`);
+    }
+    process.exit(0);
+  });
+}
+
+main().catch((e) => {
+  log(`fatal: ${e?.stack ?? e}`);
+  process.exit(1);
+});
@@ -0,0 +1,266 @@
+"""
+Long-lived niimblue-node worker (used while niimblue-cli is still a backend).
+
+`niimblue-cli print ... image.png` starts Node, connects, decodes the PNG from
+disk and exits, for every label. Instead one niimblue_worker.mjs process is kept
+per printer (transport + address); jobs are streamed to it over stdin with the
+PNG bytes inline and results come back on stdout.
+
+Framing (both directions):
+    u32 BE header length | JSON header | u32 BE body length | body
+
+- start(): spawn + wait for the worker's "ready" frame (it connects once)
+- print_bytes(): send one job, wait for its result frame (start-up and the wait
+  are capped by the job's deadline)
+- a worker that exits or breaks its pipe is restarted and the job retried once
+- get_worker(): one worker per printer, shared by the whole process;
+  release_worker() stops it once the fallback is done with the printer
+"""
+
+import json
+import os
+import queue
+import shutil
+import struct
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from deadline import Deadline
+
+WORKER_SCRIPT = Path(__file__).parent / "niimblue_worker.mjs"
+NIIMBLUE_PACKAGE = "@mmote/niimblue-node"
+
+
+# -----------------------------
+# Framing
+# -----------------------------
+
+def encode_frame(header: dict, body: bytes = b"") -> bytes:
+    head = json.dumps(header).encode("utf-8")
+    return struct.pack(">I", len(head)) + head + struct.pack(">I", len(body)) + body
+
+
+def _read_exact(stream: BinaryIO, n: int) -> bytes:
+    data = b""
+    while len(data) < n:
+        chunk = stream.read(n - len(data))
+        if not chunk:
+            raise EOFError("worker closed its output")
+        data += chunk
+    return data
+
+
+def read_frame(stream: BinaryIO) -> Tuple[dict, bytes]:
+    (head_len,) = struct.unpack(">I", _read_exact(stream, 4))
+    header = json.loads(_read_exact(stream, head_len))
+    (body_len,) = struct.unpack(">I", _read_exact(stream, 4))
+    return header, _read_exact(stream, body_len) if body_len else b""
+
+
+# -----------------------------
+# Worker
+# -----------------------------
+
+def find_niimblue_module() -> Optional[str]:
+    """Path of the globally installed niimblue-node package (NIIMBLUE_NODE_MODULE overrides)."""
+    override = os.environ.get("NIIMBLUE_NODE_MODULE")
+    if override:
+        return override
+    npm = shutil.which("npm")
+    if not npm:
+        return None
+    try:
+        root = subprocess.run([npm, "root", "-g"], capture_output=True, text=True, timeout=15).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+    path = Path(root) / NIIMBLUE_PACKAGE
+    return str(path) if path.exists() else None
+
+
+@dataclass
+class WorkerConfig:
+    transport: str = "serial"          # "serial" / "ble" (niimblue transport names)
+    address: str = ""                  # COM port / BLE MAC
+    model: str = "B1"
+    start_timeout_s: float = 20.0      # spawn + connect
+    job_timeout_s: float = 40.0
+    max_restarts: int = 3              # consecutive failed starts before backing off
+    retry_after_s: float = 60.0        # then wait this long before trying again
+
+
+class WorkerError(RuntimeError):
+    pass
+
+
+class NiimblueWorker:
+    def __init__(self, config: WorkerConfig, command: Optional[List[str]] = None):
+        """
+        `command` replaces the default `node niimblue_worker.mjs ...` argv
+        (benchmarks and tests use a stub worker).
+        """
+        self.config = config
+        self.command = command
+        self.restarts = 0
+        self.jobs = 0
+        self._proc: Optional[subprocess.Popen] = None
+        self._replies: "queue.Queue[Optional[dict]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self._failed_starts = 0
+        self._gave_up_at = 0.0
+
+    def _argv(self) -> List[str]:
+        if self.command:
+            return list(self.command)
+        node = shutil.which("node")
+        if not node:
+            raise WorkerError("Node.js not found")
+        cfg = self.config
+        argv = [node, str(WORKER_SCRIPT), "--transport", cfg.transport, "--address", cfg.address,
+                "--model", cfg.model]
+        module = find_niimblue_module()
+        if module:
+            argv += ["--module", module]
+        return argv
+
+    @property
+    def alive(self) -> bool:
+        return self._proc is not None and self._proc.poll() is None
+
+    @staticmethod
+    def _reader(proc: subprocess.Popen, replies: "queue.Queue[Optional[dict]]"):
+        # Each process gets its own queue, so a dying worker can't confuse its successor
+        try:
+            while True:
+                header, _body = read_frame(proc.stdout)
+                replies.put(header)
+        except (EOFError, ValueError, OSError):
+            pass
+        finally:
+            replies.put(None)  # worker gone
+
+    def start(self, deadline: Optional[Deadline] = None):
+        """Spawn the worker and wait until it reports the printer connected."""
+        deadline = deadline or Deadline(None)
+        if self.alive:
+            return
+        if self._failed_starts >= self.config.max_restarts:
+            if time.monotonic() - self._gave_up_at < self.config.retry_after_s:
+                raise WorkerError(f"worker failed to start {self._failed_starts} times")
+            self._failed_starts = 0
+
+        self._replies = queue.Queue()
+        try:
+            proc = subprocess.Popen(self._argv(), stdin=subprocess.PIPE, stdout=subprocess.PIPE, bufsize=0)
+        except OSError as e:
+            self._start_failed()
+            raise WorkerError(f"cannot start worker: {e}") from e
+        threading.Thread(target=self._reader, args=(proc, self._replies), daemon=True).start()
+        self._proc = proc
+
+        try:
+            reply = self._replies.get(timeout=deadline.cap(self.config.start_timeout_s))
+        except queue.Empty:
+            reply = None
+        if not reply or reply.get("type") != "ready":
+            self.stop()
+            if reply is None and deadline.expired:
+                raise deadline.exceeded()  # out of time, not the worker's fault
+            self._start_failed()
+            raise WorkerError(f"worker did not become ready ({self.config.transport} {self.config.address})")
+        self._failed_starts = 0
+        print(f"🟢 niimblue worker ready ({self.config.transport} {self.config.address})")
+
+    def _start_failed(self):
+        self._failed_starts += 1
+        self._gave_up_at = time.monotonic()
+
+    def stop(self):
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        try:
+            proc.stdin.close()
+            proc.wait(timeout=5)
+        except Exception:
+            proc.kill()
+
+    def _submit(self, png: bytes, options: dict, deadline: Deadline) -> Tuple[bool, str]:
+        job_id = self._next_id
+        self._next_id += 1
+        self._proc.stdin.write(encode_frame({"type": "print", "id": job_id, **options}, png))
+
+        while True:
+            try:
+                reply = self._replies.get(timeout=deadline.cap(self.config.job_timeout_s))
+            except queue.Empty:
+                self.stop()  # a stuck worker is restarted on the next job
+                if deadline.expired:
+                    raise deadline.exceeded() from None
+                return False, "niimblue worker timed out"
+            if reply is None:
+                raise BrokenPipeError("worker exited during the job")
+            if reply.get("type") == "result" and reply.get("id") == job_id:
+                return bool(reply.get("ok")), reply.get("error") or "printed"
+
+    def print_bytes(self, png: bytes, *, deadline: Optional[Deadline] = None, **options) -> Tuple[bool, str]:
+        """
+        Print one PNG (bytes). Restarts a crashed worker and retries once.
+        Waiting for the worker, its start-up and the job are all capped by
+        `deadline` (DeadlineExceeded once it runs out).
+        """
+        deadline = deadline or Deadline(None)
+        if not self._lock.acquire(timeout=deadline.cap(threading.TIMEOUT_MAX)):
+            raise deadline.exceeded()
+        try:
+            for _ in range(2):
+                try:
+                    self.start(deadline)
+                    ok, message = self._submit(png, options, deadline)
+                    self.jobs += ok
+                    return ok, message
+                except (BrokenPipeError, OSError) as e:
+                    print(f"⚠️  niimblue worker crashed ({e}), restarting...")
+                    self.stop()
+                    self.restarts += 1
+            return False, "niimblue worker crashed twice"
+        finally:
+            self._lock.release()
+
+    def print_file(self, image_path: str, *, deadline: Optional[Deadline] = None, **options) -> Tuple[bool, str]:
+        return self.print_bytes(Path(image_path).read_bytes(), deadline=deadline, **options)
+
+
+_workers: Dict[Tuple[str, str], NiimblueWorker] = {}
+_workers_lock = threading.Lock()
+
+
+def get_worker(transport: str, address: str, model: str = "B1") -> NiimblueWorker:
+    """One worker per printer, shared by the whole process."""
+    with _workers_lock:
+        key = (transport, address)
+        if key not in _workers:
+            _workers[key] = NiimblueWorker(WorkerConfig(transport=transport, address=address, model=model))
+        return _workers[key]
+
+
+def release_worker(transport: str, address: str):
+    """
+    Stop and drop the worker for one printer, so the native sessions can
+    connect to it again (the worker holds its BLE link / COM port while alive).
+    """
+    with _workers_lock:
+        worker = _workers.pop((transport, address), None)
+    if worker is not None:
+        worker.stop()
+
+
+def stop_all():
+    with _workers_lock:
+        for worker in _workers.values():
+            worker.stop()
+        _workers.clear()
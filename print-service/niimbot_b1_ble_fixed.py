@@ -8,44 +8,40 @@ This script is designed to be drop-in for your label system:
 - Takes any image, pads to 384px width, prints at original height
 - Uses simple run-length encoding (repeat > 1) to reduce BLE traffic
 - Includes verbose TX/RX logging optional
+- Reuses one BLE connection across labels (ble_session.B1Session)
+- Handshake commands wait for the printer's reply (command_link.CommandLink)
+- Prints a list of different labels as one multi-page job (print_pages_ble)
+- Survives a BLE drop mid-job: reconnects and restarts at the current page
 
 ⚠️ You MUST use the correct BLE service/characteristic UUIDs for your B1.
-The defaults below match your uploaded diagnostic scripts.
+The defaults (in ble_session.py) match your uploaded diagnostic scripts.
 """
 
 import asyncio
-import math
 import struct
-from dataclasses import dataclass
+import time
+from dataclasses import dataclass, field, replace
 from typing import List, Optional, Tuple
 
-from bleak import BleakClient, BleakScanner
 from PIL import Image, ImageOps
 
-# Your current scripts use these UUIDs:
-SERVICE_UUID = "e7810a71-73ae-499d-8c15-faa9aef0c3f2"
-CHAR_UUID = "bef8d6c9-9c21-4c9e-b632-bd58c1009f9f"
+import rowops
+from ble_session import B1Session, LinkDropped, SessionConfig
+from flow_control import AdaptivePacer, FlowConfig, RowTransmitter, pages_printed, wait_pages
+from command_link import CommandConfig, CommandLink
+from deadline import Deadline, DeadlineExceeded
+from niimbot_protocol import (CMD_HEARTBEAT, CMD_PAGE_END, CMD_PAGE_START, CMD_PRINT_END, CMD_PRINT_START,
+                              CMD_SET_DENSITY, CMD_SET_LABEL_TYPE, CMD_SET_PAGE_SIZE, CMD_SET_QUANTITY, PrinterError,
+                              Response, make_packet)
+from print_progress import Progress, page_counter
 
 TARGET_WIDTH_DOTS = 384  # B1 printhead width in dots (48mm @ 203dpi)
+PRINT_END_TIMEOUT_S = 1.0  # closing a rejected / timed-out job is best effort
 
 # -----------------------------
 # Packet helpers
 # -----------------------------
 
-def make_packet(command: int, data: bytes = b"") -> bytes:
-    """
-    Niimbot packet format:
-    0x55 0x55 | cmd (1B) | len (1B) | data (len) | checksum XOR(cmd,len,data) (1B) | 0xAA 0xAA
-    """
-    if len(data) > 255:
-        raise ValueError(f"Data too long for 1-byte length: {len(data)}")
-    payload = bytes([command, len(data)]) + data
-    checksum = 0
-    for b in payload:
-        checksum ^= b
-    return b"\x55\x55" + payload + bytes([checksum]) + b"\xAA\xAA"
-
-
 def _bitcount_bytes(b: bytes) -> int:
     return sum(byte.bit_count() for byte in b)
 
@@ -106,36 +102,28 @@ def image_to_rows(image_path: str, *, target_width: int = TARGET_WIDTH_DOTS) ->
     """
     img = Image.open(image_path).convert("L")
 
-    # Force width to 384 dots by padding (don't rescale)
-    if img.width != target_width:
-        new_img = Image.new("L", (target_width, img.height), 255)  # white
-        x_offset = (target_width - img.width) // 2
-        new_img.paste(img, (x_offset, 0))
-        img = new_img
-
-    width, height = img.size
-
     # Critical: invert BEFORE converting to 1-bit (matches NiimPrintX/niimprint approach)
-    img = ImageOps.invert(img).convert("1")
+    # After invert+1bit a set bit means "print"
+    rows, src_width, height = rowops.from_1bit(ImageOps.invert(img).convert("1"))
 
-    pixels = list(img.getdata())  # 0 or 255
-    rows: List[bytes] = []
+    # Force width to 384 dots by padding (don't rescale) - done on the packed rows
+    rows = rowops.pad_center(rows, src_width, target_width)
+    return rows, target_width, height
 
-    bytes_per_row = width // 8
-    for y in range(height):
-        row_bytes = bytearray(bytes_per_row)
-        base = y * width
-        for bx in range(bytes_per_row):
-            v = 0
-            for bit in range(8):
-                px = pixels[base + bx * 8 + bit]
-                # After invert+1bit: 255 means "print"
-                if px == 255:
-                    v |= (1 << (7 - bit))
-            row_bytes[bx] = v
-        rows.append(bytes(row_bytes))
 
-    return rows, width, height
+def adjust_rows(rows: List[bytes], config: "B1Config") -> List[bytes]:
+    """
+    Apply per-printer calibration to already-packed rows (no PIL round-trip):
+    head offset, blank margins and mirrored media.
+    """
+    if config.offset_x_dots or config.offset_y_rows:
+        rows = rowops.shift(rows, config.offset_x_dots, config.offset_y_rows)
+    if config.margin_dots:
+        m = config.margin_dots
+        rows = rowops.crop(rows, left=m, right=m)
+    if config.mirror:
+        rows = rowops.flip_h(rows)
+    return rows
 
 
 # -----------------------------
@@ -147,119 +135,359 @@ class B1Config:
     density: int = 3          # 0..?
     label_type: int = 1       # 1/2 depending on continuous vs gap labels
     copies: int = 1
-    inter_packet_delay_s: float = 0.006  # data pacing (tune if needed)
-    finalize_delay_s: float = 1.0
+    flow_window_rows: int = 32           # starting rows in flight per PrintStatus round-trip (0 = timed pacing only)
+    adaptive_pacing: bool = True         # tune the window per printer (AIMD) and remember it
+    inter_packet_delay_s: float = 0.006  # per-row pacing, only while the printer gives no feedback
+    finalize_delay_s: float = 1.0        # page-end wait, only if PrintStatus goes unanswered
+    pages_ahead: int = 1                 # pages sent ahead of the printer's page counter (multi-page jobs)
+    max_recoveries: int = 2              # reconnect + resume after a BLE drop, per job
     verbose: bool = True
-    # Some models drop the first packet after PrintStart when using BLE; sending SetPageSize twice is a safe workaround.
+    # Some models drop the first packet after PrintStart when using BLE. Replies normally
+    # catch that (the command is resent); only a silent printer gets SetPageSize twice.
     send_pagesize_twice: bool = True
+    # Calibration applied to packed rows (see adjust_rows)
+    offset_x_dots: int = 0    # + moves the print right
+    offset_y_rows: int = 0    # + moves the print down
+    margin_dots: int = 0      # blank dots kept clear on both edges
+    mirror: bool = False      # mirrored / transfer media
 
 
-async def _send(client: BleakClient, packet: bytes, *, delay_s: float = 0.0, verbose: bool = False):
-    if verbose:
-        print(f"TX: {packet.hex()}")
-    await client.write_gatt_char(CHAR_UUID, packet, response=False)
-    if delay_s:
-        await asyncio.sleep(delay_s)
+@dataclass
+class EncodedPage:
+    packets: List[bytes]      # 0x85 row packets (RLE-compressed)
+    width: int
+    height: int
+    copies: int = 1
 
 
-async def print_image_ble(image_path: str, *, config: Optional[B1Config] = None, device_name_hint: str = "B1") -> bool:
-    """
-    Main entry point: prints a single image as one label.
-    """
-    config = config or B1Config()
-
+def encode_page(image_path: str, config: "B1Config", copies: int = 1) -> EncodedPage:
     rows, width, height = image_to_rows(image_path)
+    rows = adjust_rows(rows, config)
     rle = rle_rows(rows)
-
     if config.verbose:
         print(f"Image prepared: {width}x{height} dots, rows={len(rows)}, rle_packets={len(rle)}")
+    packets = [pack_bitmap_row(row_index, row_bytes, repeat=repeat) for (row_index, row_bytes, repeat) in rle]
+    return EncodedPage(packets, width, height, max(1, copies))
 
-    devices = await BleakScanner.discover(timeout=5.0)
-    target = next((d for d in devices if d.name and device_name_hint in d.name), None)
-    if not target:
-        print("❌ Printer not found (scan).")
-        return False
 
-    rx_queue: asyncio.Queue[bytes] = asyncio.Queue()
+def labels_done(pages: List[EncodedPage], printed: int) -> int:
+    """How many pages (with all their copies) a page counter of `printed` covers."""
+    done = total = 0
+    for page in pages:
+        total += page.copies
+        if total > printed:
+            break
+        done += 1
+    return done
 
-    def on_notify(_: int, data: bytearray):
-        # You can parse these later; for now just log + store
-        if config.verbose:
-            print(f"RX: {bytes(data).hex()}")
-        try:
-            rx_queue.put_nowait(bytes(data))
-        except asyncio.QueueFull:
-            pass
 
-    try:
-        async with BleakClient(target.address, timeout=30.0) as client:
-            if config.verbose:
-                print(f"✅ Connected: {target.name} ({target.address})")
+async def print_image_ble(image_path: str, *, config: Optional[B1Config] = None, device_name_hint: str = "B1",
+                          session: Optional[B1Session] = None, copies: Optional[int] = None) -> bool:
+    """
+    Main entry point: prints a single image as one label, `copies` times
+    (default config.copies) in one job: the page is encoded and sent once.
 
-            await client.start_notify(CHAR_UUID, on_notify)
+    Pass a long-lived `session` to reuse its connection (no scan/connect per label);
+    without one a temporary session is opened and closed around the job.
+    """
+    config = config or B1Config()
+    page = encode_page(image_path, config, copies or config.copies)
+    return await print_pages_ble([page], config=config, device_name_hint=device_name_hint, session=session) == 1
 
-            # ---- Init / handshake ----
-            # Heartbeat
-            await _send(client, make_packet(0xDC, b"\x01"), delay_s=0.10, verbose=config.verbose)
 
-            # Density
-            await _send(client, make_packet(0x21, bytes([config.density & 0xFF])), delay_s=0.10, verbose=config.verbose)
+@dataclass
+class JobProgress:
+    """Where one attempt of a job got to; what a recovery after a link drop starts from."""
+    printed: int = 0      # printer's page counter
+    pages_sent: int = 0   # pages completely sent (PageEnd)
+    rows_sent: int = 0    # rows of the page being sent
+    rows_acked: int = 0   # ... of which the printer confirmed taking
 
-            # Label Type
-            await _send(client, make_packet(0x23, bytes([config.label_type & 0xFF])), delay_s=0.10, verbose=config.verbose)
 
-            # PrintStart (8 bytes): totalPages + padding + 0x01
-            # (Matches niimblue/niimbluelib 8-byte variant)
-            total_pages = 1
-            printstart = struct.pack(">H", total_pages) + b"\x00\x00\x00\x00\x00\x01"
-            await _send(client, make_packet(0x01, printstart), delay_s=0.20, verbose=config.verbose)
+@dataclass
+class BatchProgress:
+    """
+    Where a print_pages_ble() call got to, across its attempts. Pass one in to
+    read `labels_done` even if the job is cancelled before it returns.
+    """
+    done: int = 0                                               # labels confirmed by earlier attempts
+    remaining: List[EncodedPage] = field(default_factory=list)  # pages the current attempt prints
+    attempt: JobProgress = field(default_factory=JobProgress)
 
-            # PageStart (many scripts use 0x03 0x01 before data)
-            await _send(client, make_packet(0x03, b"\x01"), delay_s=0.10, verbose=config.verbose)
+    @property
+    def labels_done(self) -> int:
+        return self.done + labels_done(self.remaining, self.attempt.printed)
 
-            # SetPageSize (11 bytes):
-            # rows(u16), cols(u16), copiesCount(u16), 0x00000000, 0x01
-            pagesize = struct.pack(">HHH", height, width, config.copies) + b"\x00\x00\x00\x00\x01"
-            await _send(client, make_packet(0x13, pagesize), delay_s=0.10, verbose=config.verbose)
-            if config.send_pagesize_twice:
-                await _send(client, make_packet(0x13, pagesize), delay_s=0.10, verbose=config.verbose)
 
-            # SetQuantity (u16) — keep, since your attempts used it
-            await _send(client, make_packet(0x15, struct.pack(">H", config.copies)), delay_s=0.10, verbose=config.verbose)
+def remaining_pages(pages: List[EncodedPage], printed: int) -> Tuple[int, List[EncodedPage]]:
+    """
+    (labels done, pages still to print) for a page counter of `printed`; copies
+    of a half-done page that already printed are taken off it.
+    """
+    done = labels_done(pages, printed)
+    rest = list(pages[done:])
+    if rest:
+        copies_done = printed - sum(p.copies for p in pages[:done])
+        if copies_done:
+            rest[0] = replace(rest[0], copies=rest[0].copies - copies_done)
+    return done, rest
+
+
+async def _run_job(session: B1Session, commands: CommandLink, pages: List[EncodedPage], config: B1Config,
+                   progress: JobProgress, deadline: Deadline, tracker: Optional[Progress] = None,
+                   first_label: int = 0, labels: int = 0) -> int:
+    total_pages = sum(p.copies for p in pages)
+    silent = False      # printer never answers PrintStatus: fall back to fixed delays
+
+    # ---- Init / handshake (once per job) ----
+    deadline.enter("handshake")
+    # Heartbeat
+    await commands.request(CMD_HEARTBEAT, b"\x01")
+
+    # Density
+    await commands.request(CMD_SET_DENSITY, bytes([config.density & 0xFF]))
+
+    # Label Type
+    await commands.request(CMD_SET_LABEL_TYPE, bytes([config.label_type & 0xFF]))
+
+    # PrintStart (8 bytes): totalPages + padding + 0x01
+    # (Matches niimblue/niimbluelib 8-byte variant; every copy is a page)
+    printstart = struct.pack(">H", total_pages) + b"\x00\x00\x00\x00\x00\x01"
+    await commands.request(CMD_PRINT_START, printstart)
+    silent = commands.silent
+
+    # Paced by printer feedback (PrintStatus credit window), starting from the
+    # window last tuned for this printer; inter_packet_delay_s is only used if
+    # the printer stays silent
+    flow = FlowConfig(window_rows=config.flow_window_rows, fallback_delay_s=config.inter_packet_delay_s)
+    pacer = None
+    if config.adaptive_pacing and config.flow_window_rows:
+        pacer = AdaptivePacer.for_printer(session.registry, session.address, "ble",
+                                          default_window=config.flow_window_rows)
+    transmitter = RowTransmitter(session.write, session.rx, flow, verbose=config.verbose,
+                                 pacer=pacer, write_many=session.write_many)
+
+    for index, page in enumerate(pages):
+        deadline.enter("transmit")
+        # Don't run more than `pages_ahead` pages ahead of the print head
+        behind = sum(p.copies for p in pages[:max(0, index - config.pages_ahead)])
+        if progress.printed < behind and not silent:
+            status = await wait_pages(session.write, session.rx, pages=behind, timeout_s=10.0, deadline=deadline)
+            if status is None:
+                silent = True
+            else:
+                progress.printed = pages_printed(status, behind)
+                if progress.printed < behind:
+                    print(f"❌ Printer stuck at page {progress.printed}/{total_pages}")
+                    break
+        if silent and index:
+            await asyncio.sleep(config.finalize_delay_s * pages[index - 1].copies)
+
+        # PageStart (many scripts use 0x03 0x01 before data)
+        await commands.request(CMD_PAGE_START, b"\x01")
+
+        # SetPageSize (11 bytes):
+        # rows(u16), cols(u16), copiesCount(u16), 0x00000000, 0x01
+        pagesize = struct.pack(">HHH", page.height, page.width, page.copies) + b"\x00\x00\x00\x00\x01"
+        await commands.request(CMD_SET_PAGE_SIZE, pagesize)
+        if config.send_pagesize_twice and commands.silent and index == 0:
+            await commands.request(CMD_SET_PAGE_SIZE, pagesize)
+
+        # SetQuantity (u16) — keep, since your attempts used it
+        await commands.request(CMD_SET_QUANTITY, struct.pack(">H", page.copies))
+
+        # ---- Data ----
+        if config.verbose:
+            print(f"📤 Sending bitmap rows (page {index + 1}/{len(pages)})...")
+        if tracker:
+            tracker.start_label(first_label + index, labels or len(pages), len(page.packets))
+        try:
+            stats = await transmitter.send(page.packets, progress=tracker.rows if tracker else None,
+                                           deadline=deadline)
+        finally:
+            progress.rows_sent, progress.rows_acked = transmitter.stats.sent, transmitter.stats.acked
+            progress.printed = max(progress.printed, transmitter.stats.printed)
 
-            # ---- Data ----
-            if config.verbose:
-                print("📤 Sending bitmap rows...")
+        if config.verbose:
+            mode = "timed" if stats.timed_mode else "feedback"
+            tuned = f", window {pacer.window_rows}" if pacer else ""
+            link = session.link
+            print(f"✅ Data sent in {stats.elapsed_s:.2f}s ({mode} pacing, {stats.acks} acks{tuned}, "
+                  f"{link.frames_per_write:.1f} frames/write).")
+
+        await commands.request(CMD_PAGE_END, b"\x01")
+        progress.pages_sent += 1
+        progress.rows_sent = progress.rows_acked = 0
+
+    # Wait until the printer reports every page/copy that was sent done
+    sent_pages = sum(p.copies for p in pages[:progress.pages_sent])
+    if config.verbose:
+        print("Finalizing...")
+    deadline.enter("printing")
+    if tracker:
+        tracker.stage("printing")
+    status = None if silent else await wait_pages(session.write, session.rx, pages=sent_pages,
+                                                  timeout_s=10.0, deadline=deadline)
+    if status is None:
+        await asyncio.sleep(config.finalize_delay_s * pages[-1].copies)
+        progress.printed = sent_pages  # nothing to check against
+    else:
+        progress.printed = pages_printed(status, sent_pages)
+        if progress.printed < total_pages:
+            deadline.check()  # cut short by the deadline rather than a stuck printer
+            print(f"❌ Printer reported {progress.printed}/{total_pages} pages done")
+        elif pacer:
+            pacer.save()  # only pages that printed count as known-good
+
+    # PrintEnd
+    await commands.request(CMD_PRINT_END, b"\x01")
+    return labels_done(pages, progress.printed)
+
+
+async def _connect(session: B1Session, deadline: Deadline, stage: str):
+    deadline.enter(stage)
+    try:
+        await asyncio.wait_for(session.ensure_connected(), deadline.timeout())
+    except asyncio.TimeoutError:
+        if deadline.expired:
+            raise deadline.exceeded() from None
+        raise
+
+
+async def _recover(session: B1Session, pages: List[EncodedPage], progress: JobProgress,
+                   error: Exception, deadline: Deadline) -> Tuple[int, List[EncodedPage]]:
+    # The printer drops its job with the link: reconnect (cached address first)
+    # and go on from the first page it hasn't confirmed, still encoded in `pages`
+    t0 = time.monotonic()
+    page = progress.pages_sent + 1
+    print(f"⚠️  {error} at page {min(page, len(pages))}/{len(pages)}, row {progress.rows_sent} "
+          f"({progress.rows_acked} acked); reconnecting...")
+    await _connect(session, deadline, "reconnect")
+    elapsed = time.monotonic() - t0
+
+    done, rest = remaining_pages(pages, progress.printed)
+    resent = sum(len(p.packets) for p in pages[done:progress.pages_sent]) + progress.rows_sent
+    session.recoveries += 1
+    session.rows_resent += resent
+    session.last_recovery_s = elapsed
+    print(f"🔁 Reconnected in {elapsed:.2f}s; restarting at page {done + 1}/{len(pages)} "
+          f"({resent} rows sent again)")
+    return done, rest
+
+
+async def _end_job(session: B1Session):
+    if not session.connected:
+        return
+    try:
+        await asyncio.wait_for(session.write(make_packet(CMD_PRINT_END, b"\x01")), PRINT_END_TIMEOUT_S)
+    except Exception:
+        pass
 
-            for (row_index, row_bytes, repeat) in rle:
-                pkt = pack_bitmap_row(row_index, row_bytes, repeat=repeat)
-                await _send(client, pkt, delay_s=config.inter_packet_delay_s, verbose=False)
 
-            if config.verbose:
-                print("✅ Data sent. Finalizing...")
+async def print_pages_ble(pages: List[EncodedPage], *, config: Optional[B1Config] = None,
+                          device_name_hint: str = "B1", session: Optional[B1Session] = None,
+                          tracker: Optional[Progress] = None, deadline: Optional[Deadline] = None,
+                          batch: Optional[BatchProgress] = None) -> int:
+    """
+    Print different pages in one print job: one handshake and PrintStart with
+    totalPages (= all copies), then PageStart/SetPageSize/rows/PageEnd per page.
+    Page k+1 is transmitted while page k prints; no more than
+    `config.pages_ahead` pages are sent ahead of the printer's page counter.
+
+    If the BLE link drops mid-job (up to `config.max_recoveries` times) the
+    session reconnects and a new job restarts at the first page the printer
+    hadn't confirmed; pages that printed but weren't confirmed yet are printed
+    again rather than lost.
+
+    Returns how many pages (with all their copies) the printer confirmed.
+    Raises PrinterError (with `labels_done`) if the printer rejects the job,
+    DeadlineExceeded (same) if `deadline` runs out first. `tracker`
+    (print_progress) gets label / row / page counter progress; `batch` is kept
+    up to date for a caller that may have to cancel the job.
+    """
+    config = config or B1Config()
+    deadline = deadline or Deadline(None)
+    if not pages:
+        return 0
 
-            await asyncio.sleep(config.finalize_delay_s)
+    own_session = session is None
+    if own_session:
+        session = B1Session(SessionConfig(name_hint=device_name_hint, verbose=config.verbose))
 
-            # PageEnd + PrintEnd
-            await _send(client, make_packet(0xE3, b"\x01"), delay_s=0.40, verbose=config.verbose)
-            await _send(client, make_packet(0xF3, b"\x01"), delay_s=0.40, verbose=config.verbose)
+    def log_rx(resp: Response):
+        print(f"RX: {resp}")
 
-            await asyncio.sleep(0.5)
-            await client.stop_notify(CHAR_UUID)
+    if config.verbose:
+        session.rx.subscribe(log_rx)
 
-            if config.verbose:
-                print("✅ Done.")
-            return True
+    batch = batch or BatchProgress()
+    batch.done, batch.remaining = 0, pages   # done: confirmed by earlier attempts (before a link drop)
+    total_pages = sum(p.copies for p in pages)
+    recoveries = 0
 
+    try:
+        await _connect(session, deadline, "connect")
+        async with session.job():
+            try:
+                while True:
+                    batch.attempt = progress = JobProgress()
+                    remaining = batch.remaining
+                    # Every step waits for its reply instead of a fixed sleep; an error
+                    # frame from the printer (cover open, no paper...) aborts the job at once
+                    printed_before = total_pages - sum(p.copies for p in remaining)
+                    try:
+                        with CommandLink(session.write, session.rx, CommandConfig(verbose=config.verbose),
+                                     deadline) as commands, \
+                                page_counter(tracker, session.rx, total_pages, printed_before):
+                            batch.done += await _run_job(session, commands, remaining, config, progress, deadline,
+                                                         tracker, len(pages) - len(remaining), len(pages))
+                            batch.remaining = []
+                            break
+                    except LinkDropped as e:
+                        if recoveries >= config.max_recoveries:
+                            raise
+                        recoveries += 1
+                        more, rest = await _recover(session, remaining, progress, e, deadline)
+                        batch.done += more
+                        batch.remaining = rest
+                        batch.attempt = JobProgress()
+                        if not rest:
+                            break
+            except (PrinterError, DeadlineExceeded):
+                # Nothing more goes out for a rejected (or timed out) job; close it on the
+                # printer while the link is still ours, never reconnecting just for that
+                await _end_job(session)
+                raise
+
+        if config.verbose and batch.done == len(pages):
+            print(f"✅ Done ({len(pages)} {'page' if len(pages) == 1 else 'pages'}, {total_pages} printed).")
+        return batch.done
+
+    except (PrinterError, DeadlineExceeded) as e:
+        print(f"❌ Printer error: {e.message}" if isinstance(e, PrinterError) else f"❌ {e}")
+        e.labels_done = batch.labels_done
+        raise
     except Exception as e:
         print(f"❌ Error: {e}")
-        return False
+        return batch.labels_done
+    finally:
+        session.rx.unsubscribe(log_rx)
+        if own_session:
+            await session.close()
+
+
+async def print_images_ble(image_paths: List[str], *, config: Optional[B1Config] = None,
+                           device_name_hint: str = "B1") -> int:
+    """Print several labels as one multi-page job. Returns how many printed."""
+    config = config or B1Config()
+    pages = [encode_page(path, config, config.copies) for path in image_paths]
+    return await print_pages_ble(pages, config=config, device_name_hint=device_name_hint)
 
 
 if __name__ == "__main__":
     import sys
 
-    image_path = sys.argv[1] if len(sys.argv) > 1 else "test_black.png"
+    image_paths = sys.argv[1:] or ["test_black.png"]
 
     # Quick defaults for sticker labels:
     # - label_type=1 or 2 (try 2 if you're using die-cut labels with gaps)
@@ -272,4 +500,4 @@ if __name__ == "__main__":
         send_pagesize_twice=True,
     )
 
-    asyncio.run(print_image_ble(image_path, config=cfg))
+    asyncio.run(print_images_ble(image_paths, config=cfg))
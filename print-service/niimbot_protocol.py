@@ -0,0 +1,563 @@
+"""
+NIIMBOT wire protocol shared by the BLE and USB print paths.
+
+Frame layout (both directions):
+0x55 0x55 | cmd (1B) | len (1B) | data (len) | checksum XOR(cmd,len,data) (1B) | 0xAA 0xAA
+
+- make_packet(): builds outgoing frames; row_packet_load() reads back the rows/dots
+  a row packet will print (used for pacing)
+- FrameDecoder: incremental RX decoder that reassembles frames split (or merged)
+  across BLE notifications and serial reads, and drops frames with bad checksums
+- parse_response(): turns a decoded Frame into a typed response
+- is_reply(): whether a response answers a given request (command_link.py)
+- ResponseDispatcher: decoder + typed callbacks, usable directly as a bleak
+  notification handler
+
+Decoding never walks the buffer byte by byte in Python: headers are located with
+bytearray.find() and checksums are folded as big integers, so a notification costs
+a handful of C-level operations regardless of its size.
+"""
+
+import asyncio
+import struct
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+HEAD = b"\x55\x55"
+TAIL = b"\xAA\xAA"
+MIN_FRAME_LEN = 7  # head(2) + cmd + len + checksum + tail(2)
+
+# -----------------------------
+# Command codes
+# -----------------------------
+
+# Requests (host -> printer)
+CMD_PRINT_START = 0x01
+CMD_PAGE_START = 0x03
+CMD_SET_PAGE_SIZE = 0x13
+CMD_SET_QUANTITY = 0x15
+CMD_RFID_INFO = 0x1A
+CMD_SET_DENSITY = 0x21
+CMD_SET_LABEL_TYPE = 0x23
+CMD_PRINTER_INFO = 0x40
+CMD_PRINT_EMPTY_ROW = 0x84
+CMD_PRINT_BITMAP_ROW = 0x85
+CMD_PRINT_STATUS = 0xA3
+CMD_CONNECT = 0xC1
+CMD_CANCEL_PRINT = 0xDA
+CMD_HEARTBEAT = 0xDC
+CMD_PAGE_END = 0xE3
+CMD_PRINT_END = 0xF3
+
+# Responses (printer -> host)
+RESP_NOT_SUPPORTED = 0x00
+RESP_PRINT_START = 0x02
+RESP_PAGE_START = 0x04
+RESP_SET_PAGE_SIZE = 0x14
+RESP_SET_QUANTITY = 0x16
+RESP_RFID_INFO = 0x1B
+RESP_SET_DENSITY = 0x31
+RESP_SET_LABEL_TYPE = 0x33
+RESP_PRINTER_INFO_BASE = 0x40  # response = 0x40 + info key
+RESP_PRINT_STATUS = 0xB3
+RESP_CONNECT = 0xC2
+RESP_CANCEL_PRINT = 0xD0
+RESP_HEARTBEAT_ADVANCED_2 = 0xD9
+RESP_PRINT_ERROR = 0xDB
+RESP_HEARTBEAT_ADVANCED_1 = 0xDD
+RESP_HEARTBEAT_UNKNOWN = 0xDE
+RESP_HEARTBEAT_BASIC = 0xDF
+RESP_PAGE_END = 0xE4
+RESP_PRINT_END = 0xF4
+
+HEARTBEAT_RESPONSES = (
+    RESP_HEARTBEAT_ADVANCED_1,
+    RESP_HEARTBEAT_ADVANCED_2,
+    RESP_HEARTBEAT_UNKNOWN,
+    RESP_HEARTBEAT_BASIC,
+)
+
+# Simple "set/step" commands that answer with a single status byte (1 = ok)
+ACK_RESPONSES = (
+    RESP_PRINT_START,
+    RESP_PAGE_START,
+    RESP_SET_PAGE_SIZE,
+    RESP_SET_QUANTITY,
+    RESP_SET_DENSITY,
+    RESP_SET_LABEL_TYPE,
+    RESP_CONNECT,
+    RESP_CANCEL_PRINT,
+    RESP_PAGE_END,
+    RESP_PRINT_END,
+)
+
+# Request -> the response code that answers it (heartbeat and printer info are
+# matched by type/key in is_reply())
+REPLY_FOR = {
+    CMD_PRINT_START: RESP_PRINT_START,
+    CMD_PAGE_START: RESP_PAGE_START,
+    CMD_SET_PAGE_SIZE: RESP_SET_PAGE_SIZE,
+    CMD_SET_QUANTITY: RESP_SET_QUANTITY,
+    CMD_RFID_INFO: RESP_RFID_INFO,
+    CMD_SET_DENSITY: RESP_SET_DENSITY,
+    CMD_SET_LABEL_TYPE: RESP_SET_LABEL_TYPE,
+    CMD_PRINT_STATUS: RESP_PRINT_STATUS,
+    CMD_CONNECT: RESP_CONNECT,
+    CMD_CANCEL_PRINT: RESP_CANCEL_PRINT,
+    CMD_PAGE_END: RESP_PAGE_END,
+    CMD_PRINT_END: RESP_PRINT_END,
+}
+
+# Info keys for CMD_PRINTER_INFO (same table as get_printer_info.py)
+INFO_DENSITY = 1
+INFO_PRINT_SPEED = 2
+INFO_LABEL_TYPE = 3
+INFO_LANGUAGE = 6
+INFO_AUTO_SHUTDOWN = 7
+INFO_DEVICE_TYPE = 8
+INFO_SOFTWARE_VERSION = 9
+INFO_BATTERY = 10
+INFO_SERIAL = 11
+INFO_HARDWARE_VERSION = 12
+
+INFO_NAMES = {
+    INFO_DENSITY: "Density",
+    INFO_PRINT_SPEED: "Print Speed",
+    INFO_LABEL_TYPE: "Label Type",
+    INFO_LANGUAGE: "Language Type",
+    INFO_AUTO_SHUTDOWN: "Auto Shutdown Time",
+    INFO_DEVICE_TYPE: "Device Type",
+    INFO_SOFTWARE_VERSION: "Software Version",
+    INFO_BATTERY: "Battery",
+    INFO_SERIAL: "Device Serial",
+    INFO_HARDWARE_VERSION: "Hardware Version",
+}
+
+# Error codes carried by RESP_PRINT_ERROR (niimbluelib PrinterErrorCode)
+PRINTER_ERRORS = {
+    0x01: "Cover open",
+    0x02: "No paper",
+    0x03: "Low battery",
+    0x04: "Battery fault",
+    0x05: "Cancelled on printer",
+    0x06: "Data error",
+    0x07: "Print head overheated",
+    0x08: "Paper feed error",
+    0x09: "Printer busy",
+    0x0A: "No print head",
+    0x0B: "Temperature too low",
+    0x0C: "Print head loose",
+    0x0D: "No ribbon",
+    0x0E: "Wrong ribbon",
+    0x0F: "Used ribbon",
+    0x10: "Wrong label type",
+}
+
+# Stable names for the API (/print-label "error_code")
+PRINTER_ERROR_KINDS = {
+    0x01: "cover_open",
+    0x02: "no_paper",
+    0x03: "low_battery",
+    0x04: "battery_fault",
+    0x05: "cancelled",
+    0x06: "data_error",
+    0x07: "overheated",
+    0x08: "paper_feed_error",
+    0x09: "busy",
+    0x0A: "no_print_head",
+    0x0B: "temperature_too_low",
+    0x0C: "print_head_loose",
+    0x0D: "no_ribbon",
+    0x0E: "wrong_ribbon",
+    0x0F: "used_ribbon",
+    0x10: "wrong_label_type",
+}
+
+
+# -----------------------------
+# Packet helpers
+# -----------------------------
+
+def xor_checksum(data: bytes) -> int:
+    """
+    XOR of all bytes in `data`.
+
+    Folds the buffer as one big integer (halving its width each step) instead of
+    looping over bytes, so a 50-byte row costs ~6 integer ops.
+    """
+    width = len(data)
+    if not width:
+        return 0
+    value = int.from_bytes(data, "big")
+    while width > 1:
+        half = (width + 1) // 2
+        value = (value >> (8 * half)) ^ (value & ((1 << (8 * half)) - 1))
+        width = half
+    return value
+
+
+def make_packet(command: int, data: bytes = b"") -> bytes:
+    """
+    Niimbot packet format:
+    0x55 0x55 | cmd (1B) | len (1B) | data (len) | checksum XOR(cmd,len,data) (1B) | 0xAA 0xAA
+    """
+    if len(data) > 255:
+        raise ValueError(f"Data too long for 1-byte length: {len(data)}")
+    payload = bytes([command, len(data)]) + data
+    return HEAD + payload + bytes([xor_checksum(payload)]) + TAIL
+
+
+def row_packet_load(packet: bytes) -> Tuple[int, int]:
+    """
+    (printed rows, burned dots) of a framed 0x85/0x84 row packet, (0, 0) for
+    anything else. Dots come from the 0x85 header's left/mid/right counts; when a
+    sender leaves those at zero the bitmap is popcounted instead.
+    """
+    if len(packet) < MIN_FRAME_LEN:
+        return 0, 0
+    command = packet[2]
+    data = packet[4:4 + packet[3]]
+    if command == CMD_PRINT_BITMAP_ROW and len(data) >= 6:
+        repeat = data[5] or 1
+        dots = data[2] + data[3] + data[4] or int.from_bytes(data[6:], "big").bit_count()
+        return repeat, dots * repeat
+    if command == CMD_PRINT_EMPTY_ROW and len(data) >= 3:
+        return data[2] or 1, 0
+    return 0, 0
+
+
+# -----------------------------
+# Typed responses
+# -----------------------------
+
+@dataclass(frozen=True)
+class Frame:
+    """One validated frame: command byte + data bytes (header/checksum/tail stripped)."""
+    command: int
+    data: bytes
+
+
+@dataclass(frozen=True)
+class Heartbeat:
+    command: int
+    closing_state: Optional[int] = None   # lid/cover: 0 = closed
+    power_level: Optional[int] = None     # battery, 1..4
+    paper_state: Optional[int] = None     # 0 = paper present
+    rfid_read_state: Optional[int] = None
+
+
+@dataclass(frozen=True)
+class PrinterInfo:
+    key: int
+    value: Union[int, float, str]
+    raw: bytes
+
+    @property
+    def name(self) -> str:
+        return INFO_NAMES.get(self.key, f"Info 0x{self.key:02x}")
+
+
+@dataclass(frozen=True)
+class PrintStatus:
+    page: int        # pages finished so far (1-based once the first page is done)
+    progress1: int   # print progress, 0..100
+    progress2: int   # feed progress, 0..100
+
+
+@dataclass(frozen=True)
+class PrinterErrorResponse:
+    code: int
+
+    @property
+    def message(self) -> str:
+        return PRINTER_ERRORS.get(self.code, f"Printer error 0x{self.code:02x}")
+
+    @property
+    def kind(self) -> str:
+        return PRINTER_ERROR_KINDS.get(self.code, "printer_error")
+
+
+class PrinterError(Exception):
+    """
+    The printer rejected the job with an error frame (0xDB). Raised by the print
+    paths as soon as the frame arrives; `labels_done` counts the labels of the
+    job that printed before it.
+    """
+
+    def __init__(self, code: int, labels_done: int = 0):
+        self.code = code
+        self.labels_done = labels_done
+        super().__init__(self.message)
+
+    @classmethod
+    def from_response(cls, resp: PrinterErrorResponse) -> "PrinterError":
+        return cls(resp.code)
+
+    @property
+    def message(self) -> str:
+        return PRINTER_ERRORS.get(self.code, f"Printer error 0x{self.code:02x}")
+
+    @property
+    def kind(self) -> str:
+        return PRINTER_ERROR_KINDS.get(self.code, "printer_error")
+
+
+@dataclass(frozen=True)
+class Ack:
+    command: int
+    ok: bool
+
+
+@dataclass(frozen=True)
+class RfidInfo:
+    """Label roll tag (CMD_RFID_INFO); `present` is False when no tagged roll is loaded."""
+    present: bool
+    uuid: str = ""
+    barcode: str = ""
+    serial: str = ""
+    total_labels: int = 0
+    used_labels: int = 0
+    label_type: int = 0
+
+
+Response = Union[Frame, Heartbeat, PrinterInfo, PrintStatus, PrinterErrorResponse, Ack, RfidInfo]
+
+
+def _parse_heartbeat(frame: Frame) -> Heartbeat:
+    # Field offsets depend on payload length (same table as niimprint)
+    d = frame.data
+    n = len(d)
+    if n == 20:
+        return Heartbeat(frame.command, closing_state=d[18], power_level=d[19])
+    if n == 19:
+        return Heartbeat(frame.command, d[15], d[16], d[17], d[18])
+    if n == 13:
+        return Heartbeat(frame.command, d[9], d[10], d[11], d[12])
+    if n == 10:
+        return Heartbeat(frame.command, closing_state=d[8], power_level=d[9], rfid_read_state=d[8])
+    if n == 9:
+        return Heartbeat(frame.command, closing_state=d[8])
+    return Heartbeat(frame.command)
+
+
+def _parse_info(key: int, data: bytes) -> PrinterInfo:
+    if key == INFO_SERIAL:
+        value: Union[int, float, str] = data.hex()
+    elif key in (INFO_SOFTWARE_VERSION, INFO_HARDWARE_VERSION) and len(data) >= 2:
+        value = struct.unpack(">H", data[:2])[0] / 100
+    else:
+        value = int.from_bytes(data, "big") if data else 0
+    return PrinterInfo(key, value, data)
+
+
+def _parse_rfid(data: bytes) -> RfidInfo:
+    # uuid(8) | barcode len + str | serial len + str | total u16 | used u16 | type u8
+    if not data or data[0] == 0:
+        return RfidInfo(False)
+    try:
+        idx = 8
+        barcode = data[idx + 1:idx + 1 + data[idx]].decode("ascii", "replace")
+        idx += 1 + data[idx]
+        serial = data[idx + 1:idx + 1 + data[idx]].decode("ascii", "replace")
+        idx += 1 + data[idx]
+        total, used, label_type = struct.unpack(">HHB", data[idx:idx + 5])
+    except (IndexError, struct.error):
+        return RfidInfo(True, data[:8].hex())
+    return RfidInfo(True, data[:8].hex(), barcode, serial, total, used, label_type)
+
+
+def parse_response(frame: Frame) -> Response:
+    """Map a decoded frame to its typed response (unknown commands stay a Frame)."""
+    cmd = frame.command
+    d = frame.data
+
+    if cmd in HEARTBEAT_RESPONSES:
+        return _parse_heartbeat(frame)
+    if cmd == RESP_PRINT_STATUS and len(d) >= 4:
+        page, progress1, progress2 = struct.unpack(">HBB", d[:4])
+        return PrintStatus(page, progress1, progress2)
+    if cmd == RESP_RFID_INFO:
+        return _parse_rfid(d)
+    if cmd == RESP_PRINT_ERROR and d:
+        return PrinterErrorResponse(d[0])
+    if cmd in ACK_RESPONSES:
+        return Ack(cmd, bool(d and d[0]))
+    if RESP_PRINTER_INFO_BASE < cmd <= RESP_PRINTER_INFO_BASE + 0x0F:
+        return _parse_info(cmd - RESP_PRINTER_INFO_BASE, d)
+    return frame
+
+
+def is_reply(command: int, data: bytes, resp: Response) -> bool:
+    """
+    True if `resp` answers request `command` (with payload `data`). A "not
+    supported" frame (0x00) answers whatever is outstanding, as in niimbluelib.
+    """
+    if isinstance(resp, Frame):
+        return resp.command == RESP_NOT_SUPPORTED
+    if command == CMD_HEARTBEAT:
+        return isinstance(resp, Heartbeat)
+    if command == CMD_PRINTER_INFO:
+        return isinstance(resp, PrinterInfo) and bool(data) and resp.key == data[0]
+    if isinstance(resp, Ack):
+        return resp.command == REPLY_FOR.get(command)
+    if isinstance(resp, PrintStatus):
+        return command == CMD_PRINT_STATUS
+    if isinstance(resp, RfidInfo):
+        return command == CMD_RFID_INFO
+    return False
+
+
+# -----------------------------
+# Incremental decoder
+# -----------------------------
+
+class FrameDecoder:
+    """
+    Streaming decoder for 0x55 0x55 ... 0xAA 0xAA frames.
+
+    feed() accepts arbitrary chunks (one BLE notification, one serial read, half a
+    frame, three frames glued together) and returns every complete, valid frame.
+    Bytes that cannot start a valid frame are skipped and counted.
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+        self.frames_decoded = 0
+        self.bad_frames = 0      # header+length seen, but tail/checksum wrong
+        self.skipped_bytes = 0   # noise between frames
+
+    def reset(self):
+        self._buf.clear()
+
+    @property
+    def pending(self) -> int:
+        """Bytes buffered while waiting for the rest of a frame."""
+        return len(self._buf)
+
+    @staticmethod
+    def _frame_end(buf: bytearray, start: int, end: int) -> int:
+        """End offset of a valid frame at `start`, 0 if invalid, -1 if incomplete."""
+        if end - start < MIN_FRAME_LEN:
+            return -1
+        frame_end = start + buf[start + 3] + MIN_FRAME_LEN
+        if frame_end > end:
+            return -1
+        if buf[frame_end - 2:frame_end] != TAIL:
+            return 0
+        if xor_checksum(buf[start + 2:frame_end - 3]) != buf[frame_end - 3]:
+            return 0
+        return frame_end
+
+    def feed(self, data: bytes) -> List[Frame]:
+        buf = self._buf
+        buf += data
+        end = len(buf)
+        frames: List[Frame] = []
+        pos = 0
+
+        while True:
+            start = buf.find(HEAD, pos)
+            if start < 0:
+                # Keep a trailing 0x55: it may be the first half of the next header
+                keep_from = end - 1 if buf.endswith(b"\x55") else end
+                self.skipped_bytes += keep_from - pos
+                pos = keep_from
+                break
+
+            self.skipped_bytes += start - pos
+            frame_end = self._frame_end(buf, start, end)
+
+            if frame_end < 0:
+                # Incomplete. If a later header already holds a complete valid frame,
+                # this one was noise with a bogus length byte - don't wait on it.
+                nxt = buf.find(HEAD, start + 1)
+                if nxt >= 0 and self._frame_end(buf, nxt, end) > 0:
+                    self.bad_frames += 1
+                    self.skipped_bytes += nxt - start
+                    pos = nxt
+                    continue
+                pos = start
+                break
+
+            if frame_end == 0:
+                # False header (e.g. 0x55 0x55 inside row data): resync one byte later
+                self.bad_frames += 1
+                self.skipped_bytes += 1
+                pos = start + 1
+                continue
+
+            frames.append(Frame(buf[start + 2], bytes(buf[start + 4:frame_end - 3])))
+            pos = frame_end
+
+        if pos:
+            del buf[:pos]
+        self.frames_decoded += len(frames)
+        return frames
+
+
+# -----------------------------
+# Dispatch
+# -----------------------------
+
+ResponseHandler = Callable[[Response], None]
+
+
+class ResponseDispatcher:
+    """
+    FrameDecoder + typed callbacks.
+
+    The instance is callable with bleak's (sender, data) signature, so it can be
+    passed straight to `client.start_notify(...)`. For serial links call feed().
+    The most recent response of each type is kept in `last` for quick polling.
+    """
+
+    def __init__(self, verbose: bool = False):
+        self.decoder = FrameDecoder()
+        self.verbose = verbose
+        self.last: Dict[type, Response] = {}
+        self._handlers: Dict[Optional[type], List[ResponseHandler]] = {}
+
+    def subscribe(self, handler: ResponseHandler, response_type: Optional[type] = None):
+        """Call `handler` for every response of `response_type` (None = all responses)."""
+        self._handlers.setdefault(response_type, []).append(handler)
+
+    def unsubscribe(self, handler: ResponseHandler, response_type: Optional[type] = None):
+        handlers = self._handlers.get(response_type, [])
+        if handler in handlers:
+            handlers.remove(handler)
+
+    def expect(self, response_type: type,
+               predicate: Optional[Callable[[Response], bool]] = None) -> "asyncio.Future":
+        """
+        Future resolved by the next matching response. Subscribe *before* sending
+        the request so a fast reply can't be missed; cancel it if you give up.
+        """
+        fut = asyncio.get_running_loop().create_future()
+
+        def handler(resp: Response):
+            if not fut.done() and (predicate is None or predicate(resp)):
+                fut.set_result(resp)
+
+        self.subscribe(handler, response_type)
+        fut.add_done_callback(lambda _: self.unsubscribe(handler, response_type))
+        return fut
+
+    async def wait_for(self, response_type: type, timeout: float,
+                       predicate: Optional[Callable[[Response], bool]] = None) -> Response:
+        """Wait for the next matching response; raises asyncio.TimeoutError."""
+        return await asyncio.wait_for(self.expect(response_type, predicate), timeout)
+
+    def feed(self, data: bytes) -> List[Response]:
+        responses = [parse_response(f) for f in self.decoder.feed(data)]
+        for resp in responses:
+            self.last[type(resp)] = resp
+            if self.verbose:
+                print(f"🔔 RX: {resp}")
+            for handler in tuple(self._handlers.get(type(resp), ())):
+                handler(resp)
+            for handler in tuple(self._handlers.get(None, ())):
+                handler(resp)
+        return responses
+
+    def __call__(self, _sender, data: bytearray):
+        self.feed(bytes(data))
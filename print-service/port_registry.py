@@ -0,0 +1,197 @@
+"""
+Cached serial port discovery for the B1's USB link.
+
+app.py used to launch PowerShell + WMI (`Get-WmiObject Win32_SerialPort`) on
+every print and then guess COM3/COM4; printer_usb re-enumerated on every call.
+PortRegistry enumerates with pyserial's list_ports (Windows COMx, Linux
+/dev/ttyACM* / ttyUSB*, macOS /dev/cu.*), scores each port once and caches the
+result:
+
+- description / manufacturer mentioning NIIMBOT          -> 100
+- USB VID:PID or device that printed before (registry)   -> 80 / 60
+- common USB-serial bridge VID (CH340, CP210x, FTDI, ...) -> 20
+- anything else without USB info (COM1, ttyS0)            -> skipped
+
+The cache is refreshed only when a background hotplug poll sees the set of
+ports change, or when a caller reports a connection failure.
+"""
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from serial.tools import list_ports
+
+from printer_registry import PrinterRegistry, get_registry
+
+# USB-serial bridges a B1 (or its cable) may show up as
+USB_SERIAL_VIDS = {
+    0x1A86: "WCH CH340/CH9102",
+    0x10C4: "Silicon Labs CP210x",
+    0x0403: "FTDI",
+    0x067B: "Prolific PL2303",
+}
+
+SCORE_NAMED = 100
+SCORE_KNOWN_USB_ID = 80
+SCORE_KNOWN_DEVICE = 60
+SCORE_USB_SERIAL = 20
+SCORE_USB_OTHER = 10
+FAILURE_PENALTY = 50      # subtracted for `failure_hold_s` after a failed connect
+
+
+@dataclass(frozen=True)
+class PortInfo:
+    device: str
+    description: str = ""
+    manufacturer: str = ""
+    vid: Optional[int] = None
+    pid: Optional[int] = None
+    serial_number: Optional[str] = None
+    score: int = 0
+
+    @property
+    def usb_id(self) -> Optional[str]:
+        if self.vid is None or self.pid is None:
+            return None
+        return f"{self.vid:04X}:{self.pid:04X}"
+
+
+class PortRegistry:
+    def __init__(self, registry: Optional[PrinterRegistry] = None, *, failure_hold_s: float = 60.0):
+        self.registry = registry or get_registry()
+        self.failure_hold_s = failure_hold_s
+        self.scans = 0
+        self._lock = threading.Lock()
+        self._ports: List[PortInfo] = []
+        self._stale = True
+        self._signature: Tuple = ()
+        self._failures: Dict[str, float] = {}
+        self._poll_thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    # -----------------------------
+    # Enumeration / scoring
+    # -----------------------------
+
+    @staticmethod
+    def _enumerate():
+        return list_ports.comports()
+
+    @staticmethod
+    def _signature_of(raw) -> Tuple:
+        return tuple(sorted((p.device, p.vid, p.pid, p.serial_number) for p in raw))
+
+    def _score(self, p) -> int:
+        text = f"{p.description or ''} {p.manufacturer or ''} {getattr(p, 'product', None) or ''}".lower()
+        if "niimbot" in text:
+            return SCORE_NAMED
+        usb_id = f"{p.vid:04X}:{p.pid:04X}" if p.vid is not None and p.pid is not None else None
+        known = self.registry.all("serial")
+        if usb_id and any(k.usb_id == usb_id for k in known):
+            return SCORE_KNOWN_USB_ID
+        if any(k.address == p.device for k in known):
+            return SCORE_KNOWN_DEVICE
+        if p.vid in USB_SERIAL_VIDS:
+            return SCORE_USB_SERIAL
+        if p.vid is not None:
+            return SCORE_USB_OTHER
+        return 0
+
+    def _scan(self, raw=None) -> List[PortInfo]:
+        raw = self._enumerate() if raw is None else raw
+        self.scans += 1
+        ports = []
+        for p in raw:
+            score = self._score(p)
+            if score <= 0:
+                continue
+            ports.append(PortInfo(p.device, p.description or "", p.manufacturer or "", p.vid, p.pid,
+                                  p.serial_number, score))
+        with self._lock:
+            self._ports = ports
+            self._stale = False
+            self._signature = self._signature_of(raw)
+        return ports
+
+    def invalidate(self):
+        """Mark the cached scan stale; the next lookup enumerates again."""
+        with self._lock:
+            self._stale = True
+
+    # -----------------------------
+    # Lookups
+    # -----------------------------
+
+    def candidates(self, min_score: int = 0) -> List[PortInfo]:
+        """Matching ports, best first (cached; ports that just failed sort last)."""
+        with self._lock:
+            ports, stale = self._ports, self._stale
+        if stale:
+            ports = self._scan()
+
+        now = time.monotonic()
+        def effective(p: PortInfo) -> int:
+            failed_at = self._failures.get(p.device)
+            if failed_at and now - failed_at < self.failure_hold_s:
+                return p.score - FAILURE_PENALTY
+            return p.score
+        ranked = sorted(ports, key=effective, reverse=True)
+        return [p for p in ranked if effective(p) >= min_score]
+
+    def best(self, min_score: int = SCORE_KNOWN_DEVICE) -> Optional[str]:
+        """Most likely printer port, or None. By default only named/remembered ports."""
+        ports = self.candidates(min_score)
+        return ports[0].device if ports else None
+
+    def report_success(self, device: str):
+        """Remember the port (and its VID:PID) so it matches straight away next time."""
+        self._failures.pop(device, None)
+        info = next((p for p in self._ports if p.device == device), None)
+        self.registry.remember(device, name=info.description if info else None, transport="serial",
+                               usb_id=info.usb_id if info else None)
+        self.invalidate()  # rescore with the new knowledge
+
+    def report_failure(self, device: str):
+        """A connect/print on `device` failed: demote it and rescan next time."""
+        self._failures[device] = time.monotonic()
+        self.invalidate()
+
+    # -----------------------------
+    # Hotplug
+    # -----------------------------
+
+    def start_hotplug(self, poll_s: float = 2.0):
+        """Background poll that rescans only when ports appear or disappear."""
+        if self._poll_thread and self._poll_thread.is_alive():
+            return
+        self._stop.clear()
+        self._poll_thread = threading.Thread(target=self._poll, args=(poll_s,), name="port-hotplug", daemon=True)
+        self._poll_thread.start()
+
+    def stop_hotplug(self):
+        self._stop.set()
+
+    def _poll(self, poll_s: float):
+        while not self._stop.wait(poll_s):
+            try:
+                raw = self._enumerate()
+            except Exception as e:
+                print(f"⚠️  Port poll failed: {e}")
+                continue
+            if self._signature_of(raw) != self._signature:
+                ports = self._scan(raw)
+                names = ", ".join(f"{p.device} ({p.score})" for p in ports) or "none"
+                print(f"🔌 Serial ports changed: {names}")
+
+
+_default_ports: Optional[PortRegistry] = None
+
+
+def get_port_registry() -> PortRegistry:
+    """Process-wide port cache backed by the printer registry."""
+    global _default_ports
+    if _default_ports is None:
+        _default_ports = PortRegistry()
+    return _default_ports
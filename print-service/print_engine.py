@@ -0,0 +1,433 @@
+"""
+In-process print engine for the Flask service.
+
+app.py used to run `niimblue-cli` (Node.js) for every label: process start-up,
+a fresh scan/connection, a PNG decode in Node and up to 40-60 s of timeout per
+attempt. The engine prints with our own protocol code instead and keeps the
+printer connection open between labels:
+
+- the shared I/O loop thread (io_loop.py) owns the B1Session (BLE link kept
+  warm by heartbeats, see ble_session.py); Flask threads hand jobs to it
+- the link is chosen by racing serial ports and BLE concurrently with short
+  heartbeat handshakes (transport_race.py); no healthy link = error in seconds
+- printer_status.StatusMonitor caches heartbeat/battery/label state of every
+  open link in the background, for /health
+- the label goes out on the winning link:
+    SerialBackend      printer_usb on the winning port, kept open between
+                       labels (serial_session.py)
+    BleBackend         niimbot_b1_ble_fixed over the persistent session
+    NiimblueCliBackend niimblue-node on the same link if the native print
+                       fails (optional): long-lived worker, else one CLI run
+
+print_file() returns (success, message) like the old print_with_niimblue(), and
+raises niimbot_protocol.PrinterError when the printer rejects the job;
+print_batch() prints many labels as one multi-page job (one handshake);
+print_on()/print_on_many() print on one given link (used by printer_pool.py for
+each pooled printer, BLE printers getting their own pinned session). Each of
+them takes an optional print_progress tracker that follows the job through
+connect / encode / rows / printing for /jobs/<id>/events, and an optional
+deadline.Deadline: every stage (waiting for the printer, discovery, connect,
+handshake, transmit, printing, fallback) gets what is left of it, and running
+out raises DeadlineExceeded tagged with the stage.
+"""
+
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field, replace
+from typing import Dict, List, Optional, Tuple
+
+import printer_usb
+from ble_session import B1Session, SessionConfig
+from deadline import Deadline, DeadlineExceeded
+from io_loop import IoLoop, get_io_loop
+from niimbot_b1_ble_fixed import B1Config, BatchProgress, encode_page, print_pages_ble
+from niimblue_worker import WorkerError, get_worker, release_worker
+from niimblue_worker import stop_all as stop_workers
+from niimbot_protocol import PrinterError
+from port_registry import PortRegistry, get_port_registry
+from print_progress import Progress
+from printer_registry import PrinterRegistry, get_registry
+from printer_status import StatusConfig, StatusMonitor
+from serial_session import close_all as close_serial_sessions
+from serial_session import get_serial_session
+from transport_race import LinkChoice, RaceConfig, TransportRace
+
+HARD_CAP_GRACE_S = 1.0              # past a job's deadline before the loop cancels it outright
+PrintResult = Tuple[bool, str]
+Label = Tuple[str, int]               # (image path, copies)
+BatchResult = Tuple[int, str]         # (labels printed, message)
+
+
+def _copies(n: int) -> str:
+    return "1 copy" if n == 1 else f"{n} copies"
+
+
+def _describe(labels: List[Label]) -> str:
+    if len(labels) == 1:
+        return _copies(labels[0][1])
+    return f"{len(labels)} labels ({sum(n for _, n in labels)} pages)"
+
+
+@dataclass
+class EngineConfig:
+    name_hint: str = "B1"
+    use_serial: bool = True
+    use_ble: bool = True
+    use_niimblue_fallback: bool = True     # only if niimblue-cli is installed
+    use_niimblue_worker: bool = True       # keep niimblue-node running instead of spawning per label
+    job_timeout_s: float = 45.0            # whole native job (connect + transmit + print)
+    copy_timeout_s: float = 5.0            # added per extra copy
+    race: RaceConfig = field(default_factory=RaceConfig)
+    status: StatusConfig = field(default_factory=StatusConfig)
+    b1: B1Config = field(default_factory=lambda: B1Config(verbose=False))
+    session: SessionConfig = field(default_factory=lambda: SessionConfig(verbose=True))
+
+
+# -----------------------------
+# Backends
+# -----------------------------
+
+class SerialBackend:
+    name = "serial"
+
+    def __init__(self, ports: PortRegistry):
+        self.ports = ports
+
+    def print_pages(self, labels: List[Label], port: str, tracker: Optional[Progress] = None,
+                    deadline: Optional[Deadline] = None) -> BatchResult:
+        done = printer_usb.print_labels_usb(labels, port, tracker=tracker, deadline=deadline)
+        if done:
+            self.ports.report_success(port)
+        if done == len(labels):
+            return done, f"Printed {_describe(labels)} via serial {port}"
+        if not done:
+            self.ports.report_failure(port)
+        return done, f"Serial print on {port} failed after {done}/{len(labels)} labels"
+
+
+class BleBackend:
+    name = "ble"
+
+    def __init__(self, engine: "PrintEngine"):
+        self.engine = engine
+
+    def print_pages(self, labels: List[Label], address: str, tracker: Optional[Progress] = None,
+                    deadline: Optional[Deadline] = None) -> BatchResult:
+        engine = self.engine
+        deadline = deadline or Deadline(None)
+        session = engine.ble_session(address)
+        # Encoded here, on the caller's thread, so the I/O loop only transmits
+        if tracker:
+            tracker.stage("encode")
+        pages = [encode_page(path, engine.config.b1, copies) for path, copies in labels]
+        total = sum(copies for _, copies in labels)
+        timeout_s = deadline.cap(engine.config.job_timeout_s + engine.config.copy_timeout_s * (total - 1),
+                                 grace_s=HARD_CAP_GRACE_S)
+        batch = BatchProgress()  # still readable if the hard cap cancels the job
+        try:
+            done = engine.run(print_pages_ble(pages, config=engine.config.b1, session=session, tracker=tracker,
+                                              deadline=deadline, batch=batch), timeout_s)
+        except DeadlineExceeded:
+            raise
+        except TimeoutError as e:
+            # Hard cap on the loop (e.g. a connect that never returns): blame the stage it was in
+            if deadline.expired:
+                raise deadline.exceeded(labels_done=batch.labels_done) from None
+            e.labels_done = batch.labels_done
+            raise
+        if done == len(labels):
+            return done, f"Printed {_describe(labels)} via BLE {session.name or ''} ({session.address})"
+        return done, f"BLE print failed after {done}/{len(labels)} labels"
+
+
+class NiimblueCliBackend:
+    """
+    niimblue-node on a link the race already found healthy: the long-lived
+    worker for that printer, or one `niimblue-cli print` if no worker can run.
+    """
+
+    name = "niimblue-cli"
+
+    def __init__(self, registry: PrinterRegistry, use_worker: bool = True):
+        self.registry = registry
+        self.use_worker = use_worker
+        npm_path = os.path.expanduser(r'~\AppData\Roaming\npm\niimblue-cli.cmd')
+        self.command = npm_path if os.path.exists(npm_path) else 'niimblue-cli'
+
+    def _run(self, args: List[str], timeout_s: float):
+        try:
+            return subprocess.run([self.command, 'print', *args], capture_output=True, text=True,
+                                  timeout=timeout_s)
+        except FileNotFoundError:
+            return None  # Command not found
+
+    def print_file(self, image_path: str, transport: str, address: str, copies: int = 1,
+                   deadline: Optional[Deadline] = None) -> PrintResult:
+        deadline = deadline or Deadline(None)
+        deadline.enter("fallback")
+        if self.use_worker:
+            try:
+                ok, message = get_worker(transport, address).print_file(image_path, deadline=deadline, quantity=copies)
+                if ok:
+                    return True, f"Printed {_copies(copies)} via niimblue worker ({transport} {address})"
+                print(f"⚠️  niimblue worker ({transport} {address}): {message}")
+            except WorkerError as e:
+                print(f"⚠️  niimblue worker ({transport} {address}): {e}")
+
+        # One CLI run per copy: the worker is the path that prints copies in one job
+        print(f"🖨️  {self.command} print -t {transport} -a {address} ({_copies(copies)})")
+        output = []
+        for _ in range(copies):
+            deadline.enter("fallback")
+            try:
+                result = self._run(['-t', transport, '-a', address, '-p', 'B1', image_path], deadline.cap(40.0))
+            except subprocess.TimeoutExpired:
+                if deadline.expired:
+                    raise deadline.exceeded("fallback") from None
+                return False, "Print timeout - printer not found or busy"
+            if result is None:
+                return False, "Tool 'niimblue-cli' missing."
+            if result.returncode != 0:
+                return False, result.stderr.strip() or f"niimblue-cli exited with {result.returncode}"
+            output.append(result.stdout)
+        return True, "".join(output)
+
+    def print_pages(self, labels: List[Label], transport: str, address: str,
+                    deadline: Optional[Deadline] = None) -> BatchResult:
+        done, message = 0, ""
+        for image_path, copies in labels:
+            try:
+                ok, message = self.print_file(image_path, transport, address, copies, deadline)
+            except DeadlineExceeded as e:
+                e.labels_done += done
+                raise
+            if not ok:
+                break
+            done += 1
+        return done, message
+
+
+# -----------------------------
+# Engine
+# -----------------------------
+
+class PrintEngine:
+    def __init__(self, config: Optional[EngineConfig] = None, *, registry: Optional[PrinterRegistry] = None,
+                 io: Optional[IoLoop] = None):
+        self.config = config or EngineConfig()
+        self.io = io or get_io_loop()
+        self.registry = registry or get_registry()
+        self.ports = get_port_registry() if registry is None else PortRegistry(self.registry)
+        self.session: Optional[B1Session] = None
+        self.sessions: Dict[str, B1Session] = {}  # pinned sessions for pooled BLE printers
+        self.last_backend: Optional[str] = None
+
+        self._started = False
+        self._job_lock = threading.Lock()  # one label at a time, whatever the backend
+        self._start_lock = threading.Lock()
+
+        cfg = self.config
+        self.race: Optional[TransportRace] = None
+        self.status = StatusMonitor(self, cfg.status)
+        self.backends = {"serial": SerialBackend(self.ports), "ble": BleBackend(self)}
+        self.cli_backend = (NiimblueCliBackend(self.registry, use_worker=cfg.use_niimblue_worker)
+                            if cfg.use_niimblue_fallback else None)
+
+    # -----------------------------
+    # Loop thread
+    # -----------------------------
+
+    def start(self, prewarm: bool = True):
+        """Start the engine on the I/O loop (idempotent); optionally connect BLE right away."""
+        with self._start_lock:
+            if self._started and self.io.running:
+                return
+            self.session = self.run(self._make_session(), 5.0)
+            self.race = TransportRace(self.registry, self.ports, self.session, self.config.race)
+            self.io.call_soon(self.status.start)
+            if self.config.use_serial:
+                self.ports.start_hotplug()
+            self._started = True
+        if prewarm and self.config.use_ble:
+            self.io.call_soon(self.session.prewarm)
+
+    async def _make_session(self, address: Optional[str] = None) -> B1Session:
+        # Created on the loop thread so its asyncio locks belong to that loop
+        session_cfg = replace(self.config.session, name_hint=self.config.name_hint)
+        if address:
+            session_cfg.address = address
+        return B1Session(session_cfg, registry=self.registry)
+
+    def ble_session(self, address: Optional[str]) -> B1Session:
+        """Session for one BLE printer: the auto-discovered one, or a pinned one per address."""
+        self.start(prewarm=False)
+        if not address or (self.session.address or "").lower() == address.lower():
+            return self.session
+        key = address.lower()
+        with self._start_lock:
+            if key not in self.sessions:
+                self.sessions[key] = self.run(self._make_session(address), 5.0)
+            return self.sessions[key]
+
+    def run(self, coro, timeout_s: Optional[float] = None):
+        """Run a coroutine on the I/O loop from any thread and wait for it."""
+        return self.io.run(coro, timeout_s)
+
+    def submit(self, coro) -> Future:
+        """Schedule a coroutine on the I/O loop without waiting; returns its Future."""
+        return self.io.submit(coro)
+
+    def stop(self):
+        stop_workers()
+        close_serial_sessions()
+        self.ports.stop_hotplug()
+        if not self._started:
+            return
+        self._started = False
+        self.io.call_soon(self.status.stop)
+        for session in [self.session, *self.sessions.values()]:
+            try:
+                self.run(session.close(), 5.0)
+            except Exception as e:
+                print(f"⚠️  Engine shutdown: {e}")
+        self.sessions.clear()
+        self.io.stop()
+
+    # -----------------------------
+    # Jobs
+    # -----------------------------
+
+    def select_link(self, deadline: Optional[Deadline] = None) -> Optional[LinkChoice]:
+        """Race every enabled transport (a few seconds at most)."""
+        cfg = self.config
+        deadline = deadline or Deadline(None)
+        deadline.enter("discovery")
+        budget = max(cfg.race.serial_timeout_s, cfg.race.ble_timeout_s) + cfg.race.head_start_s + 1.0
+        try:
+            return self.run(self.race.run(serial_enabled=cfg.use_serial, ble_enabled=cfg.use_ble),
+                            deadline.cap(budget))
+        except TimeoutError:
+            if deadline.expired:
+                raise deadline.exceeded() from None
+            raise
+
+    def print_file(self, image_path: str, copies: int = 1, tracker: Optional[Progress] = None,
+                   deadline: Optional[Deadline] = None) -> PrintResult:
+        """Print one label image `copies` times in one job. Returns (success, message)."""
+        return self.print_batch([(image_path, copies)], tracker, deadline)[0]
+
+    def print_batch(self, labels: List[Label], tracker: Optional[Progress] = None,
+                    deadline: Optional[Deadline] = None) -> List[PrintResult]:
+        """
+        Print [(image_path, copies), ...] as one multi-page job on the printer the
+        race picks (one handshake for the whole batch). One result per label.
+        """
+        self.start()
+        deadline = deadline or Deadline(None)
+        # Wait for the label ahead of us, but not past the deadline
+        deadline.enter("queue")
+        if not self._job_lock.acquire(timeout=deadline.cap(threading.TIMEOUT_MAX)):
+            raise deadline.exceeded()
+        try:
+            self.last_backend = None
+            if tracker:
+                tracker.stage("connect")
+            link = self.select_link(deadline)
+            if link is None:
+                details = ", ".join(f"{k}: {v}" for k, v in self.race.last_errors.items())
+                error = f"Printer not reachable ({details or 'no serial port or BLE enabled'})"
+                return [(False, error)] * len(labels)
+            done, message = self.print_on_many(link.transport, link.address, labels, tracker, deadline)
+            return [(i < done, message) for i in range(len(labels))]
+        finally:
+            self._job_lock.release()
+
+    def print_on(self, transport: str, address: str, image_path: str, copies: int = 1,
+                 tracker: Optional[Progress] = None, deadline: Optional[Deadline] = None) -> PrintResult:
+        """Print one label on one specific printer link."""
+        done, message = self.print_on_many(transport, address, [(image_path, copies)], tracker, deadline)
+        return done == 1, message
+
+    def print_on_many(self, transport: str, address: str, labels: List[Label],
+                      tracker: Optional[Progress] = None, deadline: Optional[Deadline] = None) -> BatchResult:
+        """
+        Print labels as one job on one specific printer link (native, then
+        niimblue-node on the same link for whatever the native job didn't
+        confirm). Returns (labels printed, message); they print in order.
+
+        A job the printer rejects (error frame: cover open, no paper...) raises
+        PrinterError instead: no fallback, niimblue-node would hit the same error.
+        So does DeadlineExceeded: no budget left for a fallback.
+        """
+        self.start(prewarm=False)
+        t0 = time.monotonic()
+        deadline = deadline or Deadline(None)
+        backend = self.backends[transport]
+        if tracker:
+            tracker.stage("connect", backend=backend.name)
+        try:
+            done, message = backend.print_pages(labels, address, tracker, deadline)
+        except PrinterError as e:
+            self.last_backend = backend.name
+            print(f"❌ {backend.name}: printer error after {e.labels_done}/{len(labels)} labels: {e.message}")
+            raise
+        except DeadlineExceeded as e:
+            self.last_backend = backend.name
+            print(f"❌ {backend.name}: {e} after {e.labels_done}/{len(labels)} labels")
+            raise
+        except Exception as e:
+            # Labels that did print must not go through the fallback again
+            done, message = getattr(e, "labels_done", 0), f"{type(e).__name__}: {e}"
+        if done == len(labels):
+            self.last_backend = backend.name
+            print(f"✅ {message} in {time.monotonic() - t0:.2f}s")
+            return done, message
+        print(f"⚠️  {backend.name}: {message}")
+
+        if self.cli_backend:
+            if deadline.expired:
+                raise deadline.exceeded("fallback", done)
+            # niimblue-node needs the link for itself, for the whole fallback
+            session = self.ble_session(address) if transport == "ble" else None
+            if session:
+                try:
+                    self.run(session.release(), 5.0)
+                except Exception as e:
+                    # Still connected: niimblue-node couldn't get the printer anyway
+                    print(f"⚠️  Fallback skipped, BLE session not released: {e}")
+                    self.run(session.reclaim(), 5.0)
+                    return done, f"{message}; {self.cli_backend.name} skipped: {type(e).__name__}: {e}"
+            else:
+                get_serial_session(address).close()
+            if tracker:
+                tracker.stage("fallback", backend=self.cli_backend.name, message=message)
+            try:
+                more, cli_message = self.cli_backend.print_pages(labels[done:], transport, address, deadline)
+            except DeadlineExceeded as e:
+                e.labels_done += done
+                raise
+            finally:
+                # The worker keeps the link open: hand it back to the native sessions
+                release_worker(transport, address)
+                if session:
+                    self.run(session.reclaim(), 5.0)
+            done += more
+            if done == len(labels):
+                self.last_backend = self.cli_backend.name
+                return done, cli_message
+            message = f"{message}; {self.cli_backend.name}: {cli_message}"
+        return done, message
+
+
+_default_engine: Optional[PrintEngine] = None
+
+
+def get_engine() -> PrintEngine:
+    """Process-wide engine (not started until start() / the first print)."""
+    global _default_engine
+    if _default_engine is None:
+        _default_engine = PrintEngine()
+    return _default_engine
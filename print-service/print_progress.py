@@ -0,0 +1,266 @@
+"""
+Live progress of print jobs, streamed to clients as Server-Sent Events.
+
+/print-label only answers once the label is out, which can take a while on a
+fallback path, so the web app had nothing to show in between. Every job gets a
+ProgressTracker that the print path updates as it goes:
+
+    queued -> render -> encode -> connect -> rows (label i/n, rows sent/total)
+           -> printing (printer page counter) -> done / error
+
+Updates are coalesced so the transmit loop doesn't pay for them:
+
+- rows() / printed() (called once per row window / status poll) only store two
+  ints and bump a version number: no lock, no wake-up
+- stage changes (a handful per job) wake the streams right away
+- ProgressHub.stream() sends a stage change immediately and row/page progress
+  at most every `interval_s`, always the latest state (intermediate values are
+  dropped, never queued)
+
+A stream opened just before its job is submitted (the client picks the job id)
+waits up to `pending_s` for it; an id no job ever gets is answered with nothing
+(404 in app.py), so streams never create jobs. Finished jobs stay around for
+`keep_s` for late subscribers, unfinished ones no longer than `max_age_s`.
+"""
+
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Union
+
+from niimbot_protocol import PrintStatus, ResponseDispatcher
+
+FINAL_STAGES = ("done", "error")
+
+
+@dataclass
+class ProgressConfig:
+    interval_s: float = 0.1        # row/page updates are sent at most this often
+    keepalive_s: float = 15.0      # SSE comment line when nothing happens
+    keep_s: float = 120.0          # finished jobs stay available this long
+    max_idle_s: float = 600.0      # a stream with no update for this long is closed
+    pending_s: float = 5.0         # a stream opened before its job is submitted waits this long
+    max_age_s: float = 3600.0      # jobs that never finish are dropped after this long
+
+
+class ProgressTracker:
+    def __init__(self, hub: "ProgressHub", job_id: str):
+        self.hub = hub
+        self.job_id = job_id
+        self.stage_name = "queued"
+        self.label = 0                 # label being sent (1-based) ...
+        self.labels = 0                # ... of this many in the printer job
+        self.rows_sent = 0
+        self.rows_total = 0
+        self.pages_printed = 0         # printer page counter (copies)
+        self.pages_total = 0
+        self.backend: Optional[str] = None
+        self.message: Optional[str] = None
+        self.error_code: Optional[str] = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.version = 0               # any change
+        self.stage_version = 0         # stage changes only (these wake streams)
+
+    @property
+    def finished(self) -> bool:
+        return self.stage_name in FINAL_STAGES
+
+    # -----------------------------
+    # Updates (called by the print path)
+    # -----------------------------
+
+    def stage(self, name: str, **fields):
+        """Stage transition; extra fields (backend, message, ...) are set too."""
+        if self.finished:
+            return
+        for key, value in fields.items():
+            setattr(self, key, value)
+        self.stage_name = name
+        self.updated_at = time.time()
+        self.version += 1
+        self.stage_version += 1
+        self.hub._notify()
+
+    def start_label(self, index: int, count: int, rows_total: int):
+        self.stage("rows", label=index + 1, labels=count, rows_sent=0, rows_total=rows_total)
+
+    def rows(self, sent: int, total: int):
+        # Hot path (RowTransmitter progress callback): no lock, no notify
+        self.rows_sent = sent
+        self.rows_total = total
+        self.version += 1
+
+    def printed(self, pages: int, total: int):
+        self.pages_printed = pages
+        self.pages_total = total
+        self.version += 1
+
+    def finish(self, success: bool, message: str, error_code: Optional[str] = None):
+        self.stage("done" if success else "error", message=message, error_code=error_code)
+
+    def snapshot(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "stage": self.stage_name,
+            "label": self.label,
+            "labels": self.labels,
+            "rows_sent": self.rows_sent,
+            "rows_total": self.rows_total,
+            "pages_printed": self.pages_printed,
+            "pages_total": self.pages_total,
+            "backend": self.backend,
+            "message": self.message,
+            "error_code": self.error_code,
+            "elapsed_s": round(time.time() - self.created_at, 2),
+        }
+
+
+class ProgressGroup:
+    """Several jobs printed as one printer job (pool batch, bulk run): same updates for all."""
+
+    def __init__(self, trackers: List[ProgressTracker]):
+        self.trackers = trackers
+
+    def stage(self, name: str, **fields):
+        for t in self.trackers:
+            t.stage(name, **fields)
+
+    def start_label(self, index: int, count: int, rows_total: int):
+        for t in self.trackers:
+            t.start_label(index, count, rows_total)
+
+    def rows(self, sent: int, total: int):
+        for t in self.trackers:
+            t.rows(sent, total)
+
+    def printed(self, pages: int, total: int):
+        for t in self.trackers:
+            t.printed(pages, total)
+
+
+Progress = Union[ProgressTracker, ProgressGroup]
+
+
+def group(trackers: List[Optional[ProgressTracker]]) -> Optional[Progress]:
+    """One tracker-like object for a batch, None if nobody is listening."""
+    trackers = [t for t in trackers if t is not None]
+    if not trackers:
+        return None
+    return trackers[0] if len(trackers) == 1 else ProgressGroup(trackers)
+
+
+@contextmanager
+def page_counter(tracker: Optional[Progress], rx: ResponseDispatcher, total: int, offset: int = 0):
+    """
+    Report the printer's page counter to `tracker` while a job runs: every
+    PrintStatus reply on the link (flow-control probes, page waits) counts, so
+    no extra polling. `offset` = pages printed by an earlier attempt.
+    """
+    if tracker is None:
+        yield
+        return
+
+    def on_status(status: PrintStatus):
+        tracker.printed(offset + status.page, total)
+
+    rx.subscribe(on_status, PrintStatus)
+    try:
+        yield
+    finally:
+        rx.unsubscribe(on_status, PrintStatus)
+
+
+class ProgressHub:
+    def __init__(self, config: Optional[ProgressConfig] = None):
+        self.config = config or ProgressConfig()
+        self.jobs: Dict[str, ProgressTracker] = {}
+        self._lock = threading.Lock()
+        self._cond = threading.Condition()
+
+    def _notify(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def _prune(self):
+        now = time.time()
+        finished, abandoned = now - self.config.keep_s, now - self.config.max_age_s
+        for job_id in [j for j, t in self.jobs.items()
+                       if (t.finished and t.updated_at < finished) or t.created_at < abandoned]:
+            del self.jobs[job_id]
+
+    def job(self, job_id: Optional[str] = None) -> ProgressTracker:
+        """
+        Tracker for a submitted job `job_id` (a fresh id if None). A new tracker is
+        created unless the id belongs to a job still running; a finished job's id
+        can be reused and starts over from "queued".
+        """
+        with self._lock:
+            self._prune()
+            job_id = job_id or uuid.uuid4().hex[:12]
+            current = self.jobs.get(job_id)
+            created = current is None or current.finished
+            if created:
+                self.jobs[job_id] = ProgressTracker(self, job_id)
+            tracker = self.jobs[job_id]
+        if created:
+            self._notify()  # a stream may be waiting for this id
+        return tracker
+
+    def get(self, job_id: str) -> Optional[ProgressTracker]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def wait_job(self, job_id: str, timeout_s: Optional[float] = None) -> Optional[ProgressTracker]:
+        """get(), waiting up to `timeout_s` (default `pending_s`) for the job to be submitted."""
+        timeout_s = self.config.pending_s if timeout_s is None else timeout_s
+        with self._cond:
+            self._cond.wait_for(lambda: job_id in self.jobs, timeout=timeout_s)
+        return self.get(job_id)
+
+    # -----------------------------
+    # SSE
+    # -----------------------------
+
+    @staticmethod
+    def _event(tracker: ProgressTracker) -> str:
+        name = tracker.stage_name if tracker.finished else "progress"
+        return f"id: {tracker.version}\nevent: {name}\ndata: {json.dumps(tracker.snapshot())}\n\n"
+
+    def stream(self, job_id: str) -> Iterator[str]:
+        """SSE lines for one job until it is done (or idle for `max_idle_s`); nothing for an unknown id."""
+        cfg = self.config
+        tracker = self.wait_job(job_id)
+        if tracker is None:
+            return
+        sent_version = sent_stage = -1
+        last_sent = last_change = time.monotonic()
+        while True:
+            with self._cond:
+                # A stage change wakes us at once; row/page progress waits for the tick
+                self._cond.wait_for(lambda: tracker.stage_version != sent_stage, timeout=cfg.interval_s)
+            now = time.monotonic()
+            if tracker.version != sent_version:
+                sent_version, sent_stage = tracker.version, tracker.stage_version
+                last_sent = last_change = now
+                yield self._event(tracker)
+                if tracker.finished:
+                    return
+            elif now - last_change >= cfg.max_idle_s:
+                return
+            elif now - last_sent >= cfg.keepalive_s:
+                last_sent = now
+                yield ": keepalive\n\n"
+
+
+_default_hub: Optional[ProgressHub] = None
+
+
+def get_progress_hub() -> ProgressHub:
+    global _default_hub
+    if _default_hub is None:
+        _default_hub = ProgressHub()
+    return _default_hub
@@ -1,20 +1,16 @@
 import asyncio
-from bleak import BleakScanner, BleakClient
 from PIL import Image, ImageOps
 import struct
+import rowops
+from ble_session import B1Session
+from command_link import CommandLink
+from flow_control import AdaptivePacer, FlowConfig, RowTransmitter, wait_printed
+from niimbot_protocol import RESP_CONNECT, Ack, make_packet
 
 # NIIMBOT B1 BLE UUIDs
 SERVICE_UUID = "e7810a71-73ae-499d-8c15-faa9aef0c3f2"
 CHAR_UUID = "bef8d6c9-9c21-4c9e-b632-bd58c1009f9f"
 
-def make_packet(command: int, data: bytes = b'') -> bytes:
-    length = len(data)
-    payload = bytes([command, length]) + data
-    checksum = 0
-    for b in payload:
-        checksum ^= b
-    return b'\x55\x55' + payload + bytes([checksum]) + b'\xAA\xAA'
-
 def count_pixels_b1(total_count: int):
     # B1 protocol: Always send zeros for pixel count (verified from NiimPrintX)
     # The printer doesn't actually use these values
@@ -23,110 +19,103 @@ def count_pixels_b1(total_count: int):
 def process_image(image_path: str):
     img = Image.open(image_path).convert('L')
     
-    # FORCE 384 PIXELS WIDTH (Native B1 width)
-    TARGET_WIDTH = 384
-    if img.width != TARGET_WIDTH:
-        # If image is not 384px wide, center it with white padding
-        new_img = Image.new('L', (TARGET_WIDTH, img.height), 255)
-        x_offset = (TARGET_WIDTH - img.width) // 2
-        new_img.paste(img, (x_offset, 0))
-        img = new_img
-        print(f"⚠️  Image resized from {Image.open(image_path).width}px to {TARGET_WIDTH}px")
-
-    width, height = img.size
-    
     # CRITICAL: Invert image BEFORE converting to 1-bit (like NiimPrintX does)
-    # This is necessary for the B1 thermal printer protocol
-    img = ImageOps.invert(img).convert('1')
+    # This is necessary for the B1 thermal printer protocol.
+    # After inversion a 1 bit = what was black = burn a dot.
+    packed, src_width, height = rowops.from_1bit(ImageOps.invert(img).convert('1'))
     
-    rows = []
-    pixels = list(img.getdata())
+    # FORCE 384 PIXELS WIDTH (Native B1 width)
+    # Centering with white padding happens on the packed rows, not in PIL
+    TARGET_WIDTH = 384
+    if src_width != TARGET_WIDTH:
+        print(f"⚠️  Image resized from {src_width}px to {TARGET_WIDTH}px")
+    packed = rowops.pad_center(packed, src_width, TARGET_WIDTH)
+    width = TARGET_WIDTH
     
-    for row in range(height):
-        row_bytes = bytearray(width // 8)
-        black_count = 0
-        for col_byte in range(width // 8):
-            byte_val = 0
-            for bit in range(8):
-                pixel_idx = row * width + col_byte * 8 + bit
-                # NiimPrintX logic: "0" if pixel == 0, else "1"
-                # After inversion: 0 = what was white (don't print), 255 = what was black (print)
-                # So we set bit to 1 when pixel is 255 (was black in original)
-                if pixels[pixel_idx] == 255:
-                    byte_val |= (1 << (7 - bit))
-                    black_count += 1
-            row_bytes[col_byte] = byte_val
-        rows.append((bytes(row_bytes), black_count))
-        
+    rows = [(row, int.from_bytes(row, 'big').bit_count()) for row in packed]
     return rows, width, height
 
 async def send_packet(client, packet, delay=0.0):
     # print(f"TX: {packet.hex()}") # Debug print
-    await client.write_gatt_char(CHAR_UUID, packet, response=False)
+    await client.write(packet)
     if delay > 0: await asyncio.sleep(delay)
 
-async def print_label_ble(image_path: str, quantity: int = 1):
+async def print_label_ble(image_path: str, quantity: int = 1, session: B1Session = None):
     rows, width, height = process_image(image_path)
     print(f"Printing: {width}x{height} pixels (Forced 384px)...")
 
-    devices = await BleakScanner.discover(timeout=5.0)
-    target = next((d for d in devices if d.name and "B1" in d.name), None)
-    if not target: return print("❌ B1 Not Found")
-        
+    # Reuse a long-lived session when given (no scan/connect per label)
+    own_session = session is None
+    if own_session:
+        session = B1Session()
+
+    # Decoded RX is logged for this label only (the session may be shared)
+    def log_rx(resp):
+        print(f"🔔 RX: {resp}")
+
+    session.rx.subscribe(log_rx)
     try:
-        async with BleakClient(target.address, timeout=30.0) as client:
-            print(f"Connected to {target.name}")
-            
-            # --- NOTIFICATION HANDLER (SPY MODE) ---
-            def notification_handler(sender, data):
-                print(f"🔔 RX: {data.hex()}")
-            
-            await client.start_notify(CHAR_UUID, notification_handler)
-            print("Listening for printer feedback...")
+        async with session.job() as client:
+            with CommandLink(client.write, client.rx) as commands:
+                print("Listening for printer feedback...")
 
-            # --- Handshake ---
-            await send_packet(client, b'\x03' + make_packet(0xC1, b'\x01'), 0.5)
-            await send_packet(client, make_packet(0xDC, b'\x01'), 0.1) # Heartbeat
-            await send_packet(client, make_packet(0x21, b'\x03'), 0.1) # Density 3
-            await send_packet(client, make_packet(0x23, b'\x01'), 0.1) # Label Type 1
-            await send_packet(client, make_packet(0x01, struct.pack('>H', quantity) + b'\x00\x00\x00\x00\x00'), 0.2)
-            await send_packet(client, make_packet(0x03, b'\x01'), 0.1)
-            # SET_DIMENSION: width first, then height (corrected order)
-            await send_packet(client, make_packet(0x13, struct.pack('>HH', width, height)), 0.1)
-            await send_packet(client, make_packet(0x15, struct.pack('>H', quantity)), 0.1)
+                # --- Handshake ---
+                # Each command waits for its reply (resent if it gets lost) instead of a fixed sleep
+                connected = client.rx.expect(Ack, lambda r: r.command == RESP_CONNECT)
+                try:
+                    await send_packet(client, b'\x03' + make_packet(0xC1, b'\x01'))  # raw: 0x03 prefix
+                    await asyncio.wait_for(connected, 0.5)
+                except asyncio.TimeoutError:
+                    pass  # not every firmware answers it
+                finally:
+                    connected.cancel()
+                await commands.request(0xDC, b'\x01') # Heartbeat
+                await commands.request(0x21, b'\x03') # Density 3
+                await commands.request(0x23, b'\x01') # Label Type 1
+                await commands.request(0x01, struct.pack('>H', quantity) + b'\x00\x00\x00\x00\x00')
+                await commands.request(0x03, b'\x01')
+                # SET_DIMENSION: width first, then height (corrected order)
+                await commands.request(0x13, struct.pack('>HH', width, height))
+                await commands.request(0x15, struct.pack('>H', quantity))
             
-            # --- Data Transmission ---
-            print("Sending rows (0x85 BITMAP with corrected format)...")
+                # --- Data Transmission ---
+                print("Sending rows (0x85 BITMAP with corrected format)...")
             
-            for i, (row_data, black_count) in enumerate(rows):
-                # ALWAYS use 0x85 (Bitmap Row) even for empty lines
-                # Header format: [Row Number (2 bytes BE)] + [0,0,0] + [Repeat=1]
-                # The pixel count is always zeros (verified from NiimPrintX)
-                header = struct.pack('>H', i) + b'\x00\x00\x00' + b'\x01'
-                pkt = make_packet(0x85, header + row_data)
-                
-                await client.write_gatt_char(CHAR_UUID, pkt, response=False)
+                packets = []
+                for i, (row_data, black_count) in enumerate(rows):
+                    # ALWAYS use 0x85 (Bitmap Row) even for empty lines
+                    # Header format: [Row Number (2 bytes BE)] + [0,0,0] + [Repeat=1]
+                    # The pixel count is always zeros (verified from NiimPrintX)
+                    header = struct.pack('>H', i) + b'\x00\x00\x00' + b'\x01'
+                    packets.append(make_packet(0x85, header + row_data))
 
-                # Flow Control: 10ms per row (faster and more reliable)
-                await asyncio.sleep(0.01)
+                # Flow Control: paced by PrintStatus replies; 10ms per row only if the printer is silent
+                def show_progress(sent, total):
+                    print(f"Progress: {sent}/{total} rows", end='\r')
 
-                # Progress indicator every 50 rows
-                if (i+1) % 50 == 0:
-                    print(f"Progress: {i+1}/{height} rows", end='\r')
+                pacer = AdaptivePacer.for_printer(client.registry, client.address, "ble")
+                tx = RowTransmitter(client.write, client.rx, FlowConfig(fallback_delay_s=0.01), verbose=True, pacer=pacer,
+                                    write_many=client.write_many)
+                stats = await tx.send(packets, progress=show_progress)
 
-            print("\nRow transmission done. Waiting for print head...")
-            await asyncio.sleep(1.0)
-            
-            await send_packet(client, make_packet(0xE3, b'\x01'), 0.5) # PageEnd
-            await send_packet(client, make_packet(0xF3, b'\x01'), 0.5) # PrintEnd
+                print(f"\nRow transmission done in {stats.elapsed_s:.2f}s (window {pacer.window_rows}). Waiting for print head...")
+                await commands.request(0xE3, b'\x01') # PageEnd
+                if not commands.silent and await wait_printed(client.write, client.rx, page=1):
+                    pacer.save()
+                else:
+                    await asyncio.sleep(1.0)
+                await commands.request(0xF3, b'\x01') # PrintEnd
             
-            print("✅ Label finished!")
-            await client.stop_notify(CHAR_UUID)
-            return True
+                print("✅ Label finished!")
+                return True
 
     except Exception as e:
         print(f"\n❌ Error: {e}")
         return False
+    finally:
+        session.rx.unsubscribe(log_rx)
+        if own_session:
+            await session.close()
 
 if __name__ == "__main__":
     import sys
@@ -0,0 +1,417 @@
+"""
+Pool of registered printers with per-printer job queues.
+
+The service used to talk to exactly one printer (whichever the transport race
+found). With several B1s in the packing room (USB and BLE), printers are
+registered in the pool (`pooled` + `label_size` in known_printers.json) and
+every printer gets its own queue and worker thread:
+
+- submit() sends a job to the least-loaded healthy printer with the right label
+  roll loaded: lowest expected wait = copies queued or printing x average time
+  per copy
+- submit_many() assigns a bulk run job by job with the same rule, so it stripes
+  across printers in proportion to their speed
+- a failed job marks the printer offline for `offline_hold_s` and is retried
+  once on another matching printer; jobs still queued there move too. A job
+  the printer rejected (PrinterError: cover open, no paper...) is retried the
+  same way, and its Future raises the error if no other printer takes it
+- jobs already queued on a printer when it becomes free go out together as one
+  multi-page job (up to `batch_max`), so a bulk run pays one handshake per batch
+- status() reports health, queue depth and throughput per printer
+- a job's print_progress tracker (optional) follows it through the queue and the
+  printer job, and is finished when its Future resolves
+- a job's deadline (optional, deadline.py) bounds queueing and printing: a job
+  still queued when it runs out fails with DeadlineExceeded instead of printing
+  late, a batch runs against its tightest deadline (batch mates with budget
+  left are requeued if it runs out), and a timed-out job is not retried
+  elsewhere
+
+With no pooled printers the pool hands jobs to PrintEngine.print_file() (and a
+bulk run to print_batch()), i.e. the single auto-discovered printer as before.
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional
+
+from deadline import Deadline, DeadlineExceeded
+from niimbot_protocol import PrinterError
+from print_engine import PrintEngine, PrintResult
+from print_progress import ProgressTracker, group
+from printer_registry import KnownPrinter
+
+DEFAULT_JOB_S = 5.0        # assumed label time until a printer has printed a few
+
+
+@dataclass
+class PoolConfig:
+    offline_hold_s: float = 30.0       # skip a printer this long after a failed job
+    job_wait_s: float = 120.0          # print_file(): queueing + printing
+    throughput_window: int = 20        # recent jobs used for avg time / labels per minute
+    batch_max: int = 20                # queued jobs a printer sends as one multi-page job
+
+
+@dataclass
+class PrintJob:
+    image_path: str
+    label_size: Optional[str] = None
+    copies: int = 1
+    attempts: int = 0
+    future: Future = field(default_factory=Future)
+    excluded: List[str] = field(default_factory=list)   # printers that already failed it
+    tracker: Optional[ProgressTracker] = None
+    deadline: Optional[Deadline] = None
+
+    @property
+    def expired(self) -> bool:
+        return self.deadline is not None and self.deadline.expired
+
+
+def _track(future: Future, tracker: Optional[ProgressTracker]):
+    # The tracker ends with the Future, whichever path resolves it
+    if tracker is None:
+        return
+
+    def finish(f: Future):
+        error = f.exception()
+        if isinstance(error, PrinterError):
+            tracker.finish(False, f"Printer error: {error.message}", error.kind)
+        elif isinstance(error, DeadlineExceeded):
+            tracker.finish(False, str(error), "timeout")
+        elif error is not None:
+            tracker.finish(False, f"{type(error).__name__}: {error}")
+        else:
+            tracker.finish(*f.result())
+
+    future.add_done_callback(finish)
+
+
+class PooledPrinter:
+    def __init__(self, pool: "PrinterPool", known: KnownPrinter):
+        self.pool = pool
+        self.transport = known.transport
+        self.address = known.address
+        self.name = known.name
+        self.label_size = known.label_size
+        self.queue: "queue.Queue[Optional[PrintJob]]" = queue.Queue()
+        self.busy = False
+        self.load = 0                    # copies queued or printing
+        self.offline_until = 0.0
+        self.last_error: Optional[str] = None
+        self.jobs_done = 0
+        self.labels_done = 0
+        self.jobs_failed = 0
+        self.recent: Deque[float] = deque(maxlen=pool.config.throughput_window)  # seconds per copy
+        self._thread = threading.Thread(target=self._run, name=f"pool-{self.address}", daemon=True)
+        self._thread.start()
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.offline_until
+
+    @property
+    def health(self) -> str:
+        if not self.healthy:
+            return "offline"
+        return "printing" if self.busy else "ready"
+
+    @property
+    def avg_copy_s(self) -> float:
+        return sum(self.recent) / len(self.recent) if self.recent else DEFAULT_JOB_S
+
+    @property
+    def depth(self) -> int:
+        return self.queue.qsize() + self.busy
+
+    def expected_wait_s(self) -> float:
+        return self.load * self.avg_copy_s
+
+    def accepts(self, label_size: Optional[str]) -> bool:
+        return not label_size or not self.label_size or self.label_size == label_size
+
+    def _unload(self, copies: int):
+        # load is also read and raised by the pool's dispatch, under its lock
+        with self.pool._lock:
+            self.load -= copies
+
+    def _take_batch(self, first: PrintJob) -> List[PrintJob]:
+        # Whatever is already queued here goes out with it as one multi-page job
+        jobs = [first]
+        while len(jobs) < self.pool.config.batch_max:
+            try:
+                job = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                self.queue.put(None)
+                break
+            jobs.append(job)
+        return jobs
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            jobs = self._expire(self._take_batch(job))
+            if not jobs:
+                continue
+            labels = [(j.image_path, j.copies) for j in jobs]
+            self.busy = True
+            t0 = time.monotonic()
+            error: Optional[Exception] = None
+            try:
+                done, message = self.pool.engine.print_on_many(self.transport, self.address, labels,
+                                                               group([j.tracker for j in jobs]),
+                                                               Deadline.earliest(j.deadline for j in jobs))
+            except PrinterError as e:
+                error, done, message = e, e.labels_done, f"Printer error: {e.message}"
+            except DeadlineExceeded as e:
+                error, done, message = e, e.labels_done, str(e)
+            except Exception as e:
+                done, message = 0, f"{type(e).__name__}: {e}"
+            finally:
+                self.busy = False
+            elapsed = time.monotonic() - t0
+            printed = sum(j.copies for j in jobs[:done])
+            for j in jobs[:done]:
+                self._unload(j.copies)
+                self.jobs_done += 1
+                self.labels_done += j.copies
+                self.recent.append(elapsed / printed)
+                j.future.set_result((True, f"{message} [{self.name or self.address}]"))
+            if done == len(jobs):
+                self.last_error = None
+                continue
+            if isinstance(error, DeadlineExceeded):
+                # Out of time, not the printer's fault: it stays in rotation. The batch ran
+                # on its tightest deadline, so batch mates with budget left go again
+                for j in jobs[done:]:
+                    if j.expired:
+                        self._unload(j.copies)
+                        j.future.set_exception(j.deadline.exceeded(error.stage))
+                    else:
+                        self.queue.put(j)
+                continue
+            self.jobs_failed += 1
+            self.last_error = message
+            self.offline_until = time.monotonic() + self.pool.config.offline_hold_s
+            print(f"⚠️  Pool: {self.name or self.address} failed ({message}), offline for "
+                  f"{self.pool.config.offline_hold_s:.0f}s")
+            for j in jobs[done:]:
+                self._unload(j.copies)
+                self.pool._retry(j, self, message, error)
+            self._drain(message, error)
+
+    def _expire(self, jobs: List[PrintJob]) -> List[PrintJob]:
+        # Jobs whose deadline ran out in the queue fail now instead of printing late
+        live = []
+        for job in jobs:
+            if job.expired:
+                self._unload(job.copies)
+                job.future.set_exception(job.deadline.exceeded("queue"))
+            else:
+                live.append(job)
+        return live
+
+    def _drain(self, message: str, error: Optional[PrinterError] = None):
+        # Jobs still waiting here move to other printers instead of failing one by one
+        while True:
+            try:
+                job = self.queue.get_nowait()
+            except queue.Empty:
+                return
+            if job is None:
+                self.queue.put(None)
+                return
+            job.attempts -= 1  # never ran here
+            self._unload(job.copies)
+            self.pool._retry(job, self, message, error)
+
+    def stop(self):
+        self.queue.put(None)
+
+    def status(self) -> dict:
+        return {
+            "address": self.address,
+            "transport": self.transport,
+            "name": self.name,
+            "label_size": self.label_size,
+            "health": self.health,
+            "queue_depth": self.depth,
+            "queued_labels": self.load,
+            "jobs_done": self.jobs_done,
+            "labels_done": self.labels_done,
+            "jobs_failed": self.jobs_failed,
+            "avg_label_s": round(self.avg_copy_s, 2) if self.recent else None,
+            "labels_per_min": round(60.0 / self.avg_copy_s, 1) if self.recent else None,
+            "last_error": self.last_error,
+        }
+
+
+class PrinterPool:
+    def __init__(self, engine: PrintEngine, config: Optional[PoolConfig] = None):
+        self.engine = engine
+        self.config = config or PoolConfig()
+        self.printers: Dict[str, PooledPrinter] = {}
+        self._lock = threading.Lock()
+        self.reload()
+
+    # -----------------------------
+    # Membership
+    # -----------------------------
+
+    def reload(self):
+        """Sync pool members with the registry's pooled printers."""
+        pooled = {p.address: p for p in self.engine.registry.all() if p.pooled}
+        with self._lock:
+            for address in list(self.printers):
+                if address not in pooled:
+                    self.printers.pop(address).stop()
+            for address, known in pooled.items():
+                member = self.printers.get(address)
+                if member is None:
+                    self.printers[address] = PooledPrinter(self, known)
+                else:
+                    member.label_size, member.name = known.label_size, known.name
+
+    def add(self, transport: str, address: str, *, name: Optional[str] = None,
+            label_size: Optional[str] = None):
+        self.engine.registry.set_pooled(address, transport, name=name, label_size=label_size)
+        self.reload()
+
+    def remove(self, address: str):
+        known = self.engine.registry.get(address)
+        if known:
+            self.engine.registry.set_pooled(address, known.transport, pooled=False)
+        self.reload()
+
+    # -----------------------------
+    # Dispatch
+    # -----------------------------
+
+    def _pick(self, job: PrintJob) -> Optional[PooledPrinter]:
+        candidates = [p for p in self.printers.values()
+                      if p.accepts(job.label_size) and p.address not in job.excluded]
+        healthy = [p for p in candidates if p.healthy]
+        if not healthy:
+            return None
+        return min(healthy, key=lambda p: (p.expected_wait_s(), p.load))
+
+    def _dispatch(self, job: PrintJob) -> bool:
+        with self._lock:
+            printer = self._pick(job)
+            if printer is None:
+                return False
+            job.attempts += 1
+            printer.load += job.copies
+            printer.queue.put(job)  # under the lock, so the next pick sees the new load
+        if job.deadline:
+            job.deadline.stage = "queue"
+        if job.tracker:
+            job.tracker.stage("queued", backend=printer.transport)
+        return True
+
+    def _retry(self, job: PrintJob, failed: PooledPrinter, message: str,
+               error: Optional[PrinterError] = None):
+        job.excluded.append(failed.address)
+        if job.attempts >= 2 or job.expired or not self._dispatch(job):
+            if error is not None:
+                job.future.set_exception(error)  # typed, for /print-label
+            else:
+                job.future.set_result((False, message))
+
+    def submit(self, image_path: str, label_size: Optional[str] = None, copies: int = 1,
+               tracker: Optional[ProgressTracker] = None, deadline: Optional[Deadline] = None) -> Future:
+        """
+        Queue one label (`copies` copies, one job); the Future resolves to
+        (success, message), or raises PrinterError if every printer tried
+        rejected it, DeadlineExceeded if `deadline` ran out first.
+        """
+        job = PrintJob(image_path, label_size, copies, tracker=tracker, deadline=deadline)
+        _track(job.future, tracker)
+        if not self.printers:
+            if tracker:
+                tracker.stage("queued")
+
+            def run():
+                try:
+                    job.future.set_result(self.engine.print_file(image_path, copies, tracker, deadline))
+                except Exception as e:
+                    job.future.set_exception(e)
+            threading.Thread(target=run, daemon=True).start()
+        elif not self._dispatch(job):
+            size = f" with {label_size} labels" if label_size else ""
+            job.future.set_result((False, f"No healthy printer{size} in the pool"))
+        return job.future
+
+    def submit_many(self, image_paths: List[str], label_size: Optional[str] = None,
+                    copies: Optional[List[int]] = None,
+                    trackers: Optional[List[ProgressTracker]] = None,
+                    deadline: Optional[Deadline] = None) -> List[Future]:
+        """Bulk run striped across the matching printers, all within one `deadline`."""
+        copies = copies or [1] * len(image_paths)
+        trackers = trackers or [None] * len(image_paths)
+        if not self.printers:
+            # One printer: the whole run is one multi-page job, in order
+            futures = [Future() for _ in image_paths]
+            for fut, tracker in zip(futures, trackers):
+                _track(fut, tracker)
+            batch_tracker = group(trackers)
+            if batch_tracker:
+                batch_tracker.stage("queued")
+
+            def run_all():
+                try:
+                    results = self.engine.print_batch(list(zip(image_paths, copies)), batch_tracker, deadline)
+                except (PrinterError, DeadlineExceeded) as e:
+                    # Labels before the error did print
+                    for i, fut in enumerate(futures):
+                        if i < e.labels_done:
+                            fut.set_result((True, f"Printed (job stopped later: {e.message})"))
+                        else:
+                            fut.set_exception(e)
+                    return
+                except Exception as e:
+                    results = [(False, f"{type(e).__name__}: {e}")] * len(futures)
+                for fut, result in zip(futures, results):
+                    fut.set_result(result)
+            threading.Thread(target=run_all, daemon=True).start()
+            return futures
+        return [self.submit(path, label_size, n, tracker, deadline)
+                for path, n, tracker in zip(image_paths, copies, trackers)]
+
+    def print_file(self, image_path: str, label_size: Optional[str] = None, copies: int = 1,
+                   tracker: Optional[ProgressTracker] = None, deadline: Optional[Deadline] = None) -> PrintResult:
+        future = self.submit(image_path, label_size, copies, tracker, deadline)
+        try:
+            return future.result(deadline.cap(threading.TIMEOUT_MAX) if deadline else self.config.job_wait_s)
+        except DeadlineExceeded:
+            raise
+        except FutureTimeoutError:  # not the builtin TimeoutError before Python 3.11
+            if deadline:
+                raise deadline.exceeded() from None
+            return False, "Print timeout - pool queue too long"
+
+    # -----------------------------
+    # Reporting
+    # -----------------------------
+
+    def status(self) -> dict:
+        printers = [p.status() for p in self.printers.values()]
+        return {
+            "printers": printers,
+            "queued": sum(p["queue_depth"] for p in printers),
+            "labels_per_min": round(sum(p["labels_per_min"] or 0 for p in printers), 1),
+        }
+
+    def stop(self):
+        with self._lock:
+            for printer in self.printers.values():
+                printer.stop()
+            self.printers.clear()
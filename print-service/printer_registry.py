@@ -0,0 +1,223 @@
+"""
+Known printers + fast BLE discovery.
+
+Every script used to run a full 5 s BleakScanner.discover() and take the first
+device with "B1" in its name. Instead:
+
+1. connect straight to the last known address (no scan at all), and only if that
+   fails
+2. run a filtered scan that returns as soon as the first matching device is seen.
+
+Printers that worked are remembered in known_printers.json next to this file
+(address, name, last RSSI, working transport, last seen, serial baud rate,
+tuned link pacing, BLE channel), so a restart of the service reconnects in well under a
+second.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from bleak import BleakScanner
+
+REGISTRY_FILE = Path(__file__).parent / "known_printers.json"
+
+
+@dataclass
+class KnownPrinter:
+    address: str                  # BLE MAC / serial port
+    name: str = ""
+    rssi: Optional[int] = None
+    transport: str = "ble"        # transport that last worked: "ble", "serial", "usb"
+    last_seen: float = 0.0        # unix time of the last successful connection
+    connects: int = 0
+    usb_id: Optional[str] = None  # "VID:PID" of a serial printer's USB device
+    baudrate: Optional[int] = None  # serial rate the printer answered at
+    pooled: bool = False          # member of the print pool (printer_pool.py)
+    label_size: Optional[str] = None  # label roll loaded, e.g. "40x30"; None = any
+    tuning: Dict[str, dict] = field(default_factory=dict)  # per transport, see flow_control.AdaptivePacer
+    ble_channel: Optional[str] = None  # GATT channel picked by the connect probe, see ble_session
+
+
+class PrinterRegistry:
+    """Small JSON-backed store of printers that have connected successfully."""
+
+    def __init__(self, path: Path = REGISTRY_FILE):
+        self.path = Path(path)
+        self.last_error: Optional[str] = None   # why the last save() failed, None once one works
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._printers: Dict[str, KnownPrinter] = {}
+        self.load()
+
+    def load(self):
+        try:
+            data = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            data = []
+        known = set(KnownPrinter.__dataclass_fields__)
+        with self._lock:
+            self._printers = {
+                p["address"]: KnownPrinter(**{k: v for k, v in p.items() if k in known})
+                for p in data if isinstance(p, dict) and p.get("address")
+            }
+
+    def save(self):
+        # Pool, status and engine threads save concurrently: one at a time, each
+        # writing the latest state, so an older snapshot never replaces a newer one
+        with self._save_lock:
+            with self._lock:
+                data = [asdict(p) for p in self._printers.values()]
+            tmp = None
+            try:
+                with tempfile.NamedTemporaryFile("w", dir=self.path.parent, prefix=self.path.stem,
+                                                 suffix=".tmp", delete=False) as f:
+                    tmp = f.name
+                    json.dump(data, f, indent=2)
+                os.replace(tmp, self.path)
+                self.last_error = None
+            except OSError as e:
+                self.last_error = f"Could not save {self.path.name}: {e}"
+                if tmp:
+                    try:
+                        os.remove(tmp)
+                    except OSError:
+                        pass
+
+    def get(self, address: str) -> Optional[KnownPrinter]:
+        return self._printers.get(address)
+
+    def all(self, transport: Optional[str] = None) -> List[KnownPrinter]:
+        """Known printers, most recently used first."""
+        printers = [p for p in self._printers.values() if transport is None or p.transport == transport]
+        return sorted(printers, key=lambda p: p.last_seen, reverse=True)
+
+    def last(self, transport: Optional[str] = None, name_hint: str = "") -> Optional[KnownPrinter]:
+        for p in self.all(transport):
+            if name_hint in p.name or not p.name:
+                return p
+        return None
+
+    def remember(self, address: str, *, name: Optional[str] = None, rssi: Optional[int] = None,
+                 transport: Optional[str] = None, usb_id: Optional[str] = None,
+                 baudrate: Optional[int] = None) -> KnownPrinter:
+        with self._lock:
+            p = self._printers.get(address) or KnownPrinter(address)
+            if name:
+                p.name = name
+            if rssi is not None:
+                p.rssi = rssi
+            if transport:
+                p.transport = transport
+            if usb_id:
+                p.usb_id = usb_id
+            if baudrate:
+                p.baudrate = baudrate
+            p.last_seen = time.time()
+            p.connects += 1
+            self._printers[address] = p
+        self.save()
+        return p
+
+    def get_tuning(self, address: str, transport: str) -> dict:
+        p = self._printers.get(address)
+        return dict(p.tuning.get(transport, {})) if p else {}
+
+    def set_tuning(self, address: str, transport: str, tuning: dict):
+        with self._lock:
+            p = self._printers.get(address) or KnownPrinter(address, transport=transport)
+            p.tuning[transport] = dict(tuning)
+            self._printers[address] = p
+        self.save()
+
+    def set_ble_channel(self, address: str, channel: Optional[str]):
+        """Remember (None: forget) which GATT channel works best for a BLE printer."""
+        with self._lock:
+            p = self._printers.get(address) or KnownPrinter(address, transport="ble")
+            p.ble_channel = channel
+            self._printers[address] = p
+        self.save()
+
+    def set_pooled(self, address: str, transport: str, *, pooled: bool = True, name: Optional[str] = None,
+                   label_size: Optional[str] = None) -> KnownPrinter:
+        """Add/remove a printer from the print pool and record the label roll it has loaded."""
+        with self._lock:
+            p = self._printers.get(address) or KnownPrinter(address, transport=transport)
+            p.transport = transport
+            p.pooled = pooled
+            if name:
+                p.name = name
+            if label_size is not None:
+                p.label_size = label_size or None
+            self._printers[address] = p
+        self.save()
+        return p
+
+    def forget(self, address: str):
+        with self._lock:
+            removed = self._printers.pop(address, None)
+        if removed:
+            self.save()
+
+
+_default_registry: Optional[PrinterRegistry] = None
+
+
+def get_registry() -> PrinterRegistry:
+    """Process-wide registry backed by REGISTRY_FILE."""
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = PrinterRegistry()
+    return _default_registry
+
+
+# -----------------------------
+# Discovery
+# -----------------------------
+
+async def scan_for_printer(name_hint: str = "B1", timeout: float = 5.0):
+    """
+    Filtered scan that stops at the first advertisement whose name contains
+    `name_hint`. Returns (BLEDevice, rssi) or None.
+    """
+    seen: Dict[str, int] = {}
+
+    def match(device, adv) -> bool:
+        name = device.name or adv.local_name or ""
+        if name_hint in name:
+            seen[device.address] = adv.rssi
+            return True
+        return False
+
+    device = await BleakScanner.find_device_by_filter(match, timeout=timeout)
+    if device is None:
+        return None
+    return device, seen.get(device.address)
+
+
+async def find_printer(name_hint: str = "B1", *, registry: Optional[PrinterRegistry] = None,
+                       cached_timeout: float = 2.0, scan_timeout: float = 5.0):
+    """
+    Discovery for scripts that want a BLEDevice: look for the last known address
+    first (returns the moment it advertises), then fall back to a filtered scan.
+    The result is recorded in the registry. Returns a BLEDevice or None.
+    """
+    registry = registry or get_registry()
+    known = registry.last("ble", name_hint)
+    if known:
+        device = await BleakScanner.find_device_by_address(known.address, timeout=cached_timeout)
+        if device:
+            registry.remember(device.address, name=device.name, transport="ble")
+            return device
+
+    found = await scan_for_printer(name_hint, scan_timeout)
+    if not found:
+        return None
+    device, rssi = found
+    registry.remember(device.address, name=device.name, rssi=rssi, transport="ble")
+    return device
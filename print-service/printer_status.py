@@ -0,0 +1,244 @@
+"""
+Background printer status cache for /health.
+
+/health used to return a static {"status": "ok"}, so the web app only found out
+that the cover was open or the battery flat by trying a print. StatusMonitor
+keeps a LinkStatus per open printer link (BLE sessions on the engine loop, open
+serial sessions) and /health answers straight from it:
+
+- every Heartbeat / PrinterInfo / RfidInfo seen on a link updates the cache,
+  including the session keepalive replies, so most updates cost nothing
+- if no heartbeat reply has been seen for `heartbeat_every_s`, one is sent;
+  battery (info 10) and the label roll RFID tag (0x1A, as get_printer_info.py
+  does by hand) are refreshed every `info_every_s`
+- polls only use links that are already connected and idle: a link with a job
+  running is skipped, a disconnected one is not woken up (no battery drain),
+  and a poll never counts as activity for the idle disconnect
+
+Every group of fields carries the unix time it was last updated, and as_dict()
+adds its age, so the caller can judge freshness.
+"""
+
+import asyncio
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from niimbot_protocol import (CMD_HEARTBEAT, CMD_PRINTER_INFO, CMD_RFID_INFO, INFO_BATTERY, Heartbeat,
+                              PrinterErrorResponse, PrinterInfo, RfidInfo, make_packet)
+from serial_session import open_sessions
+
+if TYPE_CHECKING:
+    from print_engine import PrintEngine
+
+HEARTBEAT_QUERY = (make_packet(CMD_HEARTBEAT, b"\x01"), Heartbeat)
+INFO_QUERIES = (
+    (make_packet(CMD_PRINTER_INFO, bytes([INFO_BATTERY])), PrinterInfo),
+    (make_packet(CMD_RFID_INFO, b"\x01"), RfidInfo),
+)
+
+
+@dataclass
+class StatusConfig:
+    tick_s: float = 1.0
+    heartbeat_every_s: float = 15.0    # poll if no heartbeat reply was seen for this long
+    info_every_s: float = 120.0        # battery + label roll
+    query_timeout_s: float = 0.5
+    stale_after_s: float = 45.0        # heartbeat older than this: not "ready"
+
+
+@dataclass
+class LinkStatus:
+    transport: str
+    address: str
+    connected: bool = False
+    cover_closed: Optional[bool] = None
+    paper_loaded: Optional[bool] = None
+    power_level: Optional[int] = None  # heartbeat battery bars, 1..4
+    battery: Optional[int] = None      # printer info 10
+    label: Optional[dict] = None       # RFID tag of the loaded roll (RfidInfo)
+    last_error: Optional[str] = None   # last 0xDB error frame seen
+    channel: Optional[str] = None      # BLE GATT channel in use (ble_session)
+    drops: int = 0                     # BLE link drops
+    recoveries: int = 0                # jobs resumed after a drop
+    rows_resent: int = 0               # rows those resumes sent again
+    last_recovery_s: Optional[float] = None  # drop -> reconnected, last time
+    heartbeat_at: Optional[float] = None
+    info_at: Optional[float] = None
+    label_at: Optional[float] = None
+    error_at: Optional[float] = None
+
+    def ready(self, stale_after_s: float) -> bool:
+        fresh = self.heartbeat_at is not None and time.time() - self.heartbeat_at < stale_after_s
+        return self.connected and fresh and self.cover_closed is not False and self.paper_loaded is not False
+
+    def as_dict(self, stale_after_s: float) -> dict:
+        now = time.time()
+        data = asdict(self)
+        for key in ("heartbeat", "info", "label", "error"):
+            at = data[f"{key}_at"]
+            data[f"{key}_age_s"] = round(now - at, 1) if at else None
+        data["ready"] = self.ready(stale_after_s)
+        return data
+
+
+class StatusMonitor:
+    def __init__(self, engine: "PrintEngine", config: Optional[StatusConfig] = None):
+        self.engine = engine
+        self.config = config or StatusConfig()
+        self.links: Dict[str, LinkStatus] = {}
+        self.polls = 0
+        self._lock = threading.Lock()       # serial replies arrive on reader threads
+        self._watched: Dict[str, int] = {}  # link key -> id(rx) already subscribed
+        self._polled: Dict[Tuple[str, str, str], float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    # -----------------------------
+    # Cache
+    # -----------------------------
+
+    def _entry(self, transport: str, address: str) -> LinkStatus:
+        key = f"{transport}:{address}"
+        with self._lock:
+            if key not in self.links:
+                self.links[key] = LinkStatus(transport, address)
+            return self.links[key]
+
+    def _on_response(self, status: LinkStatus, resp):
+        now = time.time()
+        with self._lock:
+            if isinstance(resp, Heartbeat):
+                if resp.closing_state is not None:
+                    status.cover_closed = resp.closing_state == 0
+                if resp.paper_state is not None:
+                    status.paper_loaded = resp.paper_state == 0
+                if resp.power_level is not None:
+                    status.power_level = resp.power_level
+                status.heartbeat_at = now
+            elif isinstance(resp, PrinterInfo) and resp.key == INFO_BATTERY:
+                status.battery = int(resp.value)
+                status.info_at = now
+            elif isinstance(resp, RfidInfo):
+                status.label = asdict(resp)
+                status.label_at = now
+            elif isinstance(resp, PrinterErrorResponse):
+                status.last_error = resp.message
+                status.error_at = now
+
+    def _watch(self, transport: str, address: str, rx) -> LinkStatus:
+        status = self._entry(transport, address)
+        key = f"{transport}:{address}"
+        if self._watched.get(key) != id(rx):
+            self._watched[key] = id(rx)
+            rx.subscribe(lambda resp: self._on_response(status, resp))
+        return status
+
+    def snapshot(self) -> List[dict]:
+        with self._lock:
+            links = list(self.links.values())
+        return [s.as_dict(self.config.stale_after_s) for s in links]
+
+    @property
+    def ready(self) -> bool:
+        with self._lock:
+            return any(s.ready(self.config.stale_after_s) for s in self.links.values())
+
+    # -----------------------------
+    # Polling
+    # -----------------------------
+
+    def _due(self, status: LinkStatus) -> List[Tuple[bytes, type]]:
+        cfg = self.config
+        now = time.time()
+        key = (status.transport, status.address)
+        queries = []
+        last_hb = max(status.heartbeat_at or 0, self._polled.get(key + ("hb",), 0))
+        if now - last_hb >= cfg.heartbeat_every_s:
+            queries.append(HEARTBEAT_QUERY)
+            self._polled[key + ("hb",)] = now
+        if now - self._polled.get(key + ("info",), 0) >= cfg.info_every_s:
+            queries.extend(INFO_QUERIES)
+            self._polled[key + ("info",)] = now
+        return queries
+
+    # The link is taken for one query at a time (<= query_timeout_s), so a job
+    # that arrives mid-poll waits at most that long
+
+    async def _poll_ble(self, session, queries):
+        for packet, response_type in queries:
+            if session.busy or not session.connected:
+                return
+            async with session.background():
+                reply = session.rx.expect(response_type)
+                try:
+                    await session.write(packet)
+                    await asyncio.wait_for(reply, self.config.query_timeout_s)
+                except Exception:
+                    reply.cancel()
+
+    def _poll_serial(self, session, queries):
+        for packet, response_type in queries:
+            if not session.job_lock.acquire(blocking=False):
+                return  # a label started in the meantime
+            try:
+                reply = session.expect(response_type)
+                try:
+                    session.write(packet)
+                    reply.result(self.config.query_timeout_s)
+                except Exception:
+                    reply.cancel()
+            finally:
+                session.job_lock.release()
+
+    async def _tick(self):
+        engine = self.engine
+        loop = asyncio.get_running_loop()
+        for session in [engine.session, *engine.sessions.values()]:
+            if session is None or not session.address:
+                continue
+            status = self._watch("ble", session.address, session.rx)
+            status.connected = session.connected
+            with self._lock:
+                status.channel = session.link.channel
+                status.drops, status.recoveries = session.drops, session.recoveries
+                status.rows_resent, status.last_recovery_s = session.rows_resent, session.last_recovery_s
+            if session.connected and not session.busy:
+                queries = self._due(status)
+                if queries:
+                    self.polls += 1
+                    await self._poll_ble(session, queries)
+
+        for session in open_sessions():
+            status = self._watch("serial", session.port, session.rx)
+            status.connected = session.is_open
+            if not session.job_lock.locked():
+                queries = self._due(status)
+                if queries:
+                    self.polls += 1
+                    await loop.run_in_executor(None, self._poll_serial, session, queries)
+
+        # Links that went away (closed serial port) stay cached, just not connected
+        open_ports = {s.port for s in open_sessions()}
+        with self._lock:
+            for status in self.links.values():
+                if status.transport == "serial" and status.address not in open_ports:
+                    status.connected = False
+
+    async def _run(self):
+        while True:
+            try:
+                await self._tick()
+            except Exception as e:
+                print(f"⚠️  Status poll failed: {e}")
+            await asyncio.sleep(self.config.tick_s)
+
+    def start(self):
+        """Start polling (call on the engine loop)."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
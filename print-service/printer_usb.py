@@ -6,57 +6,39 @@ import serial
 import serial.tools.list_ports
 from PIL import Image, ImageOps
 import struct
-import math
+import threading
 import time
-
-def make_packet(command: int, data: bytes = b'') -> bytes:
-    """Create Niimbot protocol packet with checksum"""
-    length = len(data)
-    payload = bytes([command, length]) + data
-    checksum = 0
-    for b in payload:
-        checksum ^= b
-    return b'\x55\x55' + payload + bytes([checksum]) + b'\xAA\xAA'
+from command_link import SerialCommandLink
+from deadline import Deadline, DeadlineExceeded
+from niimbot_protocol import PrinterError, make_packet
+from flow_control import AdaptivePacer, FlowConfig, pages_printed, send_rows_serial, wait_pages_serial
+from print_progress import page_counter
+from printer_registry import get_registry
+from port_registry import get_port_registry
+from serial_session import get_serial_session
+import rowops
 
 def find_niimbot_port():
-    """Auto-detect Niimbot USB port"""
-    ports = serial.tools.list_ports.comports()
-    
-    for port in ports:
-        desc = (port.description or '').lower()
-        mfg = (port.manufacturer or '').lower()
-        
-        if 'niimbot' in desc or 'niimbot' in mfg:
-            return port.device
-    
-    # If not found, return None
-    return None
+    """Auto-detect Niimbot USB port (cached scan, see port_registry)"""
+    return get_port_registry().best()
 
 def process_image(image_path: str):
     """Process image for B1 printer"""
     img = Image.open(image_path).convert('L')
     
-    # B1 native width is 384 pixels
-    TARGET_WIDTH = 384
-    if img.width != TARGET_WIDTH:
-        new_img = Image.new('L', (TARGET_WIDTH, img.height), 255)
-        x_offset = (TARGET_WIDTH - img.width) // 2
-        new_img.paste(img, (x_offset, 0))
-        img = new_img
-        print(f"⚠️  Image centered: {Image.open(image_path).width}px → {TARGET_WIDTH}px")
+    # Invert BEFORE 1-bit conversion (1 bit = burn), then center on the
+    # native 384px head directly on the packed rows
+    rows, src_width, height = rowops.from_1bit(ImageOps.invert(img).convert('1'))
     
-    width, height = img.size
+    TARGET_WIDTH = 384
+    if src_width != TARGET_WIDTH:
+        print(f"⚠️  Image centered: {src_width}px → {TARGET_WIDTH}px")
+    rows = rowops.pad_center(rows, src_width, TARGET_WIDTH)
+    width = TARGET_WIDTH
     print(f"📐 Image dimensions: {width}x{height}")
     
-    # Invert BEFORE 1-bit conversion
-    img = ImageOps.invert(img).convert('1')
-    
     packets = []
-    for y in range(height):
-        line_data = [img.getpixel((x, y)) for x in range(width)]
-        line_data = "".join("0" if pix == 0 else "1" for pix in line_data)
-        line_bytes = int(line_data, 2).to_bytes(math.ceil(width / 8), "big")
-        
+    for y, line_bytes in enumerate(rows):
         # Header: row_number (2 bytes) + 3 zeros + repeat (1 byte)
         header = struct.pack(">H", y) + b'\x00\x00\x00' + b'\x01'
         pkt = make_packet(0x85, header + line_bytes)
@@ -64,134 +46,210 @@ def process_image(image_path: str):
     
     return packets, width, height
 
-def send_packet(ser, packet, delay=0.0):
-    """Send packet to printer via serial"""
-    ser.write(packet)
-    if delay > 0:
-        time.sleep(delay)
-    
-    # Try to read response
-    time.sleep(0.01)  # Small delay for response
-    if ser.in_waiting > 0:
-        response = ser.read(ser.in_waiting)
-        print(f"🔔 RX: {response.hex()}")
-
 def print_label_usb(image_path: str, port: str = None, quantity: int = 1):
-    """Print label via USB serial"""
+    """Print label via USB serial, `quantity` copies in one job (the port stays open for the next label)"""
+    return print_labels_usb([(image_path, quantity)], port) == 1
+
+def print_labels_usb(labels, port: str = None, pages_ahead: int = 1, tracker=None, deadline=None):
+    """
+    Print several labels [(image_path, copies), ...] as one multi-page job:
+    one handshake, then PageStart/size/rows/PageEnd per label. The next label
+    is sent while the previous one prints (at most `pages_ahead` ahead).
+    Returns how many labels the printer confirmed; raises PrinterError
+    (niimbot_protocol) if the printer rejects the job, DeadlineExceeded if
+    `deadline` (deadline.Deadline) runs out first. `tracker`
+    (print_progress) gets label / row / page counter progress.
+    """
+    deadline = deadline or Deadline(None)
     
     # Find port if not specified
     if not port:
+        deadline.enter("discovery")
         print("🔍 Auto-detecting Niimbot USB port...")
         port = find_niimbot_port()
         if not port:
             print("❌ Could not find Niimbot USB port!")
             print("\nRun: python find_niimbot_usb.py")
             print("Then specify port manually: python printer_usb.py image.png COM3")
-            return False
+            return 0
     
     print(f"📍 Using port: {port}")
     
-    # Process image
-    packets, width, height = process_image(image_path)
-    print(f"🖨️  Printing: {width}x{height} pixels ({len(packets)} rows)...")
+    # Process images
+    if tracker:
+        tracker.stage("encode")
+    pages = []
+    for image_path, copies in labels:
+        packets, width, height = process_image(image_path)
+        pages.append((packets, width, height, max(1, copies)))
+    rows = sum(len(p[0]) for p in pages)
+    print(f"🖨️  Printing: {len(pages)} label(s), {rows} rows...")
     
+    session = get_serial_session(port)
+    # Another label on this port goes first, but not past our deadline
+    deadline.enter("queue")
+    if not session.job_lock.acquire(timeout=deadline.cap(threading.TIMEOUT_MAX)):
+        raise deadline.exceeded()
     try:
-        # Open serial connection
-        # Try common baud rates: 115200, 9600, 19200
-        for baudrate in [115200, 9600, 19200]:
-            try:
-                print(f"🔌 Connecting at {baudrate} baud...")
-                ser = serial.Serial(
-                    port=port,
-                    baudrate=baudrate,
-                    bytesize=serial.EIGHTBITS,
-                    parity=serial.PARITY_NONE,
-                    stopbits=serial.STOPBITS_ONE,
-                    timeout=1
-                )
-                print(f"✅ Connected at {baudrate} baud")
-                break
-            except Exception as e:
-                if baudrate == 19200:  # Last attempt
-                    raise
-                continue
-        
-        # Clear any pending data
-        ser.reset_input_buffer()
-        ser.reset_output_buffer()
+        # Opens once; the baud rate that answered is remembered per port
+        deadline.enter("connect")
+        if not session.is_open:
+            print(f"🔌 Opening {port}...")
+            session.open(deadline)
+        # Each command waits for the printer's reply (resent if it gets lost);
+        # an error frame (cover open, no paper...) aborts the job at once
+        total_pages = sum(copies for *_, copies in pages)
+        with SerialCommandLink(session, deadline=deadline) as commands, page_counter(tracker, session.rx, total_pages):
+            commands.silent = not session.verified  # nothing answered when the port was opened
+            return _print_job(session, commands, pages, pages_ahead, tracker, deadline)
         
+    except (PrinterError, DeadlineExceeded):
+        raise
+    except serial.SerialException as e:
+        session.close()
+        print(f"\n❌ Serial Error: {e}")
+        print("\nTroubleshooting:")
+        print("1. Check if port is correct (run find_niimbot_usb.py)")
+        print("2. Make sure no other program is using the port")
+        print("3. Try unplugging and replugging the USB cable")
+        return getattr(e, "labels_done", 0)
+    except Exception as e:
+        print(f"\n❌ Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return getattr(e, "labels_done", 0)
+    finally:
+        session.job_lock.release()
+
+def _labels_done(pages, printed):
+    # Pages (with all their copies) covered by the printer's page counter
+    done = total = 0
+    for *_, copies in pages:
+        total += copies
+        if total > printed:
+            break
+        done += 1
+    return done
+
+def _print_job(session, commands, pages, pages_ahead=1, tracker=None, deadline=None):
+    port = session.port
+    total_pages = sum(copies for *_, copies in pages)
+    
+    deadline = deadline or Deadline(None)
+    sent_pages = printed = 0
+    try:
         # === INITIALIZATION (Variant 3 - Working) ===
         print("\n🔧 Initializing printer...")
+        deadline.enter("handshake")
         
         # Heartbeat
-        send_packet(ser, make_packet(0xDC, b'\x01'), 0.1)
+        commands.request(0xDC, b'\x01')
         
         # Set label density (1-5, default 3)
-        send_packet(ser, make_packet(0x21, b'\x03'), 0.1)
+        commands.request(0x21, b'\x03')
         
         # Set label type (1=gap label, 2=black mark, 3=continuous)
-        send_packet(ser, make_packet(0x23, b'\x01'), 0.1)
-        
-        # Start print job
-        send_packet(ser, make_packet(0x01, b'\x01'), 0.2)
+        commands.request(0x23, b'\x01')
         
-        # Start page
-        send_packet(ser, make_packet(0x03, b'\x01'), 0.1)
+        # Start print job; several pages need the total in PrintStart (8-byte form, as over BLE)
+        if total_pages == 1:
+            commands.request(0x01, b'\x01')
+        else:
+            commands.request(0x01, struct.pack('>H', total_pages) + b'\x00\x00\x00\x00\x00\x01')
         
-        # SET_DIMENSION: (height, width) - Variant 3 format
-        print(f"📏 Setting dimensions: height={height}, width={width}")
-        dim_packet = make_packet(0x13, struct.pack('>HH', height, width))
-        print(f"   Packet: {dim_packet.hex()}")
-        send_packet(ser, dim_packet, 0.1)
+        def show_progress(sent, total):
+            print(f"   Progress: {sent}/{total} rows", end='\r')
+            if tracker:
+                tracker.rows(sent, total)
         
-        # Set quantity
-        send_packet(ser, make_packet(0x15, struct.pack('>H', quantity)), 0.1)
+        # Window starts from the last tuning for this port and adapts as it goes
+        pacer = AdaptivePacer.for_printer(get_registry(), port, "serial")
+        clean = True
+        silent = commands.silent
         
-        # === SEND IMAGE DATA ===
-        print(f"\n📤 Sending image data...")
-        for i, pkt in enumerate(packets):
-            ser.write(pkt)
-            time.sleep(0.01)  # 10ms delay between rows
+        for index, (packets, width, height, quantity) in enumerate(pages):
+            deadline.enter("transmit")
+            # Don't run more than `pages_ahead` pages ahead of the print head
+            behind = sum(copies for *_, copies in pages[:max(0, index - pages_ahead)])
+            if printed < behind and not silent:
+                status = wait_pages_serial(session, pages=behind, timeout_s=10.0, deadline=deadline)
+                if status is None:
+                    silent = True
+                else:
+                    printed = pages_printed(status, behind)
+                    if printed < behind:
+                        print(f"❌ Printer stuck at page {printed}/{total_pages}")
+                        break
+            if silent and index:
+                time.sleep(1.0)  # silent printer: the old fixed wait per page
             
-            # Read any responses
-            if ser.in_waiting > 0:
-                response = ser.read(ser.in_waiting)
-                # Only print occasionally to avoid spam
-                if i % 50 == 0:
-                    print(f"   🔔 RX: {response.hex()}")
+            # Start page
+            commands.request(0x03, b'\x01')
             
-            if (i + 1) % 50 == 0:
-                print(f"   Progress: {i+1}/{len(packets)} rows", end='\r')
-        
-        print(f"\n✅ All {len(packets)} rows sent!")
+            # SET_DIMENSION: (height, width) - Variant 3 format
+            print(f"📏 Setting dimensions: height={height}, width={width}")
+            dim_data = struct.pack('>HH', height, width)
+            print(f"   Packet: {make_packet(0x13, dim_data).hex()}")
+            commands.request(0x13, dim_data)
+            
+            # Set quantity
+            commands.request(0x15, struct.pack('>H', quantity))
+            
+            # === SEND IMAGE DATA ===
+            # Windows of rows go out in one write each, paced by PrintStatus replies;
+            # 10ms per row only if the printer doesn't answer
+            print(f"\n📤 Sending image data (label {index + 1}/{len(pages)})...")
+            if tracker:
+                tracker.start_label(index, len(pages), len(packets))
+            stats = send_rows_serial(session, packets, FlowConfig(fallback_delay_s=0.01), progress=show_progress,
+                                     pacer=pacer, deadline=deadline)
+            
+            rate = sum(map(len, packets)) / stats.elapsed_s / 1024 if stats.elapsed_s else 0.0
+            print(f"\n✅ All {len(packets)} rows sent in {stats.elapsed_s:.2f}s "
+                  f"(window {pacer.window_rows}, {rate:.0f} KB/s)!")
+            clean = clean and bool(stats.acks) and not stats.errors
+            
+            # End page
+            commands.request(0xE3, b'\x01')
+            sent_pages += quantity
         
         # === FINALIZATION ===
-        time.sleep(0.5)
-        
-        # End page
-        send_packet(ser, make_packet(0xE3, b'\x01'), 0.5)
+        # Wait until the printer reports every page/copy that was sent done
+        deadline.enter("printing")
+        if tracker:
+            tracker.stage("printing")
+        status = None if silent else wait_pages_serial(session, pages=sent_pages, timeout_s=10.0, deadline=deadline)
+        if status is None:
+            time.sleep(1.0)  # silent printer: the old fixed wait
+            printed = sent_pages
+        else:
+            printed = pages_printed(status, sent_pages)
+            if printed < total_pages:
+                deadline.check()  # cut short by the deadline rather than a stuck printer
+                print(f"❌ Printer reported {printed}/{total_pages} pages done")
+            elif clean:
+                pacer.save()
         
         # End print job
-        send_packet(ser, make_packet(0xF3, b'\x01'), 0.5)
+        commands.request(0xF3, b'\x01')
         
-        print("✅ Print job completed!")
-        
-        # Close serial port
-        ser.close()
-        return True
-        
-    except serial.SerialException as e:
-        print(f"\n❌ Serial Error: {e}")
-        print("\nTroubleshooting:")
-        print("1. Check if port is correct (run find_niimbot_usb.py)")
-        print("2. Make sure no other program is using the port")
-        print("3. Try unplugging and replugging the USB cable")
-        return False
+        done = _labels_done(pages, printed)
+        if done == len(pages):
+            print(f"✅ Print job completed ({len(pages)} label(s), {total_pages} printed)!")
+        return done
+    except (PrinterError, DeadlineExceeded) as e:
+        # Rejected by the printer (or out of time): no more rows, just close the job on it
+        print(f"\n❌ Printer error: {e.message}" if isinstance(e, PrinterError) else f"\n❌ {e}")
+        e.labels_done = _labels_done(pages, printed)
+        try:
+            session.write(make_packet(0xF3, b'\x01'))
+        except serial.SerialException:
+            pass
+        raise
     except Exception as e:
-        print(f"\n❌ Error: {e}")
-        import traceback
-        traceback.print_exc()
-        return False
+        # Port gone, unexpected reply...: labels confirmed so far must not be printed again
+        e.labels_done = _labels_done(pages, printed)
+        raise
 
 if __name__ == "__main__":
     import sys
@@ -0,0 +1,201 @@
+"""
+Bit-domain operations on packed printer rows.
+
+A label is a list of rows; each row is MSB-first packed bytes where 1 = burn a dot
+(the exact payload of a 0x85 PrintBitmapRow packet). Once a label is packed it can
+be adjusted here without going back to PIL:
+
+- pad_center(): place a narrower bitmap on the 384-dot head (or center-crop a wider one)
+- invert(), flip_h(), flip_v(), rotate_180(): mirrored / negative media
+- shift(): offset calibration (dots left/right, rows up/down)
+- crop(): trim rows top/bottom, blank dot columns left/right (margins)
+- compose_or(): overlay one bitmap on another (logo, frame, calibration marks)
+
+Rows are handled as whole 384-bit integers or via bytes.translate(), so the cost
+is a few C-level operations per row, never per pixel.
+"""
+
+from typing import List, Tuple
+
+from PIL import Image, ImageOps
+
+TARGET_WIDTH_DOTS = 384  # B1 printhead width in dots (48mm @ 203dpi)
+
+Rows = List[bytes]
+
+INVERT_TABLE = bytes(255 - b for b in range(256))
+REVERSE_BITS_TABLE = bytes(int(f"{b:08b}"[::-1], 2) for b in range(256))
+
+
+def _row_len(width: int) -> int:
+    return (width + 7) // 8
+
+
+def _mask(width: int) -> int:
+    """Mask of the `width` real dots in a packed row (padding bits cleared)."""
+    n = _row_len(width) * 8
+    return ((1 << width) - 1) << (n - width)
+
+
+# -----------------------------
+# PIL boundary
+# -----------------------------
+
+def from_1bit(img: Image.Image) -> Tuple[Rows, int, int]:
+    """
+    Split a mode '1' image into packed rows, bit = pixel value (1 = 255).
+    Returns (rows, width, height).
+    """
+    if img.mode != "1":
+        img = img.convert("1")
+    width, height = img.size
+    data = img.tobytes()
+    n = _row_len(width)
+    return [data[i:i + n] for i in range(0, n * height, n)], width, height
+
+
+def pack_image(img: Image.Image) -> Tuple[Rows, int, int]:
+    """
+    Any PIL image -> packed rows where 1 = burn (dark pixel), at the image's own
+    width. Same inversion + 1-bit conversion the printer modules have always used.
+    """
+    return from_1bit(ImageOps.invert(img.convert("L")).convert("1"))
+
+
+def to_image(rows: Rows, width: int = TARGET_WIDTH_DOTS) -> Image.Image:
+    """Packed rows -> PIL '1' image (black where a dot burns), for previews."""
+    data = b"".join(rows).translate(INVERT_TABLE)
+    return Image.frombytes("1", (width, len(rows)), data)
+
+
+# -----------------------------
+# Geometry
+# -----------------------------
+
+def pad_center(rows: Rows, src_width: int, width: int = TARGET_WIDTH_DOTS) -> Rows:
+    """
+    Center `src_width`-dot rows on a `width`-dot head. Wider sources are
+    center-cropped (same placement as the old PIL paste at a negative offset).
+    """
+    if src_width == width and src_width % 8 == 0:
+        return list(rows)
+
+    src_bits = _row_len(src_width) * 8
+    n = _row_len(width)
+    out_mask = _mask(width)
+    # Right-align the real dots, then move them so the left gap is `offset`
+    drop = src_bits - src_width
+    lshift = n * 8 - width + (width - src_width) - (width - src_width) // 2
+
+    out = []
+    for row in rows:
+        v = int.from_bytes(row, "big") >> drop
+        v = v << lshift if lshift >= 0 else v >> -lshift
+        out.append((v & out_mask).to_bytes(n, "big"))
+    return out
+
+
+def shift(rows: Rows, dx: int = 0, dy: int = 0, width: int = TARGET_WIDTH_DOTS) -> Rows:
+    """
+    Move the bitmap `dx` dots right (negative = left) and `dy` rows down
+    (negative = up). Height is preserved; vacated space is blank.
+    """
+    n = _row_len(width)
+    mask = _mask(width)
+
+    if dx:
+        out = []
+        for row in rows:
+            v = int.from_bytes(row, "big")
+            v = v >> dx if dx > 0 else v << -dx
+            out.append((v & mask).to_bytes(n, "big"))
+    else:
+        out = list(rows)
+
+    if dy:
+        blank = bytes(n)
+        height = len(out)
+        dy = max(-height, min(height, dy))
+        if dy > 0:
+            out = [blank] * dy + out[:height - dy]
+        else:
+            out = out[-dy:] + [blank] * -dy
+    return out
+
+
+def crop(rows: Rows, *, top: int = 0, bottom: int = 0, left: int = 0, right: int = 0,
+         width: int = TARGET_WIDTH_DOTS) -> Rows:
+    """
+    Trim `top`/`bottom` rows off the label and blank `left`/`right` dot columns
+    (the head width stays `width`, so the result is still printable as-is).
+    """
+    out = rows[top:len(rows) - bottom if bottom else None]
+    if not (left or right):
+        return list(out)
+
+    n = _row_len(width)
+    keep = width - left - right
+    if keep <= 0:
+        return [bytes(n)] * len(out)
+    mask = ((1 << keep) - 1) << (n * 8 - left - keep)
+    return [(int.from_bytes(row, "big") & mask).to_bytes(n, "big") for row in out]
+
+
+def flip_v(rows: Rows) -> Rows:
+    return rows[::-1]
+
+
+def flip_h(rows: Rows, width: int = TARGET_WIDTH_DOTS) -> Rows:
+    """Mirror each row left <-> right."""
+    out = [row[::-1].translate(REVERSE_BITS_TABLE) for row in rows]
+    pad = _row_len(width) * 8 - width
+    if pad:
+        # Padding bits moved to the front: shift the real dots back to the left
+        n = _row_len(width)
+        out = [(int.from_bytes(row, "big") << pad & _mask(width)).to_bytes(n, "big") for row in out]
+    return out
+
+
+def rotate_180(rows: Rows, width: int = TARGET_WIDTH_DOTS) -> Rows:
+    return flip_h(flip_v(rows), width)
+
+
+# -----------------------------
+# Pixel value ops
+# -----------------------------
+
+def invert(rows: Rows, width: int = TARGET_WIDTH_DOTS) -> Rows:
+    """Swap burn/blank for every dot (one translate over the whole bitmap)."""
+    n = _row_len(width)
+    data = b"".join(rows).translate(INVERT_TABLE)
+    out = [data[i:i + n] for i in range(0, len(data), n)]
+    if width % 8:
+        mask = _mask(width)
+        out = [(int.from_bytes(row, "big") & mask).to_bytes(n, "big") for row in out]
+    return out
+
+
+def compose_or(base: Rows, overlay: Rows, x: int = 0, y: int = 0, *,
+               overlay_width: int = TARGET_WIDTH_DOTS, width: int = TARGET_WIDTH_DOTS) -> Rows:
+    """
+    OR `overlay` (rows of `overlay_width` dots) onto `base` with its top-left corner
+    at dot `x`, row `y`. Parts falling outside the base are clipped.
+    """
+    n = _row_len(width)
+    mask = _mask(width)
+    drop = _row_len(overlay_width) * 8 - overlay_width
+    # Overlay's real dots right-aligned, then moved so its first dot lands at x
+    lshift = n * 8 - x - overlay_width
+
+    out = list(base)
+    for i, row in enumerate(overlay):
+        j = y + i
+        if j < 0:
+            continue
+        if j >= len(out):
+            break
+        v = int.from_bytes(row, "big") >> drop
+        v = v << lshift if lshift >= 0 else v >> -lshift
+        if v & mask:
+            out[j] = ((int.from_bytes(out[j], "big") | v) & mask).to_bytes(n, "big")
+    return out
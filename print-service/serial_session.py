@@ -0,0 +1,229 @@
+"""
+Long-lived serial (USB CDC) session for the NIIMBOT B1.
+
+print_label_usb used to open the port for every label, walk through
+115200/9600/19200 baud, and after every packet sleep 10 ms and poll
+`in_waiting` on the sending thread. A SerialSession opens the port once and
+keeps it between jobs:
+
+- the baud rate is chosen once with a heartbeat (0xDC) that has to be answered,
+  trying the rate remembered in the printer registry first, and saved there
+- a background reader thread feeds every byte into one ResponseDispatcher
+  (`session.rx`), so the writer never waits for RX
+- write_many() pushes a whole window of frames in a single write, so a job goes
+  out at the wire rate instead of one sleep per row
+- expect() returns a concurrent.futures.Future for the next matching response
+  (subscribe before sending, like ResponseDispatcher.expect on the BLE side)
+
+A port that disappears (unplug) closes the session; the next open() starts over.
+get_serial_session() keeps one session per port for the whole process.
+"""
+
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import serial
+
+from deadline import Deadline
+from niimbot_protocol import CMD_HEARTBEAT, ResponseDispatcher, make_packet
+from printer_registry import PrinterRegistry, get_registry
+
+HEARTBEAT = make_packet(CMD_HEARTBEAT, b"\x01")
+
+
+@dataclass
+class SerialConfig:
+    baudrates: Tuple[int, ...] = (115200, 9600, 19200)   # tried in order after the remembered one
+    probe_timeout_s: float = 0.5       # heartbeat reply when choosing the baud rate
+    read_timeout_s: float = 0.05       # reader thread poll
+    write_timeout_s: float = 5.0
+    verbose: bool = True
+
+
+@dataclass
+class SerialStats:
+    writes: int = 0
+    bytes: int = 0
+
+
+class SerialSession:
+    def __init__(self, port: str, config: Optional[SerialConfig] = None,
+                 registry: Optional[PrinterRegistry] = None):
+        self.port = port
+        self.config = config or SerialConfig()
+        self.registry = registry or get_registry()
+        self.rx = ResponseDispatcher()
+        self.baudrate: Optional[int] = None
+        self.verified = False              # the printer answered at `baudrate`
+        self.stats = SerialStats()
+        self.last_error: Optional[str] = None
+
+        self._ser: Optional[serial.Serial] = None
+        self._reader: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._open_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self.job_lock = threading.Lock()   # one label at a time on this port
+
+    def _log(self, msg: str):
+        if self.config.verbose:
+            print(msg)
+
+    @property
+    def is_open(self) -> bool:
+        return self._ser is not None and self._ser.is_open and not self._stop.is_set()
+
+    # -----------------------------
+    # Open / close
+    # -----------------------------
+
+    def _baudrates(self):
+        known = self.registry.get(self.port)
+        first = known.baudrate if known and known.baudrate else None
+        rates = [first] if first else []
+        return rates + [b for b in self.config.baudrates if b != first]
+
+    def _open_at(self, baudrate: int):
+        self._stop.clear()
+        self._ser = serial.Serial(port=self.port, baudrate=baudrate, bytesize=serial.EIGHTBITS,
+                                  parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE,
+                                  timeout=self.config.read_timeout_s,
+                                  write_timeout=self.config.write_timeout_s)
+        self._ser.reset_input_buffer()
+        self._ser.reset_output_buffer()
+        self.rx.decoder.reset()
+        self._reader = threading.Thread(target=self._read_loop, args=(self._ser,),
+                                         name=f"serial-rx-{self.port}", daemon=True)
+        self._reader.start()
+        self.baudrate = baudrate
+
+    def open(self, deadline: Optional[Deadline] = None) -> bool:
+        """
+        Open the port (idempotent). Returns True if the printer answered a
+        heartbeat; a silent printer still gets an open port at the first rate.
+        The baud probes stop at `deadline` (DeadlineExceeded, port closed).
+        """
+        deadline = deadline or Deadline(None)
+        with self._open_lock:
+            if self.is_open:
+                return self.verified
+            self.verified = False
+            rates = self._baudrates()
+            for baudrate in rates:
+                deadline.check()
+                self._open_at(baudrate)
+                if self.ping(deadline.cap(self.config.probe_timeout_s)):
+                    self.verified = True
+                    self._log(f"✅ Serial {self.port} open at {baudrate} baud")
+                    known = self.registry.get(self.port)
+                    if not known or known.baudrate != baudrate:
+                        self.registry.remember(self.port, transport="serial", baudrate=baudrate)
+                    return True
+                self._close_port()
+                deadline.check()
+            # Nobody answered: keep the old behaviour (first rate, no check)
+            self._open_at(rates[0])
+            self._log(f"⚠️  Serial {self.port}: no heartbeat reply, using {rates[0]} baud")
+            return False
+
+    def _close_port(self):
+        self._stop.set()
+        ser, self._ser = self._ser, None
+        if ser is not None:
+            try:
+                ser.close()
+            except Exception:
+                pass
+        if self._reader and self._reader is not threading.current_thread():
+            self._reader.join(timeout=1.0)
+        self._reader = None
+
+    def close(self):
+        with self._open_lock:
+            self._close_port()
+
+    # -----------------------------
+    # RX
+    # -----------------------------
+
+    def _read_loop(self, ser: serial.Serial):
+        while not self._stop.is_set():
+            try:
+                data = ser.read(ser.in_waiting or 1)
+            except (serial.SerialException, OSError, TypeError) as e:
+                if not self._stop.is_set():
+                    self.last_error = str(e)
+                    self._log(f"⚠️  Serial {self.port} lost: {e}")
+                    self._stop.set()  # writes fail fast; open() starts over
+                return
+            if data:
+                self.rx.feed(data)
+
+    def expect(self, response_type: type,
+               predicate: Optional[Callable[[object], bool]] = None) -> Future:
+        """
+        Future resolved (on the reader thread) by the next matching response.
+        Subscribe before sending; cancel it if you give up.
+        """
+        fut: Future = Future()
+
+        def handler(resp):
+            if not fut.done() and (predicate is None or predicate(resp)):
+                fut.set_result(resp)
+
+        self.rx.subscribe(handler, response_type)
+        fut.add_done_callback(lambda _: self.rx.unsubscribe(handler, response_type))
+        return fut
+
+    def ping(self, timeout_s: float) -> bool:
+        """Heartbeat; True if any valid frame comes back in time."""
+        reply = self.expect(None)
+        try:
+            self.write(HEARTBEAT)
+            reply.result(timeout_s)
+            return True
+        except Exception:
+            reply.cancel()
+            return False
+
+    # -----------------------------
+    # TX
+    # -----------------------------
+
+    def write(self, data: bytes):
+        if not self.is_open:
+            raise serial.SerialException(f"{self.port} is not open"
+                                         + (f" ({self.last_error})" if self.last_error else ""))
+        with self._write_lock:
+            self._ser.write(data)
+        self.stats.writes += 1
+        self.stats.bytes += len(data)
+
+    def write_many(self, packets: Iterable[bytes]):
+        """All frames in one write (the CDC driver splits it at the wire, not us)."""
+        self.write(b"".join(packets))
+
+
+_sessions: Dict[str, SerialSession] = {}
+_sessions_lock = threading.Lock()
+
+
+def get_serial_session(port: str) -> SerialSession:
+    """One session per port, shared by the whole process."""
+    with _sessions_lock:
+        if port not in _sessions:
+            _sessions[port] = SerialSession(port)
+        return _sessions[port]
+
+
+def open_sessions() -> List[SerialSession]:
+    with _sessions_lock:
+        return [s for s in _sessions.values() if s.is_open]
+
+
+def close_all():
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
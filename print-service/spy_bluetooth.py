@@ -3,7 +3,9 @@ Spy on Bluetooth communication to see what the official app sends
 This will help us understand the correct protocol
 """
 import asyncio
-from bleak import BleakScanner, BleakClient
+from bleak import BleakClient
+from printer_registry import find_printer
+from niimbot_protocol import FrameDecoder, parse_response
 
 SERVICE_UUID = "e7810a71-73ae-499d-8c15-faa9aef0c3f2"
 CHAR_UUID = "bef8d6c9-9c21-4c9e-b632-bd58c1009f9f"
@@ -21,8 +23,7 @@ async def spy_mode():
     
     # Find printer
     print("Scanning for B1...")
-    devices = await BleakScanner.discover(timeout=5.0)
-    target = next((d for d in devices if d.name and "B1" in d.name), None)
+    target = await find_printer("B1")
     if not target:
         print("❌ B1 Not Found")
         return
@@ -39,12 +40,15 @@ async def spy_mode():
         print("✅ Connected! Monitoring...\n")
         
         packet_count = 0
+        decoder = FrameDecoder()
         
         def notification_handler(sender, data):
             nonlocal packet_count
-            packet_count += 1
-            packets_received.append(data)
-            print(f"📥 RX #{packet_count}: {data.hex()}")
+            # One notification may hold part of a frame or several frames
+            for frame in decoder.feed(bytes(data)):
+                packet_count += 1
+                packets_received.append(frame)
+                print(f"📥 RX #{packet_count}: {parse_response(frame)}")
         
         await client.start_notify(CHAR_UUID, notification_handler)
         
@@ -56,6 +60,9 @@ async def spy_mode():
         
         await client.stop_notify(CHAR_UUID)
         
+        if decoder.bad_frames or decoder.skipped_bytes:
+            print(f"⚠️  Dropped {decoder.bad_frames} bad frames, {decoder.skipped_bytes} stray bytes")
+        
         print("\n" + "=" * 60)
         print(f"📊 CAPTURED {len(packets_received)} PACKETS")
         print("=" * 60)
@@ -65,20 +72,13 @@ async def spy_mode():
             with open('spy_log.txt', 'w') as f:
                 f.write("BLUETOOTH SPY LOG\n")
                 f.write("=" * 60 + "\n\n")
-                for i, pkt in enumerate(packets_received, 1):
+                for i, frame in enumerate(packets_received, 1):
                     f.write(f"Packet #{i}:\n")
-                    f.write(f"  Hex: {pkt.hex()}\n")
-                    f.write(f"  Bytes: {' '.join(f'{b:02x}' for b in pkt)}\n")
-                    
-                    # Try to parse
-                    if len(pkt) >= 6 and pkt[0:2] == b'\x55\x55':
-                        cmd = pkt[2]
-                        length = pkt[3]
-                        f.write(f"  Command: 0x{cmd:02x}\n")
-                        f.write(f"  Length: {length}\n")
-                        if length > 0 and len(pkt) > 4 + length:
-                            data = pkt[4:4+length]
-                            f.write(f"  Data: {data.hex()}\n")
+                    f.write(f"  Command: 0x{frame.command:02x}\n")
+                    f.write(f"  Length: {len(frame.data)}\n")
+                    if frame.data:
+                        f.write(f"  Data: {frame.data.hex()}\n")
+                    f.write(f"  Parsed: {parse_response(frame)}\n")
                     f.write("\n")
             
             print("✅ Log saved to spy_log.txt")
@@ -0,0 +1,130 @@
+"""
+Checks for the BLE session's GATT channel choice, against a fake bleak client
+with both NIIMBOT channels (each with its own write latency and reply loss).
+"""
+import asyncio
+import os
+import tempfile
+
+from ble_session import CHAR_UUID, SERIAL_NOTIFY_UUID, SERIAL_WRITE_UUID, B1Session, SessionConfig
+from niimbot_protocol import FrameDecoder, make_packet
+from printer_registry import PrinterRegistry
+
+ADDRESS = "AA:BB"
+
+
+class FakeChar:
+    def __init__(self, uuid: str, properties):
+        self.uuid = uuid
+        self.properties = properties
+        self.max_write_without_response_size = 182
+
+
+class FakeServices:
+    def __init__(self, chars):
+        self.chars = {c.uuid: c for c in chars}
+
+    def get_characteristic(self, uuid: str):
+        return self.chars.get(uuid)
+
+
+class FakeClient:
+    """
+    BleakClient stand-in answering heartbeats. `channels` maps a write
+    characteristic to (latency per write, keep every n-th reply); the serial
+    channel exists only if it is listed.
+    """
+
+    def __init__(self, channels: dict):
+        self.channels = channels
+        self.is_connected = False
+        self.mtu_size = 185
+        self.handlers = {}
+        self.decoders = {}
+        self.writes = {uuid: 0 for uuid in channels}
+        chars = [FakeChar(CHAR_UUID, ["write-without-response", "notify"])]
+        if SERIAL_WRITE_UUID in channels:
+            chars += [FakeChar(SERIAL_WRITE_UUID, ["write", "write-without-response"]),
+                      FakeChar(SERIAL_NOTIFY_UUID, ["notify"])]
+        self.services = FakeServices(chars)
+
+    async def connect(self):
+        self.is_connected = True
+
+    async def disconnect(self):
+        self.is_connected = False
+
+    async def start_notify(self, uuid, handler):
+        self.handlers[uuid] = handler
+
+    async def stop_notify(self, uuid):
+        self.handlers.pop(uuid, None)
+
+    async def write_gatt_char(self, uuid, data, response=False):
+        latency, keep_every = self.channels[uuid]
+        self.writes[uuid] += 1
+        await asyncio.sleep(latency)
+        notify = CHAR_UUID if uuid == CHAR_UUID else SERIAL_NOTIFY_UUID
+        for i, frame in enumerate(self.decoders.setdefault(uuid, FrameDecoder()).feed(bytes(data))):
+            if frame.command == 0xDC and i % keep_every == 0:
+                reply = make_packet(0xDD, bytes(8) + bytes([0, 3]))
+                asyncio.get_running_loop().call_later(latency, self._notify, notify, reply)
+
+    def _notify(self, uuid, data):
+        if uuid in self.handlers:
+            self.handlers[uuid](None, data)
+
+
+def _connect(registry: PrinterRegistry, channels: dict, **config) -> B1Session:
+    async def run():
+        session = B1Session(SessionConfig(address=ADDRESS, probe_timeout_s=0.1, verbose=False, **config),
+                            registry=registry)
+        session._new_client = lambda target, timeout: FakeClient(channels)
+        await session.ensure_connected()
+        await session.close()
+        return session
+    return asyncio.run(run())
+
+
+def _registry() -> PrinterRegistry:
+    return PrinterRegistry(os.path.join(tempfile.mkdtemp(), "printers.json"))
+
+
+def test_probe_picks_faster_channel_and_remembers_it():
+    registry = _registry()
+    channels = {CHAR_UUID: (0.008, 1), SERIAL_WRITE_UUID: (0.002, 1)}
+    session = _connect(registry, channels)
+    assert session.channel.name == "serial"
+    assert [p.delivery for p in session.probes] == [1.0, 1.0]
+    assert registry.get(ADDRESS).ble_channel == "serial"
+    again = _connect(registry, channels)
+    assert again.channel.name == "serial" and not again.probes
+
+
+def test_probe_prefers_reliable_channel():
+    """A fast channel that loses replies loses to a slower one that doesn't."""
+    registry = _registry()
+    session = _connect(registry, {CHAR_UUID: (0.008, 1), SERIAL_WRITE_UUID: (0.002, 2)})
+    assert session.channel.name == "niimbot"
+    assert registry.get(ADDRESS).ble_channel == "niimbot"
+
+
+def test_single_channel_not_probed():
+    session = _connect(_registry(), {CHAR_UUID: (0.002, 1)})
+    assert session.channel.name == "niimbot" and not session.probes
+
+
+def test_forced_channel_skips_probe():
+    registry = _registry()
+    session = _connect(registry, {CHAR_UUID: (0.008, 1), SERIAL_WRITE_UUID: (0.002, 1)}, channel="niimbot")
+    assert session.channel.name == "niimbot" and not session.probes
+    assert registry.get(ADDRESS).ble_channel is None
+
+
+if __name__ == "__main__":
+    print("\n🍄 BLE SESSION TEST\n")
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
+    print("\n✅ ALL TESTS PASSED\n")
@@ -0,0 +1,170 @@
+"""
+Checks for awaited NIIMBOT commands (CommandLink and its serial twin) against
+an in-memory printer that can drop commands, stay silent or reject the job.
+"""
+import asyncio
+from concurrent.futures import Future
+
+from command_link import CommandConfig, CommandLink, CommandTimeout, SerialCommandLink
+from deadline import Deadline, DeadlineExceeded
+from niimbot_protocol import (CMD_SET_DENSITY, CMD_SET_QUANTITY, REPLY_FOR, Ack, FrameDecoder, PrinterError,
+                              ResponseDispatcher, make_packet)
+
+CONFIG = CommandConfig(timeout_s=0.02, timeouts={}, silent_delay_s=0.001)
+
+
+class FakePrinter:
+    """
+    Answers every command at once, except: the first `drop` commands are lost,
+    nothing is answered after `answer` replies, and `error` (a 0xDB code) is
+    sent instead of the reply when set.
+    """
+
+    def __init__(self, drop: int = 0, answer: int = -1, error: int = None):
+        self.rx = ResponseDispatcher()
+        self.decoder = FrameDecoder()
+        self.sent = []
+        self.drop = drop
+        self.answer = answer
+        self.error = error
+
+    def _receive(self, packet: bytes):
+        for frame in self.decoder.feed(packet):
+            self.sent.append(frame.command)
+            if self.drop:
+                self.drop -= 1
+            elif self.error is not None:
+                self.rx.feed(make_packet(0xDB, bytes([self.error])))
+            elif self.answer:
+                self.answer -= 1
+                self.rx.feed(make_packet(REPLY_FOR[frame.command], b"\x01"))
+
+    async def write(self, packet: bytes):
+        self._receive(packet)
+
+
+class FakeSerialSession(FakePrinter):
+    """SerialSession stand-in for SerialCommandLink: blocking write(), Future expect()."""
+
+    def write(self, packet: bytes):
+        self._receive(packet)
+
+    def expect(self, response_type, predicate=None) -> Future:
+        fut: Future = Future()
+
+        def handler(resp):
+            if not fut.done() and (predicate is None or predicate(resp)):
+                fut.set_result(resp)
+
+        self.rx.subscribe(handler, response_type)
+        fut.add_done_callback(lambda _: self.rx.unsubscribe(handler, response_type))
+        return fut
+
+
+def _request(printer: FakePrinter, *commands, deadline: Deadline = None):
+    async def run():
+        with CommandLink(printer.write, printer.rx, CONFIG, deadline) as link:
+            return link, [await link.request(command, b"\x03") for command in commands]
+    return asyncio.run(run())
+
+
+def test_reply_returned():
+    printer = FakePrinter()
+    link, (resp,) = _request(printer, CMD_SET_DENSITY)
+    assert isinstance(resp, Ack) and resp.ok
+    assert resp.command == REPLY_FOR[CMD_SET_DENSITY]
+    assert (link.replies, link.resends) == (1, 0)
+
+
+def test_lost_command_resent():
+    """A command whose reply doesn't come goes out again."""
+    printer = FakePrinter(drop=1)
+    link, (resp,) = _request(printer, CMD_SET_DENSITY)
+    assert resp is not None
+    assert printer.sent == [CMD_SET_DENSITY, CMD_SET_DENSITY]
+    assert link.resends == 1
+
+
+def test_silent_printer_uses_fixed_delays():
+    """A printer that never answered is driven blind instead of failing the job."""
+    printer = FakePrinter(answer=0)
+    link, replies = _request(printer, CMD_SET_DENSITY, CMD_SET_QUANTITY)
+    assert replies == [None, None]
+    assert link.silent
+    assert printer.sent == [CMD_SET_DENSITY] * 3 + [CMD_SET_QUANTITY]   # no resends once silent
+
+
+def test_printer_that_stops_answering_times_out():
+    """Once the printer has answered, a missing reply is an error after the retries."""
+    printer = FakePrinter(answer=1)
+    try:
+        _request(printer, CMD_SET_DENSITY, CMD_SET_QUANTITY)
+    except CommandTimeout as e:
+        assert (e.command, e.attempts) == (CMD_SET_QUANTITY, 3)
+    else:
+        assert False, "lost printer not reported"
+
+
+def test_error_frame_fails_request():
+    printer = FakePrinter(error=0x06)
+    try:
+        _request(printer, CMD_SET_DENSITY)
+    except PrinterError as e:
+        assert e.code == 0x06
+    else:
+        assert False, "error frame ignored"
+
+
+def test_error_between_commands():
+    """An error frame that arrives while no command waits fails the next request."""
+    printer = FakePrinter()
+
+    async def run():
+        with CommandLink(printer.write, printer.rx, CONFIG) as link:
+            await link.request(CMD_SET_DENSITY, b"\x03")
+            printer.rx.feed(make_packet(0xDB, bytes([0x01])))
+            await link.request(CMD_SET_QUANTITY, b"\x01")
+
+    try:
+        asyncio.run(run())
+    except PrinterError as e:
+        assert e.code == 0x01
+    else:
+        assert False, "error frame between commands ignored"
+    assert printer.sent == [CMD_SET_DENSITY]
+
+
+def test_spent_deadline_stops_resends():
+    deadline = Deadline(1.0)
+    deadline.at -= 2.0
+    printer = FakePrinter(drop=5)
+    try:
+        _request(printer, CMD_SET_DENSITY, deadline=deadline)
+    except DeadlineExceeded:
+        pass
+    else:
+        assert False, "resent past the deadline"
+    assert printer.sent == [CMD_SET_DENSITY]
+
+
+def test_serial_link_resends_and_goes_silent():
+    """SerialCommandLink: same resend and silent-printer rules, blocking."""
+    session = FakeSerialSession(drop=1)
+    with SerialCommandLink(session, CONFIG) as link:
+        assert link.request(CMD_SET_DENSITY, b"\x03") is not None
+        assert link.resends == 1
+    session = FakeSerialSession(answer=0)
+    with SerialCommandLink(session, CONFIG) as link:
+        assert link.request(CMD_SET_DENSITY, b"\x03") is None
+        assert link.silent
+        assert link.request(CMD_SET_QUANTITY, b"\x01") is None
+    assert session.sent == [CMD_SET_DENSITY] * 3 + [CMD_SET_QUANTITY]
+
+
+if __name__ == "__main__":
+    print("\n🍄 COMMAND LINK TEST\n")
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
+    print("\n✅ ALL TESTS PASSED\n")
@@ -0,0 +1,65 @@
+"""
+Checks for the per-job Deadline. Time is faked by moving the deadline's start
+and end, so nothing sleeps.
+"""
+from deadline import Deadline, DeadlineExceeded
+
+
+def _expired(budget_s: float = 5.0) -> Deadline:
+    deadline = Deadline(budget_s)
+    deadline.started -= budget_s + 1
+    deadline.at -= budget_s + 1
+    return deadline
+
+
+def test_unbounded():
+    """Deadline(None) records stages but never times out."""
+    deadline = Deadline(None)
+    assert deadline.enter("connect") == float("inf")
+    assert deadline.stage == "connect"
+    assert not deadline.expired
+    assert deadline.timeout() is None
+    assert deadline.cap(3.0) == 3.0
+    deadline.check()
+
+
+def test_cap_and_timeout():
+    """Waits are cut down to the remaining budget (+ grace), never raised above their own timeout."""
+    deadline = Deadline(2.0)
+    assert deadline.cap(0.5) == 0.5
+    assert 1.9 < deadline.cap(10.0) <= 2.0
+    assert 2.9 < deadline.cap(10.0, grace_s=1.0) <= 3.0
+    assert 1.9 < deadline.timeout() <= 2.0
+    assert _expired().cap(10.0) == 0.0
+
+
+def test_enter_raises_when_spent():
+    """enter() fails at once with the stage it was entering and the labels already done."""
+    deadline = _expired()
+    try:
+        deadline.enter("transmit")
+    except DeadlineExceeded as e:
+        assert e.stage == "transmit"
+        assert e.budget_s == 5.0 and e.elapsed_s >= 6.0
+        assert isinstance(e, TimeoutError)
+    else:
+        assert False, "spent deadline let a stage start"
+    error = deadline.exceeded(labels_done=2)
+    assert (error.stage, error.labels_done) == ("transmit", 2)
+    assert "transmit" in error.message
+
+
+def test_earliest():
+    """A batch runs against the tightest of its jobs' deadlines."""
+    loose, tight = Deadline(60.0), Deadline(5.0)
+    assert Deadline.earliest([loose, None, tight, Deadline(None)]) is tight
+    assert Deadline.earliest([None, Deadline(None)]) is None
+
+
+if __name__ == "__main__":
+    print("\n🍄 DEADLINE TEST\n")
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
+    print("\n✅ ALL TESTS PASSED\n")
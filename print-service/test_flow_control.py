@@ -0,0 +1,194 @@
+"""
+Checks for row window planning, the cost model and the AIMD pacer.
+The transmitter runs against an in-memory printer that answers status probes
+(and can reject the job), so no hardware and no sleeps are involved.
+"""
+import asyncio
+import os
+import tempfile
+import threading
+
+from flow_control import (STATUS_QUERY, AdaptivePacer, FlowConfig, RowCostModel, RowTransmitter, plan_windows,
+                          send_rows_serial)
+from niimbot_protocol import PrinterError, ResponseDispatcher, make_packet
+from printer_registry import PrinterRegistry
+
+REF = RowCostModel.REFERENCE_DOTS
+
+
+def _row(dots: int) -> bytes:
+    """0x85 row packet with `dots` dots counted in its header."""
+    return make_packet(0x85, bytes([0, 0, dots // 3, dots // 3, dots - 2 * (dots // 3), 1]) + bytes(48))
+
+
+class FakePrinter:
+    """Answers every status probe at once; sends an error frame after `fail_after` rows."""
+
+    def __init__(self, fail_after: int = -1):
+        self.rx = ResponseDispatcher()
+        self.rows = 0
+        self.fail_after = fail_after
+
+    async def write(self, packet: bytes):
+        if packet == STATUS_QUERY:
+            self.rx.feed(make_packet(0xB3, bytes([0, 0, 0, 0])))
+            return
+        self.rows += 1
+        if self.rows == self.fail_after:
+            self.rx.feed(make_packet(0xDB, bytes([0x06])))
+
+
+class FakeSerialSession:
+    """
+    SerialSession stand-in: ignores the first `silent` status probes, then
+    answers each one `delay_s` later from another thread, like the reader thread.
+    """
+
+    def __init__(self, silent: int = 0, delay_s: float = 0.005):
+        self.rx = ResponseDispatcher()
+        self.rows = 0
+        self.probes = 0
+        self.silent = silent
+        self.delay_s = delay_s
+
+    def write(self, packet: bytes):
+        if packet != STATUS_QUERY:
+            self.rows += 1
+            return
+        self.probes += 1
+        if self.probes > self.silent:
+            reply = make_packet(0xB3, bytes([0, 0, 0, 0]))
+            threading.Timer(self.delay_s, self.rx.feed, [reply]).start()
+
+    def write_many(self, packets):
+        for packet in packets:
+            self.write(packet)
+
+
+def test_plan_windows_reference_rows():
+    """Typical rows: one window is exactly `window_rows` packets."""
+    model = RowCostModel()
+    loads = [(1, REF)] * 100
+    assert plan_windows(loads, 0, 32, model) == 32
+    assert plan_windows(loads, 96, 32, model) == 100
+
+
+def test_plan_windows_by_cost():
+    """Dense rows make short windows, blank rows long ones (capped at 4x rows)."""
+    model = RowCostModel()
+    dense = plan_windows([(1, 384)] * 200, 0, 32, model)
+    blank = plan_windows([(1, 0)] * 200, 0, 32, model)
+    assert 1 <= dense < 32 < blank <= 128
+    assert plan_windows([(50, 0)] * 10, 0, 32, model) == 2
+    assert plan_windows([(1000, 0)], 0, 32, model) == 1   # always at least one packet
+
+
+def test_cost_model_fit():
+    """Refitting on noiseless windows converges to the printer's real per-row/per-dot timings."""
+    model = RowCostModel()
+    true = (0.03, 0.004, 0.00005)   # latency, per row, per dot
+    for i in range(300):
+        rows = 8 + i % 40
+        dots = rows * (i * 37 % 300)
+        model.observe(rows, dots, true[0] + true[1] * rows + true[2] * dots)
+    assert abs(model.row_s - true[1]) < 0.0005
+    assert abs(model.dot_s - true[2]) < 0.00001
+
+
+def test_pacer_aimd():
+    """Acks grow the window additively, losses halve it, then a row gap kicks in."""
+    pacer = AdaptivePacer(32)
+    pacer.on_ack(0.01)
+    assert pacer.window_rows == 36
+    pacer.on_loss()
+    assert pacer.window_rows == 18
+    pacer.on_loss()
+    pacer.on_loss()
+    assert pacer.window_rows == AdaptivePacer.MIN_WINDOW
+    assert pacer.row_gap_s == 0.0
+    pacer.on_loss()
+    pacer.on_loss()
+    assert pacer.row_gap_s == 2 * AdaptivePacer.GAP_STEP_S
+    pacer.on_ack(0.01)
+    assert pacer.row_gap_s == AdaptivePacer.GAP_STEP_S   # the gap shrinks before the window grows
+    assert pacer.window_rows == AdaptivePacer.MIN_WINDOW
+
+
+def test_pacer_slow_rtt_is_loss():
+    """An RTT far above the model's prediction for the window is a loss."""
+    pacer = AdaptivePacer(32)
+    pacer.on_ack(0.02, expected_s=0.02)
+    pacer.on_ack(0.5, expected_s=0.1)
+    assert pacer.window_rows == 18
+    assert pacer.decreases == 1
+
+
+def test_pacer_grows_past_small_window_rtt():
+    """RTTs that grow with the window as predicted don't stop it growing."""
+    pacer = AdaptivePacer(8)
+    model = pacer.model
+    for _ in range(40):
+        load = (pacer.window_rows, pacer.window_rows * REF)
+        pacer.on_ack(model.predict(*load) * 1.2, model.predict(*load))
+    assert pacer.decreases == 0
+    assert pacer.window_rows == AdaptivePacer.MAX_WINDOW
+
+
+def test_transmitter_grows_window():
+    printer = FakePrinter()
+    pacer = AdaptivePacer(8)
+    stats = asyncio.run(RowTransmitter(printer.write, printer.rx, pacer=pacer).send([_row(REF)] * 200))
+    assert printer.rows == 200
+    assert stats.acks > 0 and stats.misses == 0
+    assert pacer.window_rows > 8
+
+
+def test_transmitter_backs_off_on_error():
+    """An error frame stops the job at once and halves the pacer's window."""
+    printer = FakePrinter(fail_after=40)
+    pacer = AdaptivePacer(64)
+    tx = RowTransmitter(printer.write, printer.rx, FlowConfig(window_rows=64), pacer=pacer)
+    try:
+        asyncio.run(tx.send([_row(REF)] * 200))
+    except PrinterError as e:
+        assert e.code == 0x06
+    else:
+        assert False, "error frame ignored"
+    assert printer.rows <= 64
+    assert pacer.window_rows == 32 and pacer.decreases == 1
+
+
+def test_serial_timed_mode_recovers():
+    """
+    Serial: after the printer went silent, the first reply to a timed-mode probe
+    ends timed pacing, and timed-mode probes never count as losses.
+    """
+    session = FakeSerialSession(silent=2)
+    pacer = AdaptivePacer(32)
+    config = FlowConfig(status_timeout_s=0.05, fallback_delay_s=0.002)
+    stats = send_rows_serial(session, [_row(REF)] * 400, config, pacer=pacer)
+    assert session.rows == 400
+    assert stats.misses == 2 and stats.late == 0
+    assert 0 < stats.timed_rows <= 64   # one timed window, plus the one whose probe is checked
+    assert stats.acks > 0
+    assert pacer.decreases == 2 and pacer.row_gap_s == 0.0
+    assert pacer.window_rows > AdaptivePacer.MIN_WINDOW
+
+
+def test_tuning_persisted():
+    """A tuned pacer is saved per printer and transport and restored next job."""
+    registry = PrinterRegistry(os.path.join(tempfile.mkdtemp(), "printers.json"))
+    pacer = AdaptivePacer.for_printer(registry, "AA:BB", "ble")
+    pacer.on_ack(0.01)
+    pacer.save()
+    assert AdaptivePacer.for_printer(registry, "AA:BB", "ble").window_rows == 36
+    assert AdaptivePacer.for_printer(registry, "AA:BB", "serial").window_rows == 32
+
+
+if __name__ == "__main__":
+    print("\n🍄 FLOW CONTROL TEST\n")
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
+    print("\n✅ ALL TESTS PASSED\n")
@@ -0,0 +1,68 @@
+"""
+Checks for the halftone modes on small synthetic grayscale images.
+"""
+import numpy as np
+from PIL import Image
+
+from halftone import floyd_steinberg, halftone, image_to_rows, pack_rows, to_canvas
+
+
+def test_canvas_centering():
+    """Narrow images are centered on white; wide ones are center-cropped."""
+    narrow = np.zeros((4, 100), dtype=np.uint8)
+    canvas = to_canvas(narrow)
+    assert canvas.shape == (4, 384)
+    assert (canvas[:, 142:242] == 0).all()
+    assert (canvas[:, :142] == 255).all() and (canvas[:, 242:] == 255).all()
+
+    wide = np.tile(np.arange(400, dtype=np.uint16) % 256, (2, 1)).astype(np.uint8)
+    assert (to_canvas(wide)[0] == wide[0, 8:392]).all()
+
+
+def test_threshold_and_pack():
+    """Black burns, white doesn't; packed rows are MSB-first, 48 bytes wide."""
+    gray = np.full((2, 384), 255, dtype=np.uint8)
+    gray[:, 0] = 0
+    gray[1, 383] = 0
+    rows, width, height = image_to_rows(gray, "threshold")
+    assert (width, height) == (384, 2)
+    assert rows[0] == b"\x80" + bytes(47)
+    assert rows[1] == b"\x80" + bytes(46) + b"\x01"
+
+
+def test_dither_density():
+    """Every mode burns roughly the gray level's share of dots on a flat patch."""
+    for level, share in ((64, 0.75), (128, 0.5), (192, 0.25)):
+        gray = np.full((64, 384), level, dtype=np.uint8)
+        for mode in ("bayer2", "bayer4", "bayer8", "floyd"):
+            dots = halftone(gray, mode)
+            assert abs(dots.mean() - share) < 0.02, (mode, level, dots.mean())
+
+
+def test_floyd_extremes():
+    """Pure black and pure white diffuse no error."""
+    assert floyd_steinberg(np.zeros((8, 16), dtype=np.uint8)).all()
+    assert not floyd_steinberg(np.full((8, 16), 255, dtype=np.uint8)).any()
+
+
+def test_pil_input():
+    """PIL images go through the same path as arrays."""
+    img = Image.new("L", (384, 3), 0)
+    assert pack_rows(halftone(img, "threshold")) == [b"\xff" * 48] * 3
+
+
+def test_unknown_mode():
+    try:
+        halftone(np.zeros((1, 384), dtype=np.uint8), "sepia")
+    except ValueError:
+        return
+    assert False, "unknown mode accepted"
+
+
+if __name__ == "__main__":
+    print("\n🍄 HALFTONE TEST\n")
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
+    print("\n✅ ALL TESTS PASSED\n")
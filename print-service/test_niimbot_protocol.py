@@ -0,0 +1,103 @@
+"""
+Checks for the streaming frame decoder and the typed responses.
+No printer needed: frames are built with make_packet() and fed in pieces.
+"""
+import asyncio
+
+from niimbot_protocol import (
+    Ack, Frame, FrameDecoder, Heartbeat, PrinterErrorResponse, PrintStatus,
+    ResponseDispatcher, make_packet, parse_response, xor_checksum,
+)
+
+STATUS = make_packet(0xB3, bytes([0, 2, 100, 50]))      # page 2, 100% / 50%
+ERROR = make_packet(0xDB, bytes([0x06]))
+ACK = make_packet(0x14, b"\x01")
+
+
+def test_checksum():
+    """The folded XOR matches a plain byte loop."""
+    data = bytes(range(1, 200, 3))
+    expected = 0
+    for b in data:
+        expected ^= b
+    assert xor_checksum(data) == expected
+    assert xor_checksum(b"") == 0
+
+
+def test_split_frame():
+    """A frame split across feeds comes out once, when its last byte arrives."""
+    dec = FrameDecoder()
+    for i in range(len(STATUS) - 1):
+        assert dec.feed(STATUS[i:i + 1]) == []
+    assert dec.pending == len(STATUS) - 1
+    assert dec.feed(STATUS[-1:]) == [Frame(0xB3, bytes([0, 2, 100, 50]))]
+    assert dec.pending == 0
+
+
+def test_merged_frames():
+    """Several frames in one feed all come out, in order."""
+    dec = FrameDecoder()
+    frames = dec.feed(STATUS + ERROR + ACK)
+    assert [f.command for f in frames] == [0xB3, 0xDB, 0x14]
+    assert dec.frames_decoded == 3
+    assert dec.skipped_bytes == 0
+
+
+def test_corrupt_checksum():
+    """A frame with a bad checksum is dropped and the next one still decodes."""
+    bad = bytearray(STATUS)
+    bad[-3] ^= 0xFF
+    dec = FrameDecoder()
+    frames = dec.feed(bytes(bad) + ERROR)
+    assert [f.command for f in frames] == [0xDB]
+    assert dec.bad_frames >= 1
+
+
+def test_noise_between_frames():
+    """Noise (including a lone 0x55) between frames is skipped and counted."""
+    dec = FrameDecoder()
+    frames = dec.feed(b"\x00\x13\x55" + ACK + b"\xAA\x01")
+    assert [f.command for f in frames] == [0x14]
+    assert dec.skipped_bytes == 5
+    assert dec.pending == 0
+
+
+def test_parse_response():
+    """Frames map to their typed responses; unknown commands stay a Frame."""
+    assert parse_response(Frame(0xB3, bytes([0, 2, 100, 50]))) == PrintStatus(2, 100, 50)
+    err = parse_response(Frame(0xDB, bytes([0x06])))
+    assert isinstance(err, PrinterErrorResponse) and err.code == 0x06
+    assert parse_response(Frame(0x14, b"\x01")) == Ack(0x14, True)
+    assert parse_response(Frame(0x14, b"\x00")) == Ack(0x14, False)
+    assert isinstance(parse_response(Frame(0xDF, bytes(10))), Heartbeat)
+    assert parse_response(Frame(0x7E, b"\x01")) == Frame(0x7E, b"\x01")
+
+
+def test_dispatcher():
+    """Handlers get their response type; expect() resolves on the first match."""
+    async def run():
+        rx = ResponseDispatcher()
+        seen, everything = [], []
+        rx.subscribe(seen.append, PrintStatus)
+        rx.subscribe(everything.append)
+        fut = rx.expect(PrintStatus, lambda s: s.page >= 2)
+
+        rx.feed(make_packet(0xB3, bytes([0, 1, 40, 40])))
+        assert not fut.done()
+        rx.feed(ERROR + STATUS[:5])
+        rx(None, STATUS[5:])   # bleak notify signature
+        assert (await asyncio.wait_for(fut, 1.0)).page == 2
+
+        assert [s.page for s in seen] == [1, 2]
+        assert [type(r) for r in everything] == [PrintStatus, PrinterErrorResponse, PrintStatus]
+        assert rx.last[PrinterErrorResponse].code == 0x06
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    print("\n🍄 NIIMBOT PROTOCOL DECODER TEST\n")
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
+    print("\n✅ ALL TESTS PASSED\n")
@@ -0,0 +1,123 @@
+"""
+Checks for the engine's niimblue fallback, with a fake native backend, a fake
+BLE session and a fake niimblue worker (no printer, no Node.js).
+"""
+import os
+import tempfile
+
+import niimblue_worker
+from niimblue_worker import NiimblueWorker, WorkerConfig
+from print_engine import EngineConfig, PrintEngine
+from printer_registry import PrinterRegistry
+
+LABELS = [("a.png", 1), ("b.png", 1), ("c.png", 1)]
+
+
+class FakeBackend:
+    """Native backend that prints `done` labels and then fails (or raises `error`)."""
+    name = "native"
+
+    def __init__(self, done: int = 0, error: Exception = None):
+        self.done = done
+        self.error = error
+
+    def print_pages(self, labels, address, tracker=None, deadline=None):
+        if self.error:
+            raise self.error
+        return self.done, f"failed after {self.done}/{len(labels)} labels"
+
+
+class FakeSession:
+    def __init__(self, release_error: Exception = None):
+        self.calls = []
+        self.release_error = release_error
+
+    async def release(self):
+        self.calls.append("release")
+        if self.release_error:
+            raise self.release_error
+
+    async def reclaim(self):
+        self.calls.append("reclaim")
+
+
+class FakeWorker(NiimblueWorker):
+    def __init__(self, transport: str, address: str, session: FakeSession = None):
+        super().__init__(WorkerConfig(transport=transport, address=address))
+        self.session = session
+        self.printed = []
+        self.stopped = False
+
+    def print_file(self, image_path, *, deadline=None, **options):
+        self.printed.append(image_path)
+        return True, "printed"
+
+    def stop(self):
+        self.stopped = True
+        if self.session:
+            self.session.calls.append("worker stopped")
+
+
+def _engine(transport: str, backend: FakeBackend) -> PrintEngine:
+    registry = PrinterRegistry(os.path.join(tempfile.mkdtemp(), "printers.json"))
+    engine = PrintEngine(EngineConfig(use_serial=False), registry=registry)
+    engine.backends[transport] = backend
+    return engine
+
+
+def test_fallback_stops_worker_serial():
+    """The worker is stopped and dropped once the fallback is done with the port."""
+    engine = _engine("serial", FakeBackend(done=0))
+    worker = niimblue_worker._workers[("serial", "COM7")] = FakeWorker("serial", "COM7")
+    done, _ = engine.print_on_many("serial", "COM7", LABELS)
+    assert done == 3
+    assert worker.printed == ["a.png", "b.png", "c.png"]
+    assert worker.stopped
+    assert ("serial", "COM7") not in niimblue_worker._workers
+
+
+def test_fallback_stops_worker_before_reclaim():
+    """BLE: the session gets the link back only after the worker let go of it."""
+    engine = _engine("ble", FakeBackend(done=1))
+    session = FakeSession()
+    engine.ble_session = lambda address: session
+    worker = niimblue_worker._workers[("ble", "AA:BB")] = FakeWorker("ble", "AA:BB", session)
+    done, _ = engine.print_on_many("ble", "AA:BB", LABELS)
+    assert done == 3
+    assert worker.printed == ["b.png", "c.png"]
+    assert session.calls == ["release", "worker stopped", "reclaim"]
+    assert ("ble", "AA:BB") not in niimblue_worker._workers
+
+
+def test_fallback_skips_labels_printed_before_a_crash():
+    """A native failure that carries labels_done only hands the rest to niimblue."""
+    error = ConnectionError("link lost")
+    error.labels_done = 2
+    engine = _engine("serial", FakeBackend(error=error))
+    worker = niimblue_worker._workers[("serial", "COM8")] = FakeWorker("serial", "COM8")
+    done, _ = engine.print_on_many("serial", "COM8", LABELS)
+    assert done == 3
+    assert worker.printed == ["c.png"]
+
+
+def test_fallback_skipped_when_release_fails():
+    """A BLE session that couldn't be released isn't shared with niimblue-node."""
+    engine = _engine("ble", FakeBackend(done=1))
+    session = FakeSession(release_error=RuntimeError("disconnect failed"))
+    engine.ble_session = lambda address: session
+    worker = niimblue_worker._workers[("ble", "CC:DD")] = FakeWorker("ble", "CC:DD", session)
+    done, message = engine.print_on_many("ble", "CC:DD", LABELS)
+    assert done == 1
+    assert "skipped" in message
+    assert worker.printed == []
+    assert session.calls == ["release", "reclaim"]
+    niimblue_worker._workers.pop(("ble", "CC:DD"))
+
+
+if __name__ == "__main__":
+    print("\n🍄 PRINT ENGINE FALLBACK TEST\n")
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
+    print("\n✅ ALL TESTS PASSED\n")
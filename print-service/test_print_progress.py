@@ -0,0 +1,80 @@
+"""
+Checks for job progress tracking and its SSE stream, with short timings so
+nothing waits long.
+"""
+import json
+import threading
+import time
+
+from print_progress import ProgressConfig, ProgressHub
+
+
+def _hub() -> ProgressHub:
+    return ProgressHub(ProgressConfig(interval_s=0.01, pending_s=0.05))
+
+
+def test_job_is_shared_while_running():
+    """The same id gives the same tracker until the job finishes."""
+    hub = _hub()
+    tracker = hub.job("abc")
+    tracker.stage("rows")
+    assert hub.job("abc") is tracker
+
+
+def test_reused_job_id_starts_over():
+    """A finished job's id can be submitted again and gets a fresh tracker."""
+    hub = _hub()
+    first = hub.job("abc")
+    first.finish(True, "Printed")
+    second = hub.job("abc")
+    assert second is not first
+    assert second.stage_name == "queued" and not second.finished
+    assert hub.get("abc") is second
+
+
+def _events(lines):
+    """(event name, data) for each SSE event, keepalives skipped."""
+    events = []
+    for line in lines:
+        if line.startswith(":"):
+            continue
+        fields = dict(part.split(": ", 1) for part in line.strip().split("\n"))
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_stream_unknown_job_is_empty():
+    """A stream for an id no job ever gets ends after `pending_s` without output."""
+    hub = _hub()
+    assert list(hub.stream("nope")) == []
+    assert hub.get("nope") is None
+
+
+def test_stream_waits_for_job_and_ends_with_it():
+    """A stream opened before the job is submitted follows it to the end."""
+    hub = _hub()
+
+    def print_job():
+        time.sleep(0.02)
+        tracker = hub.job("abc")
+        tracker.start_label(0, 1, 240)
+        for sent in range(0, 241, 8):
+            tracker.rows(sent, 240)
+        time.sleep(0.03)
+        tracker.finish(True, "Printed")
+
+    threading.Thread(target=print_job).start()
+    events = _events(hub.stream("abc"))
+    assert events[-1][0] == "done" and events[-1][1]["message"] == "Printed"
+    assert events[-1][1]["rows_sent"] == 240
+    assert all(name == "progress" for name, _ in events[:-1])
+    assert len(events) < 10   # row updates are coalesced, not one event each
+
+
+if __name__ == "__main__":
+    print("\n🍄 PRINT PROGRESS TEST\n")
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
+    print("\n✅ ALL TESTS PASSED\n")
@@ -0,0 +1,120 @@
+"""
+Checks for the printer pool's scheduling and bookkeeping, with a fake engine
+whose printers take a few milliseconds per label (no hardware).
+"""
+import os
+import tempfile
+import threading
+import time
+
+from printer_pool import PoolConfig, PrinterPool
+from printer_registry import PrinterRegistry
+
+
+class FakeEngine:
+    """
+    PrintEngine stand-in: print_on_many() takes `label_s[address]` per copy and
+    records each batch; printers in `failing` print nothing.
+    """
+
+    def __init__(self, label_s: dict, failing=()):
+        self.registry = PrinterRegistry(os.path.join(tempfile.mkdtemp(), "printers.json"))
+        self.label_s = label_s
+        self.failing = set(failing)
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def print_on_many(self, transport, address, labels, tracker=None, deadline=None):
+        with self._lock:
+            self.batches.append((address, [path for path, _ in labels]))
+        if address in self.failing:
+            return 0, "Printer not responding"
+        time.sleep(self.label_s[address] * sum(copies for _, copies in labels))
+        return len(labels), f"Printed {len(labels)} labels"
+
+    def labels_on(self, address: str) -> int:
+        return sum(len(paths) for a, paths in self.batches if a == address)
+
+
+def _pool(label_s: dict, sizes: dict = None, failing=(), **config) -> PrinterPool:
+    engine = FakeEngine(label_s, failing)
+    for address in label_s:
+        engine.registry.set_pooled(address, "serial", label_size=(sizes or {}).get(address))
+    return PrinterPool(engine, PoolConfig(**config))
+
+
+def test_bulk_run_stripes_by_speed():
+    """A printer three times faster per label gets about three times the labels."""
+    pool = _pool({"COM1": 0.02, "COM2": 0.02})
+    pool.printers["COM1"].recent.append(1.0)
+    pool.printers["COM2"].recent.append(3.0)
+    futures = pool.submit_many([f"label{i}.png" for i in range(40)])
+    assert all(f.result(10)[0] for f in futures)
+    assert pool.engine.labels_on("COM1") == 30
+    assert pool.engine.labels_on("COM2") == 10
+    pool.stop()
+
+
+def test_label_size_routing():
+    """Jobs only go to printers with their label roll loaded."""
+    pool = _pool({"COM1": 0.001, "COM2": 0.001}, {"COM1": "40x30", "COM2": "50x30"})
+    assert pool.submit("a.png", "50x30").result(5)[0]
+    assert pool.engine.batches == [("COM2", ["a.png"])]
+    assert pool.submit("b.png", "70x30").result(5) == (False, "No healthy printer with 70x30 labels in the pool")
+    pool.stop()
+
+
+def test_failed_job_moves_to_other_printer():
+    """A failing printer goes offline and its job prints on the next matching one."""
+    pool = _pool({"COM1": 0.001, "COM2": 0.001}, failing={"COM1"})
+    pool.printers["COM2"].load = 1   # COM1 looks free, so it is tried first
+    ok, message = pool.submit("a.png").result(5)
+    assert ok and message.endswith("[COM2]")
+    failed = pool.printers["COM1"]
+    assert failed.health == "offline" and failed.jobs_failed == 1
+    assert failed.last_error == "Printer not responding"
+    assert [a for a, _ in pool.engine.batches] == ["COM1", "COM2"]
+    pool.printers["COM2"].load -= 1
+    pool.stop()
+
+
+def test_queued_jobs_batched():
+    """Jobs queued behind a running one go to the printer as one multi-page job."""
+    pool = _pool({"COM1": 0.05})
+    futures = [pool.submit("label0.png")]
+    while not pool.printers["COM1"].busy:
+        time.sleep(0.001)
+    futures += [pool.submit(f"label{i}.png") for i in range(1, 5)]
+    assert all(f.result(5)[0] for f in futures)
+    assert [len(paths) for _, paths in pool.engine.batches] == [1, 4]
+    pool.stop()
+
+
+def test_load_settles_after_concurrent_submits():
+    """Jobs submitted from many threads leave every printer's load at zero once done."""
+    pool = _pool({"COM1": 0.001, "COM2": 0.001})
+    futures, lock = [], threading.Lock()
+
+    def submit():
+        for i in range(25):
+            future = pool.submit(f"label{i}.png", copies=1 + i % 3)
+            with lock:
+                futures.append(future)
+
+    threads = [threading.Thread(target=submit) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert all(f.result(10)[0] for f in futures)
+    assert [p.load for p in pool.printers.values()] == [0, 0]
+    pool.stop()
+
+
+if __name__ == "__main__":
+    print("\n🍄 PRINTER POOL TEST\n")
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
+    print("\n✅ ALL TESTS PASSED\n")
@@ -0,0 +1,64 @@
+"""
+Checks for the printer registry's JSON store under concurrent writers, in a
+temporary directory.
+"""
+import json
+import os
+import tempfile
+import threading
+
+from printer_registry import PrinterRegistry
+
+
+def _registry() -> PrinterRegistry:
+    return PrinterRegistry(os.path.join(tempfile.mkdtemp(), "printers.json"))
+
+
+def test_concurrent_saves_keep_every_printer():
+    """Threads saving at once leave one valid file holding every change, and no temp files."""
+    registry = _registry()
+
+    def worker(n: int):
+        for i in range(20):
+            registry.remember(f"COM{n}", transport="serial", baudrate=115200)
+            registry.set_tuning(f"COM{n}", "serial", {"window_rows": i})
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert registry.last_error is None
+    assert os.listdir(registry.path.parent) == ["printers.json"]
+    data = json.loads(registry.path.read_text())
+    assert sorted(p["address"] for p in data) == sorted(f"COM{n}" for n in range(8))
+    reloaded = PrinterRegistry(registry.path)
+    for n in range(8):
+        assert reloaded.get(f"COM{n}").connects == 20
+        assert reloaded.get_tuning(f"COM{n}", "serial") == {"window_rows": 19}
+
+
+def test_failed_save_is_reported():
+    """A save that can't be written is recorded in last_error instead of raising."""
+    registry = PrinterRegistry(os.path.join(tempfile.mkdtemp(), "missing", "printers.json"))
+    registry.remember("AA:BB", transport="ble")
+    assert registry.last_error and "printers.json" in registry.last_error
+    assert registry.get("AA:BB") is not None   # still known for this run
+
+
+def test_unknown_fields_ignored_on_load():
+    """Entries written by a newer version (extra keys) still load."""
+    registry = _registry()
+    registry.path.write_text(json.dumps([{"address": "COM3", "transport": "serial", "future_field": 1},
+                                         {"name": "no address"}]))
+    registry.load()
+    assert [p.address for p in registry.all()] == ["COM3"]
+
+
+if __name__ == "__main__":
+    print("\n🍄 PRINTER REGISTRY TEST\n")
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
+    print("\n✅ ALL TESTS PASSED\n")
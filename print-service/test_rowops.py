@@ -0,0 +1,87 @@
+"""
+Checks for the bit-domain row operations against random packed bitmaps.
+Seeded, so every run sees the same rows.
+"""
+import random
+
+from rowops import (
+    compose_or, crop, flip_h, flip_v, from_1bit, invert, pad_center, rotate_180, shift, to_image,
+)
+
+WIDTH = 384
+
+
+def _rows(height: int, width: int = WIDTH, seed: int = 1):
+    rng = random.Random(seed)
+    n = (width + 7) // 8
+    pad = n * 8 - width
+    return [(rng.getrandbits(width) << pad).to_bytes(n, "big") for _ in range(height)]
+
+
+def _dot(rows, x: int, y: int) -> int:
+    return rows[y][x // 8] >> (7 - x % 8) & 1
+
+
+def test_flip_round_trips():
+    """Flipping twice (and rotating twice) gives the original back, at any width."""
+    for width in (384, 100, 13):
+        rows = _rows(20, width)
+        assert flip_h(flip_h(rows, width), width) == rows
+        assert flip_v(flip_v(rows)) == rows
+        assert rotate_180(rotate_180(rows, width), width) == rows
+        assert invert(invert(rows, width), width) == rows
+
+
+def test_flip_h_moves_dots():
+    rows = _rows(4, 100)
+    mirrored = flip_h(rows, 100)
+    for y in range(4):
+        for x in (0, 1, 50, 99):
+            assert _dot(mirrored, x, y) == _dot(rows, 99 - x, y)
+
+
+def test_pad_center_round_trip():
+    """A narrow bitmap lands in the middle; cropping it back out restores it."""
+    rows = _rows(10, 100)
+    padded = pad_center(rows, 100)
+    assert all(len(r) == 48 for r in padded)
+    back = pad_center(padded, WIDTH, 100)
+    assert back == rows
+    for y in range(10):
+        assert _dot(padded, 142, y) == _dot(rows, 0, y)
+        assert _dot(padded, 241, y) == _dot(rows, 99, y)
+        assert not any(_dot(padded, x, y) for x in (0, 141, 242, 383))
+
+
+def test_shift_round_trip():
+    """Shifting loses only the dots pushed off the edge."""
+    rows = _rows(12)
+    moved = shift(shift(rows, dx=5, dy=3), dx=-5, dy=-3)
+    assert moved == crop(rows, bottom=3, right=5) + [bytes(48)] * 3
+    assert shift(rows, dx=-7) == shift(crop(rows, left=7), dx=-7)
+    assert _dot(shift(rows, dx=10, dy=2), 30, 5) == _dot(rows, 20, 3)
+
+
+def test_compose_or():
+    """An overlay is ORed in at (x, y) and clipped at the edges."""
+    base = [bytes(48)] * 4
+    mark = [b"\xc0"] * 3   # 2-dot wide, 3 rows
+    out = compose_or(base, mark, x=382, y=2, overlay_width=2)
+    assert [_dot(out, 382, y) for y in range(4)] == [0, 0, 1, 1]
+    assert sum(bin(b).count("1") for r in out for b in r) == 4
+
+
+def test_pil_round_trip():
+    rows = _rows(8)
+    back, width, height = from_1bit(to_image(rows))
+    assert (width, height) == (WIDTH, 8)
+    assert invert(back) == rows
+
+
+if __name__ == "__main__":
+    print("\n🍄 ROW OPERATIONS TEST\n")
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
+    print("\n✅ ALL TESTS PASSED\n")
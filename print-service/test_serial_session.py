@@ -0,0 +1,158 @@
+"""
+Checks for the long-lived serial session: baud rate choice, the reader thread,
+windowed row sends and unplugging. pyserial's Serial is swapped for an
+in-memory port while each test runs, so no device is needed.
+"""
+import os
+import queue
+import tempfile
+from contextlib import contextmanager
+
+import serial
+
+import serial_session
+from flow_control import AdaptivePacer, FlowConfig, send_rows_serial
+from niimbot_protocol import CMD_PRINT_STATUS, FrameDecoder, make_packet
+from printer_registry import PrinterRegistry
+from serial_session import SerialConfig, SerialSession
+
+CONFIG = SerialConfig(probe_timeout_s=0.05, read_timeout_s=0.01, verbose=False)
+
+
+class FakeB1:
+    """Printer on the other end of the cable: answers at `baudrate` only (never if None)."""
+
+    def __init__(self, baudrate: int = None):
+        self.baudrate = baudrate
+        self.opened = []
+        self.rows = 0
+        self.unplugged = False
+
+
+class FakePort:
+    def __init__(self, printer: FakeB1, baudrate: int, **settings):
+        self.printer = printer
+        self.baudrate = baudrate
+        self.is_open = True
+        self.decoder = FrameDecoder()
+        self.replies: "queue.Queue[bytes]" = queue.Queue()
+        self.timeout = settings.get("timeout")
+        printer.opened.append(baudrate)
+
+    @property
+    def in_waiting(self) -> int:
+        return self.replies.qsize()
+
+    def read(self, size: int = 1) -> bytes:
+        if self.printer.unplugged:
+            raise serial.SerialException("device disconnected")
+        try:
+            return self.replies.get(timeout=self.timeout)
+        except queue.Empty:
+            return b""
+
+    def write(self, data: bytes):
+        if self.printer.unplugged:
+            raise serial.SerialException("device disconnected")
+        for frame in self.decoder.feed(data):
+            if frame.command == 0x85:
+                self.printer.rows += 1
+            elif self.baudrate != self.printer.baudrate:
+                continue   # garbled at the wrong rate
+            elif frame.command == 0xDC:
+                self.replies.put(make_packet(0xDD, bytes(8) + bytes([0, 3])))
+            elif frame.command == CMD_PRINT_STATUS:
+                self.replies.put(make_packet(0xB3, bytes([0, 0, 0, 0])))
+
+    def reset_input_buffer(self):
+        pass
+
+    def reset_output_buffer(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+
+@contextmanager
+def _cable(printer: FakeB1):
+    real = serial_session.serial.Serial
+    serial_session.serial.Serial = lambda port, baudrate, **settings: FakePort(printer, baudrate, **settings)
+    try:
+        yield
+    finally:
+        serial_session.serial.Serial = real
+
+
+def _registry() -> PrinterRegistry:
+    return PrinterRegistry(os.path.join(tempfile.mkdtemp(), "printers.json"))
+
+
+def _row() -> bytes:
+    return make_packet(0x85, bytes([0, 0, 10, 10, 10, 1]) + bytes(48))
+
+
+def test_open_finds_and_remembers_baud_rate():
+    """The rate the printer answers at is found once and tried first next time."""
+    printer, registry = FakeB1(9600), _registry()
+    with _cable(printer):
+        session = SerialSession("COM9", CONFIG, registry)
+        assert session.open()
+        assert session.baudrate == 9600 and printer.opened == [115200, 9600]
+        assert registry.get("COM9").baudrate == 9600
+        session.close()
+        printer.opened.clear()
+        assert SerialSession("COM9", CONFIG, registry).open()
+        assert printer.opened == [9600]
+
+
+def test_open_silent_printer():
+    """Nobody answers: the port still opens at the first rate, unverified."""
+    printer = FakeB1(None)
+    with _cable(printer):
+        session = SerialSession("COM9", CONFIG, _registry())
+        assert not session.open()
+        assert session.is_open and not session.verified
+        assert session.baudrate == 115200
+        session.close()
+
+
+def test_rows_sent_in_windows():
+    """send_rows_serial over a real session: every row arrives, one write per window."""
+    printer = FakeB1(115200)
+    with _cable(printer):
+        session = SerialSession("COM9", CONFIG, _registry())
+        session.open()
+        writes = session.stats.writes
+        stats = send_rows_serial(session, [_row()] * 300, FlowConfig(window_rows=32), pacer=AdaptivePacer(32))
+        assert printer.rows == 300
+        assert stats.acks > 0 and stats.misses == 0
+        assert session.stats.writes - writes < 300 // 8
+        session.close()
+
+
+def test_unplug_closes_session():
+    """A port that disappears closes the session; writes then fail with the reason."""
+    printer = FakeB1(115200)
+    with _cable(printer):
+        session = SerialSession("COM9", CONFIG, _registry())
+        session.open()
+        printer.unplugged = True
+        session._reader.join(1.0)
+        assert not session.is_open
+        try:
+            session.write(_row())
+        except serial.SerialException as e:
+            assert "device disconnected" in str(e)
+        else:
+            assert False, "write on an unplugged port succeeded"
+        session.close()
+
+
+if __name__ == "__main__":
+    print("\n🍄 SERIAL SESSION TEST\n")
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
+    print("\n✅ ALL TESTS PASSED\n")
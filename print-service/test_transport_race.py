@@ -0,0 +1,118 @@
+"""
+Checks for the transport race with fake links: serial ports held open by a
+stand-in session (so only the heartbeat is probed) and a stand-in BLE session.
+"""
+import asyncio
+import os
+import tempfile
+import time
+
+import serial_session
+from niimbot_protocol import ResponseDispatcher, make_packet
+from printer_registry import PrinterRegistry
+from transport_race import RaceConfig, TransportRace
+
+CONFIG = RaceConfig(serial_timeout_s=0.5, ble_timeout_s=0.5, head_start_s=0.2)
+
+
+class FakePort:
+    def __init__(self, device: str):
+        self.device = device
+
+
+class FakePorts:
+    """PortRegistry stand-in: fixed candidates, records what the race reports."""
+
+    def __init__(self, *devices: str):
+        self.devices = devices
+        self.successes = []
+        self.failures = []
+
+    def candidates(self, min_score: int = 0):
+        return [FakePort(d) for d in self.devices]
+
+    def report_success(self, device: str):
+        self.successes.append(device)
+
+    def report_failure(self, device: str):
+        self.failures.append(device)
+
+
+class FakeOpenPort:
+    """An already open SerialSession: ping() answers after `delay_s` (or not at all)."""
+
+    is_open = True
+
+    def __init__(self, delay_s: float, answers: bool = True):
+        self.delay_s = delay_s
+        self.answers = answers
+
+    def ping(self, timeout_s: float) -> bool:
+        time.sleep(min(self.delay_s, timeout_s))
+        return self.answers and self.delay_s <= timeout_s
+
+
+class FakeBleSession:
+    """B1Session stand-in: connects at once, answers a heartbeat after `delay_s`."""
+
+    address = "AA:BB"
+
+    def __init__(self, delay_s: float):
+        self.delay_s = delay_s
+        self.rx = ResponseDispatcher()
+
+    async def ensure_connected(self):
+        pass
+
+    async def write(self, packet: bytes):
+        reply = make_packet(0xDD, bytes(8) + bytes([0, 3]))
+        asyncio.get_running_loop().call_later(self.delay_s, self.rx.feed, reply)
+
+
+def _race(ports: dict, ble: FakeBleSession = None, registry: PrinterRegistry = None):
+    for device, port in ports.items():
+        serial_session._sessions[device] = port
+    registry = registry or PrinterRegistry(os.path.join(tempfile.mkdtemp(), "printers.json"))
+    fake_ports = FakePorts(*ports)
+    race = TransportRace(registry, fake_ports, ble, CONFIG)
+    try:
+        return race, fake_ports, asyncio.run(race.run())
+    finally:
+        for device in ports:
+            serial_session._sessions.pop(device, None)
+
+
+def test_first_healthy_link_wins():
+    race, ports, choice = _race({"COM5": FakeOpenPort(0.01), "COM6": FakeOpenPort(0.2)}, FakeBleSession(0.1))
+    assert (choice.transport, choice.address) == ("serial", "COM5")
+    assert ports.successes == ["COM5"] and ports.failures == []
+
+
+def test_ble_wins_over_silent_ports():
+    race, ports, choice = _race({"COM5": FakeOpenPort(0.01, answers=False)}, FakeBleSession(0.02))
+    assert (choice.transport, choice.address) == ("ble", "AA:BB")
+    assert race.last_errors == {"serial:COM5": "no reply"}
+
+
+def test_nothing_answers():
+    """No link: None, and the silent ports are reported so they are skipped for a while."""
+    race, ports, choice = _race({"COM5": FakeOpenPort(0.01, answers=False), "COM6": FakeOpenPort(1.0)})
+    assert choice is None
+    assert sorted(ports.failures) == ["COM5", "COM6"]
+
+
+def test_last_winner_gets_head_start():
+    """The link that won last time is probed alone first, so a slightly faster newcomer doesn't steal it."""
+    registry = PrinterRegistry(os.path.join(tempfile.mkdtemp(), "printers.json"))
+    registry.remember("COM6", transport="serial")
+    race, ports, choice = _race({"COM5": FakeOpenPort(0.01), "COM6": FakeOpenPort(0.1)}, registry=registry)
+    assert choice.address == "COM6"
+
+
+if __name__ == "__main__":
+    print("\n🍄 TRANSPORT RACE TEST\n")
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
+    print("\n✅ ALL TESTS PASSED\n")
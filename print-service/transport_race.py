@@ -0,0 +1,168 @@
+"""
+Pick the printer link by racing all transports at once.
+
+The old fallback chain tried the detected COM port, COM4, COM3, USB and then
+BLE one after another with 40-60 s timeouts each, so a printer that was off kept
+a request hanging for minutes. Here every candidate gets a short handshake
+(open/connect + heartbeat 0xDC, answered by any valid NIIMBOT frame), all of
+them concurrently:
+
+- serial: every USB-serial port port_registry knows, probed in worker threads
+  through its SerialSession (on this tree "USB" is the same CDC serial link, so
+  it is covered here); a port that is already open only needs the heartbeat
+- BLE: the persistent B1Session (instant when it is already connected)
+
+The first healthy link wins and the other probes are cancelled. The winner is
+remembered in the printer registry and gets a short head start next time, so a
+printer that hasn't moved is normally found without opening anything else.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from ble_session import B1Session
+from niimbot_protocol import CMD_HEARTBEAT, Heartbeat, make_packet
+from port_registry import SCORE_USB_SERIAL, PortRegistry
+from printer_registry import PrinterRegistry
+from serial_session import get_serial_session
+
+HEARTBEAT = make_packet(CMD_HEARTBEAT, b"\x01")
+
+
+@dataclass
+class RaceConfig:
+    serial_timeout_s: float = 2.0     # heartbeat reply on an open port (opening tries each baud rate)
+    ble_timeout_s: float = 5.0        # (re)connect + heartbeat reply
+    head_start_s: float = 0.3         # last winner probes alone this long first
+    max_serial_ports: int = 4
+
+
+@dataclass(frozen=True)
+class LinkChoice:
+    transport: str     # "serial" / "ble"
+    address: str       # port / BLE address
+    probe_s: float     # time to a healthy handshake
+
+
+# -----------------------------
+# Probes
+# -----------------------------
+
+def _probe_serial_blocking(port: str, timeout_s: float) -> bool:
+    # Goes through the shared session: a port we already hold open just gets a
+    # heartbeat, and a port that doesn't answer is released again
+    session = get_serial_session(port)
+    if session.is_open:
+        return session.ping(timeout_s)
+    if session.open():
+        return True
+    session.close()
+    return False
+
+
+async def probe_serial(port: str, config: RaceConfig) -> bool:
+    # The blocking open/ping runs in a thread; if this probe loses or times out
+    # the thread just finishes its (short) baud probing there
+    loop = asyncio.get_running_loop()
+    probe = loop.run_in_executor(None, _probe_serial_blocking, port, config.serial_timeout_s)
+    try:
+        return await asyncio.wait_for(probe, config.serial_timeout_s)
+    except asyncio.TimeoutError:
+        return False
+
+
+async def probe_ble(session: B1Session, config: RaceConfig) -> bool:
+    async def handshake() -> bool:
+        await session.ensure_connected()
+        reply = session.rx.expect(Heartbeat)
+        await session.write(HEARTBEAT)
+        await reply
+        return True
+    try:
+        return await asyncio.wait_for(handshake(), config.ble_timeout_s)
+    except asyncio.TimeoutError:
+        return False
+
+
+# -----------------------------
+# Race
+# -----------------------------
+
+class TransportRace:
+    def __init__(self, registry: PrinterRegistry, ports: PortRegistry, session: Optional[B1Session],
+                 config: Optional[RaceConfig] = None):
+        self.registry = registry
+        self.ports = ports
+        self.session = session
+        self.config = config or RaceConfig()
+        self.last_errors: Dict[str, str] = {}
+
+    def _serial_ports(self) -> List[str]:
+        ports = self.ports.candidates(min_score=SCORE_USB_SERIAL)
+        return [p.device for p in ports[:self.config.max_serial_ports]]
+
+    def _preferred(self) -> Optional[str]:
+        """Key of the link that won last time ("serial:COM3" / "ble")."""
+        for known in self.registry.all():
+            if known.transport == "serial" and known.address in self._serial_ports():
+                return f"serial:{known.address}"
+            if known.transport == "ble":
+                return "ble"
+        return None
+
+    async def run(self, *, serial_enabled: bool = True, ble_enabled: bool = True) -> Optional[LinkChoice]:
+        """Probe everything concurrently; first healthy link wins, the rest are cancelled."""
+        cfg = self.config
+        t0 = time.monotonic()
+        probes = {}
+        if serial_enabled:
+            for port in self._serial_ports():
+                probes[f"serial:{port}"] = lambda port=port: probe_serial(port, cfg)
+        if ble_enabled and self.session is not None:
+            probes["ble"] = lambda: probe_ble(self.session, cfg)
+        if not probes:
+            return None
+
+        preferred = self._preferred()
+
+        async def delayed(key: str):
+            if preferred in probes and key != preferred:
+                await asyncio.sleep(cfg.head_start_s)
+            return await probes[key]()
+
+        tasks = {asyncio.create_task(delayed(key)): key for key in probes}
+        self.last_errors = {}
+        winner: Optional[str] = None
+        try:
+            pending = set(tasks)
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    key = tasks[task]
+                    if task.exception() is not None:
+                        self.last_errors[key] = f"{type(task.exception()).__name__}: {task.exception()}"
+                    elif task.result():
+                        winner = winner or key
+                    else:
+                        self.last_errors[key] = "no reply"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        if winner is None:
+            for key in self.last_errors:
+                if key.startswith("serial:"):
+                    self.ports.report_failure(key.split(":", 1)[1])
+            return None
+
+        elapsed = time.monotonic() - t0
+        if winner == "ble":
+            choice = LinkChoice("ble", self.session.address or "", elapsed)
+        else:
+            port = winner.split(":", 1)[1]
+            self.ports.report_success(port)  # also marks it most recent in the registry
+            choice = LinkChoice("serial", port, elapsed)
+        print(f"🏁 Link: {choice.transport} {choice.address} (healthy in {elapsed:.2f}s)")
+        return choice
@@ -1,7 +1,9 @@
 import asyncio
-from bleak import BleakScanner, BleakClient
+from bleak import BleakClient
+from printer_registry import find_printer
 from PIL import Image
 import struct
+from halftone import pack_rows, threshold, to_canvas
 
 # Try the alternative service (Serial over BLE)
 # This one has separate write and notify characteristics
@@ -25,32 +27,15 @@ def image_to_rows(image_path: str, width: int = 384):
     ratio = width / img.width
     new_height = int(img.height * ratio)
     img = img.resize((width, new_height), Image.Resampling.LANCZOS)
-    img = img.point(lambda x: 0 if x < 128 else 255, '1')
-    
-    rows = []
-    pixels = list(img.getdata())
-    for row in range(img.height):
-        row_bytes = []
-        for col_byte in range(img.width // 8):
-            byte_val = 0
-            for bit in range(8):
-                pixel_idx = row * img.width + col_byte * 8 + bit
-                if pixels[pixel_idx] == 0:
-                    byte_val |= (1 << (7 - bit))
-            row_bytes.append(byte_val)
-        rows.append(bytes(row_bytes))
+    # Vectorized threshold + packbits instead of a per-pixel lambda/bit loop
+    rows = pack_rows(threshold(to_canvas(img, width=width)))
     return rows, img.height
 
 async def print_via_serial(image_path: str):
     print("=== TRYING SERIAL SERVICE ===")
     print("Scanning...")
     
-    devices = await BleakScanner.discover(timeout=5.0)
-    target = None
-    for d in devices:
-        if d.name and "B1" in d.name:
-            target = d
-            break
+    target = await find_printer("B1")
     
     if not target:
         print("❌ B1 not found!")